@@ -7,7 +7,10 @@ from pathlib import Path
 from typing import Any
 import datetime
 import asyncio
+import functools
 import math
+import re
+import time
 import dateutil.parser
 
 from telegram import Update, InputFile
@@ -18,11 +21,68 @@ from db import models
 
 logger = logging.getLogger(__name__)
 
+# Reply templates for /transfer_stock
+_TRANSFERRED = "Transferred {qty} {item} from you to {to}."
+_RECEIVED = "📦 You have received {qty} {item} from admin {frm}."
+
+# First integer in a Notes cell (registration count fallback)
+_FIRST_NUMBER_RE = re.compile(r"(\d+)")
+
+# item_code spellings (lowercased) counted as a SIM sale
+_SIM_CODES = frozenset(("sim", "simcard", "sim_card"))
+
+
+class TelegramRateLimiter:
+    """Token bucket pacing outgoing sends below Telegram's ~30 msg/s bot limit.
+
+    Use as ``async with limiter: await bot.send_message(...)``.
+    """
+
+    def __init__(self, rps: float = 25) -> None:
+        self._rate = float(rps)
+        self._tokens = float(rps)
+        self._refill_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._rate, self._tokens + (now - self._refill_at) * self._rate)
+                self._refill_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+    async def __aenter__(self) -> "TelegramRateLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+
+# shared by every broadcast loop so concurrent broadcasts respect one budget
+_BROADCAST_LIMITER = TelegramRateLimiter(rps=25)
+
+
+def _caller_username(update: Update, context: ContextTypes.DEFAULT_TYPE, refresh: bool = False) -> str:
+    """Return the caller's username (numeric id as fallback), cached in user_data.
+
+    /start and /register_me pass ``refresh=True`` so a renamed user is picked up.
+    """
+    uname = None if refresh else context.user_data.get("uname")
+    if uname is None:
+        user = update.effective_user
+        uname = context.user_data["uname"] = user.username or str(user.id)
+    return uname
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Capture chat_id for notifications
     db_path = os.getenv("DB_PATH", "teleshop.db")
-    username = update.effective_user.username or str(update.effective_user.id)
+    username = _caller_username(update, context, refresh=True)
     chat_id = update.effective_chat.id
     try:
         await models.ensure_staff(db_path, username, update.effective_user.full_name)
@@ -36,7 +96,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def register_me(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """User-initiated storing of chat_id for reliable notifications."""
     db_path = os.getenv("DB_PATH", "teleshop.db")
-    username = update.effective_user.username or str(update.effective_user.id)
+    username = _caller_username(update, context, refresh=True)
     chat_id = update.effective_chat.id
     ok = False
     try:
@@ -93,7 +153,7 @@ async def missing_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def help_cmd(update, context):
     """Show available commands based on user's permissions."""
     db_path = os.getenv("DB_PATH", "teleshop.db")
-    username = update.effective_user.username or str(update.effective_user.id)
+    username = _caller_username(update, context)
     # Check admin status combining DB flag and env var
     is_admin_db = await models.is_admin_by_username(db_path, username)
     admin_ids = os.getenv("ADMIN_IDS", "")
@@ -176,7 +236,7 @@ async def help_cmd(update, context):
 
 async def summary(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
-    username = update.effective_user.username or str(update.effective_user.id)
+    username = _caller_username(update, context)
     staff_id = await models.ensure_staff(db_path, username, update.effective_user.full_name)
     inv = await models.get_inventory(db_path, staff_id)
     text = (
@@ -188,7 +248,7 @@ async def summary(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def my_stock(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
-    username = update.effective_user.username or str(update.effective_user.id)
+    username = _caller_username(update, context)
     info = await models.view_stock_by_staff(db_path, username)
     if not info:
         await update.message.reply_text("No inventory found for you. Please contact admin.")
@@ -198,7 +258,7 @@ async def my_stock(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def my_sales(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
-    username = update.effective_user.username or str(update.effective_user.id)
+    username = _caller_username(update, context)
     date = None
     if context.args:
         date = context.args[0]
@@ -232,14 +292,14 @@ def _summarize_entries(entries: list[dict]) -> dict:
     for e in entries:
         code = (e.get("item_code") or "").lower()
         # For SIM/SWAP, count 1 per valid GSM row (do NOT sum the 'number' field)
-        if code in ("sim", "simcard", "sim_card"):
+        if code in _SIM_CODES:
             if _is_valid_gsm(e.get("gsm_number") or e.get("number")):
                 res["SIM"] += 1
             else:
                 # If no gsm present but row otherwise valid, still count as 1
                 res["SIM"] += 1
             continue
-        if code in ("swap",):
+        if code == "swap":
             if _is_valid_gsm(e.get("gsm_number") or e.get("number")):
                 res["SWAP"] += 1
             else:
@@ -275,7 +335,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     db_path = os.getenv("DB_PATH", "teleshop.db")
 
     # ---------------- Step 0: get username, name and date ----------------
-    username = update.effective_user.username or str(update.effective_user.id)
+    username = _caller_username(update, context)
     name = update.effective_user.full_name or username
     
     # Check if this is a missing_upload with custom date
@@ -299,8 +359,8 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     try:
         b = await file.download_as_bytearray()
         logger.info(f"Downloaded file {doc.file_name} ({len(b)} bytes) for user {username}")
-    except Exception as ex:
-        logger.exception("Failed to download uploaded document: %s", ex)
+    except Exception:
+        logger.exception("Failed to download uploaded document")
         await update.message.reply_text("Failed to download file. Try again.")
         return
 
@@ -314,7 +374,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             target = pending_send.get("target")  # may be None for broadcast
             # Basic safety: only admins should be able to set this flag, check again
             db_path = os.getenv("DB_PATH", "teleshop.db")
-            is_admin_db = await models.is_admin_by_username(db_path, update.effective_user.username or str(update.effective_user.id))
+            is_admin_db = await models.is_admin_by_username(db_path, _caller_username(update, context))
             admin_ids = os.getenv("ADMIN_IDS", "")
             admin_list = [a.strip() for a in admin_ids.split(",") if a.strip()]
             is_admin_env = str(update.effective_user.id) in admin_list
@@ -353,10 +413,9 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 failed = 0
                 for cid in chat_ids:
                     try:
-                        await context.bot.send_document(chat_id=int(cid), document=_InputFile(bytes(b), filename=doc.file_name or 'file'))
+                        async with _BROADCAST_LIMITER:
+                            await context.bot.send_document(chat_id=int(cid), document=_InputFile(bytes(b), filename=doc.file_name or 'file'))
                         sent += 1
-                        # small throttle to avoid hitting rate limits
-                        await asyncio.sleep(0.05)
                     except Exception:
                         failed += 1
                         logger.exception("Broadcast send failed for chat_id=%s", cid)
@@ -385,7 +444,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 await update.message.reply_text(f"⚠️ Employee not found or not linked to Telegram: {pending_target}. Upload cancelled.")
                 return
             # override the uploader username so subsequent logic treats file as uploaded by the target
-            admin_initiator = update.effective_user.username or str(update.effective_user.id)
+            admin_initiator = _caller_username(update, context)
             username = pending_target
             name = staff.get('name') or username
             # record flag so we can notify the employee after processing
@@ -415,8 +474,8 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         with open(file_path, "wb") as f:
             f.write(b)
         logger.info(f"Saved uploaded file to {file_path}")
-    except Exception as ex:
-        logger.exception("Failed to save uploaded file to disk: %s", ex)
+    except Exception:
+        logger.exception("Failed to save uploaded file to disk")
         await update.message.reply_text("Failed to save uploaded file. Try again.")
         return
 
@@ -433,8 +492,8 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             from utils.excel_utils import parse_pickup_excel
             try:
                 rows = await asyncio.to_thread(parse_pickup_excel, bytes(b))
-            except Exception as ex:
-                logger.exception("Failed parsing pickup Excel: %s", ex)
+            except Exception:
+                logger.exception("Failed parsing pickup Excel")
                 await update.message.reply_text("Failed to parse pickup Excel. Ensure it contains Carton #, BOX #, GSM NUMBER, ICCID, Type columns.")
                 # clear the awaiting flag to avoid repeated misrouting
                 context.user_data.pop("awaiting_pickup", None)
@@ -446,10 +505,10 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # call DB helper (preserve existing insert_pickup_list behavior)
             try:
                 filename = f"pickup_{username}_{report_date}.xlsx"
-                res = await models.insert_pickup_list(db_path, bytes(b), filename, username)
+                res = await models.insert_pickup_list(db_path, bytes(b), filename, username, rows=rows)
                 await update.message.reply_text(f"Pickup Excel processed: {res.get('inserted')} inserted, {res.get('duplicates')} duplicates")
-            except Exception as ex:
-                logger.exception("import_pickup failed: %s", ex)
+            except Exception:
+                logger.exception("import_pickup failed")
                 await update.message.reply_text("Import failed due to internal error.")
             finally:
                 # clear awaiting flag after handling
@@ -475,8 +534,8 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # unexpected non-tuple result
             raise ValueError("parse_sales_excel returned unexpected non-tuple result")
         logger.info(f"Parsed Excel: {len(entries)} entries, errors={errors}, daily_regs={daily_regs}")
-    except Exception as ex:
-        logger.exception("Failed parsing Excel: %s", ex)
+    except Exception:
+        logger.exception("Failed parsing Excel")
         await update.message.reply_text("Failed to parse Excel file. Ensure it is a valid spreadsheet.")
         return
     if errors:
@@ -513,8 +572,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             if low.startswith("reg:"):
                 try:
                     # find first integer in the original notes string
-                    import re as _re
-                    m = _re.search(r"(\d+)", notes)
+                    m = _FIRST_NUMBER_RE.search(notes)
                     if m:
                         daily_regs = int(m.group(1))
                         break
@@ -522,8 +580,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     pass
             # fallback: extract any integer in the notes
             try:
-                import re as _re
-                m = _re.search(r"(\d+)", notes)
+                m = _FIRST_NUMBER_RE.search(notes)
                 if m:
                     val = int(m.group(1))
                     if 0 < val < 1000:
@@ -565,7 +622,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     if s.isdigit() and len(s) >= 6:
                         identifier = s
 
-                if identifier and item_code in ("sim", "simcard", "sim_card"):
+                if identifier and item_code in _SIM_CODES:
                     if identifier in seen_identifiers:
                         parse_duplicates_skipped += 1
                         parse_duplicates_list.append(identifier)
@@ -589,7 +646,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         for e in entries:
             try:
                 item_code = (e.get("item_code") or "").lower()
-                if item_code not in ("sim", "simcard", "sim_card"):
+                if item_code not in _SIM_CODES:
                     continue
                 gsm = e.get("gsm_number") or e.get("GSM") or None
                 store_number = None
@@ -624,7 +681,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             for e in entries:
                 try:
                     item_code = (e.get("item_code") or "").lower()
-                    if item_code not in ("sim", "simcard", "sim_card"):
+                    if item_code not in _SIM_CODES:
                         filtered.append(e)
                         continue
                     gsm = e.get("gsm_number") or e.get("GSM") or None
@@ -682,8 +739,8 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 logger.warning(f"Failed to rename uploaded file {file_path} to {new_path}: {rn_ex}")
         except Exception:
             logger.exception("Failed to compute employee name for uploaded file rename")
-    except Exception as ex:
-        logger.exception("Failed to ensure staff in DB: %s", ex)
+    except Exception:
+        logger.exception("Failed to ensure staff in DB")
         await update.message.reply_text("Internal error: could not register user. Try again later.")
         return
     # delete previous daily_regs for this staff/date (last-upload-wins)
@@ -783,21 +840,21 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             all_rows = await models.get_all_sales_by_date(db_path, report_date)
             shop_aggregates = {}
             for r in all_rows:
-                uname = r.get('username')
+                uname = r['username']
                 shop_id = staff_shop_map.get(uname) or 0
-                code = (r.get('item_code') or '').lower()
+                code = (r['item_code'] or '').lower()
                 if shop_id not in shop_aggregates:
                     shop_aggregates[shop_id] = {'SIM': 0, 'SWAP': 0, 'Credit50': 0, 'Credit100': 0, 'Recharge': 0.0}
-                if code in ('sim', 'simcard', 'sim_card'):
+                if code in _SIM_CODES:
                     shop_aggregates[shop_id]['SIM'] += 1
                 elif code == 'swap':
                     shop_aggregates[shop_id]['SWAP'] += 1
                 elif code in ('credit50', 'credit_50', 'credit-50'):
                     # credit rows store count in number
-                    shop_aggregates[shop_id]['Credit50'] += int(r.get('number') or 0)
+                    shop_aggregates[shop_id]['Credit50'] += int(r['number'] or 0)
                 elif code in ('credit100', 'credit_100', 'credit-100'):
-                    shop_aggregates[shop_id]['Credit100'] += int(r.get('number') or 0)
-                shop_aggregates[shop_id]['Recharge'] += float(r.get('recharge_amount') or 0.0)
+                    shop_aggregates[shop_id]['Credit100'] += int(r['number'] or 0)
+                shop_aggregates[shop_id]['Recharge'] += float(r['recharge_amount'] or 0.0)
 
             # persist per-shop totals and grand total
             grand_total_amount = 0.0
@@ -815,8 +872,8 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 logger.exception("Failed to persist grand daily total for %s", report_date)
         except Exception:
             logger.exception("Failed computing/persisting per-shop daily totals (non-fatal)")
-    except Exception as ex:
-        logger.exception("Failed inserting sales/updating inventory: %s", ex)
+    except Exception:
+        logger.exception("Failed inserting sales/updating inventory")
         await update.message.reply_text("Internal error: failed to save sales. Some rows may not be recorded.")
         return
 
@@ -834,7 +891,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         s = {"SIM": 0, "SWAP": 0, "Credit50": 0, "Credit100": 0, "Recharge": 0.0}
         for r in saved_rows:
             code = (r.get('item_code') or '').lower()
-            if code in ('sim', 'simcard', 'sim_card'):
+            if code in _SIM_CODES:
                 s['SIM'] += 1
             elif code == 'swap':
                 s['SWAP'] += 1
@@ -952,13 +1009,13 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         else:
             admin_chat_ids = await models.get_all_admin_chat_ids(db_path)
             for cid in admin_chat_ids:
-                await send_message_safe(context.bot, cid, admin_text)
+                async with _BROADCAST_LIMITER:
+                    await send_message_safe(context.bot, cid, admin_text)
                 # also send the uploaded file to each admin chat id where possible
                 try:
                     from telegram import InputFile
-                    await context.bot.send_document(chat_id=int(cid), document=InputFile(str(file_path), filename=file_path.name))
-                    # small throttle
-                    await asyncio.sleep(0.05)
+                    async with _BROADCAST_LIMITER:
+                        await context.bot.send_document(chat_id=int(cid), document=InputFile(str(file_path), filename=file_path.name))
                 except Exception:
                     logger.exception("Failed to send uploaded file to admin chat_id=%s", cid)
     except Exception:
@@ -993,9 +1050,10 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 def _require_admin(fn):
+    @functools.wraps(fn)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         db_path = os.getenv("DB_PATH", "teleshop.db")
-        username = update.effective_user.username or str(update.effective_user.id)
+        username = _caller_username(update, context)
         # check DB flag
         is_db_admin = await models.is_admin_by_username(db_path, username)
         # check env admin ids list
@@ -1009,6 +1067,7 @@ def _require_admin(fn):
     return wrapper
 
 
+@_require_admin
 async def add_stock_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     if len(context.args) < 3:
@@ -1023,6 +1082,7 @@ async def add_stock_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     await update.message.reply_text(f"Added {qty} {item} to {staff_username}.")
 
 
+@_require_admin
 async def remove_stock_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     if len(context.args) < 3:
@@ -1037,6 +1097,7 @@ async def remove_stock_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     await update.message.reply_text(f"Removed {qty} {item} from {staff_username}.")
 
 
+@_require_admin
 async def view_stock_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     if len(context.args) < 1:
@@ -1050,6 +1111,7 @@ async def view_stock_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.message.reply_text(f"{staff_username} — SIM {info['sim']} | SWAP {info['swap']} | Credit50 {info['credit_50']} | Credit100 {info['credit_100']}")
 
 
+@_require_admin
 async def list_inventory_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     rows = await models.list_inventory(db_path)
@@ -1089,13 +1151,13 @@ async def list_inventory_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     lines = ["📦 Current Inventories:", top, header, sep]
     for r in rows:
-        name_raw = r.get('name') or r.get('username') or ''
+        name_raw = r['name'] or r['username'] or ''
         short = _first_name(name_raw)
         short = _truncate(short, name_w)
-        sim = str(r.get('sim', 0))
-        swap = str(r.get('swap', 0))
-        c50 = str(r.get('credit_50', 0))
-        c100 = str(r.get('credit_100', 0))
+        sim = str(r['sim'])
+        swap = str(r['swap'])
+        c50 = str(r['credit_50'])
+        c100 = str(r['credit_100'])
         line = (
             f"║ {short.ljust(name_w)} ║ {sim.rjust(sim_w)} ║ {swap.rjust(swap_w)} ║ {c50.rjust(c50_w)} ║ {c100.rjust(c100_w)} ║"
         )
@@ -1104,6 +1166,7 @@ async def list_inventory_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await update.message.reply_text("\n".join(lines))
 
 
+@_require_admin
 async def msg_user_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Admin command: /msg_user <username> <message>"""
     db_path = os.getenv("DB_PATH", "teleshop.db")
@@ -1127,6 +1190,7 @@ async def msg_user_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text("Internal error while sending message.")
 
 
+@_require_admin
 async def msg_all_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Admin command: /msg_all <message>"""
     db_path = os.getenv("DB_PATH", "teleshop.db")
@@ -1139,17 +1203,21 @@ async def msg_all_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         if not chat_ids:
             await update.message.reply_text("No staff have chat_id registered.")
             return
-        sent = 0
-        for cid in chat_ids:
-            ok = await send_message_safe(context.bot, cid, message)
-            if ok:
-                sent += 1
+
+        async def _send(cid) -> bool:
+            async with _BROADCAST_LIMITER:
+                return await send_message_safe(context.bot, cid, message)
+
+        # sends run concurrently; the shared limiter paces them
+        results = await asyncio.gather(*(_send(cid) for cid in chat_ids))
+        sent = sum(1 for ok in results if ok)
         await update.message.reply_text(f"Message broadcast to {sent} users.")
     except Exception:
         logger.exception("msg_all failed")
         await update.message.reply_text("Internal error while broadcasting message.")
 
 
+@_require_admin
 async def delete_sale_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     # Support two modes:
@@ -1213,6 +1281,7 @@ async def delete_sale_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.message.reply_text(f"Sale {sale_id} deleted. Inventory for {sale.get('username')} adjusted.")
 
 
+@_require_admin
 async def weekly_regs_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Admin: aggregate daily registrations between two dates (or show all). Usage: /weekly_regs [start_date] [end_date]"""
     db_path = os.getenv("DB_PATH", "teleshop.db")
@@ -1232,13 +1301,14 @@ async def weekly_regs_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return
         lines = [f"Registrations {start_date} → {end_date}:"]
         for r in rows:
-            lines.append(f"{r.get('username')} ({r.get('name')}): {r.get('total_regs')}")
+            lines.append(f"{r['username']} ({r['name']}): {r['total_regs']}")
         await update.message.reply_text("\n".join(lines))
     except Exception:
         logger.exception("weekly_regs failed")
         await update.message.reply_text("Internal error while computing weekly regs.")
 
 
+@_require_admin
 async def borrow_add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Admin: /borrow_add <name> <amount> <note>"""
     db_path = os.getenv("DB_PATH", "teleshop.db")
@@ -1264,6 +1334,7 @@ async def borrow_add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text("Internal error while recording transaction.")
 
 
+@_require_admin
 async def borrow_list_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     admin_id = update.effective_user.id
@@ -1274,13 +1345,14 @@ async def borrow_list_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return
         lines = [f"Your transactions (most recent first):"]
         for r in rows:
-            lines.append(f"{r.get('date')}: {r.get('person_name')} {r.get('amount')} — {r.get('note')}")
+            lines.append(f"{r['date']}: {r['person_name']} {r['amount']} — {r['note']}")
         await update.message.reply_text("\n".join(lines))
     except Exception:
         logger.exception("borrow_list failed")
         await update.message.reply_text("Internal error while fetching transactions.")
 
 
+@_require_admin
 async def borrow_summary_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     admin_id = update.effective_user.id
@@ -1299,9 +1371,9 @@ async def borrow_summary_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
         lines = ["Summary by person:"]
         total = 0.0
         for r in rows:
-            amt = float(r.get('total') or 0)
+            amt = float(r['total'] or 0)
             total += amt
-            lines.append(f"{r.get('person_name')}: {amt}")
+            lines.append(f"{r['person_name']}: {amt}")
         lines.append(f"Grand total: {total}")
         await update.message.reply_text("\n".join(lines))
     except Exception:
@@ -1309,6 +1381,7 @@ async def borrow_summary_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("Internal error while computing summary.")
 
 
+@_require_admin
 async def backoffice_add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     if len(context.args) < 2:
@@ -1331,6 +1404,7 @@ async def backoffice_add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("Internal error while adding backoffice stock.")
 
 
+@_require_admin
 async def backoffice_list_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     try:
@@ -1338,7 +1412,7 @@ async def backoffice_list_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE
         if not rows:
             await update.message.reply_text("No backoffice stock items.")
             return
-        lines = [f"{r['item']}: {r['quantity']}" for r in rows]
+        lines = [f"{r.item}: {r.quantity}" for r in rows]
         await update.message.reply_text("\n".join(lines))
     except Exception:
         logger.exception("backoffice_list failed")
@@ -1366,8 +1440,7 @@ async def handle_pickup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         filename = f"pickup_{update.effective_user.username}_{datetime.date.today().isoformat()}.xlsx"
         file_path = upload_dir / filename
         try:
-            with open(file_path, "wb") as f:
-                f.write(b)
+            await _asyncio.to_thread(file_path.write_bytes, bytes(b))
         except Exception:
             await update.message.reply_text("Failed to save file on server.")
             return
@@ -1375,18 +1448,18 @@ async def handle_pickup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         from utils.excel_utils import parse_pickup_excel
         try:
             rows = await _asyncio.to_thread(parse_pickup_excel, bytes(b))
-        except Exception as ex:
-            logger.exception("Failed to parse pickup Excel: %s", ex)
+        except Exception:
+            logger.exception("Failed to parse pickup Excel")
             await update.message.reply_text("Failed to parse pickup Excel. Ensure it contains Carton #, BOX #, GSM NUMBER, ICCID, Type columns.")
             return
         if not rows:
             await update.message.reply_text("Invalid pickup Excel: missing required pickup columns or no GSM numbers found.")
             return
         try:
-            res = await models.insert_pickup_list(db_path, bytes(b), filename, update.effective_user.username)
+            res = await models.insert_pickup_list(db_path, bytes(b), filename, update.effective_user.username, rows=rows)
             await update.message.reply_text(f"Pickup Excel processed: {res.get('inserted')} inserted, {res.get('duplicates')} duplicates")
-        except Exception as ex:
-            logger.exception("import_pickup failed: %s", ex)
+        except Exception:
+            logger.exception("import_pickup failed")
             await update.message.reply_text("Import failed due to internal error.")
         return
 
@@ -1395,6 +1468,7 @@ async def handle_pickup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     await update.message.reply_text("Please attach the pickup Excel file in your next message. I will process it as a pickup list.")
 
 
+@_require_admin
 async def transfer_sims_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     args = context.args
@@ -1457,11 +1531,12 @@ async def transfer_sims_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
         else:
             sample = ', '.join(gsms[:20])
             await update.message.reply_text(f"Moved {moved} SIMs. Sample GSMs: {sample} ...")
-    except Exception as ex:
-        logger.exception("transfer_sims failed: %s", ex)
+    except Exception:
+        logger.exception("transfer_sims failed")
         await update.message.reply_text("Transfer failed due to internal error.")
 
 
+@_require_admin
 async def sim_status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     if not context.args:
@@ -1488,11 +1563,12 @@ async def sim_status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 await update.message.reply_text(str(res))
         else:
             await update.message.reply_text("Unknown query type. Use gsm, box, or carton.")
-    except Exception as ex:
-        logger.exception("sim_status_cmd failed: %s", ex)
+    except Exception:
+        logger.exception("sim_status_cmd failed")
         await update.message.reply_text("Query failed due to internal error.")
 
 
+@_require_admin
 async def transfer_backoffice_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     if len(context.args) < 3:
@@ -1516,6 +1592,7 @@ async def transfer_backoffice_cmd(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text("Internal error while transferring backoffice stock.")
 
 
+@_require_admin
 async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     date_str = context.args[0] if context.args else None
@@ -1537,25 +1614,21 @@ async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         from pathlib import Path as _Path
         from telegram import InputFile as _InputFile
 
-        # Convert to DataFrame and rename/select columns
-        df = _pd.DataFrame([{
-            'Mobile': r['number'] or r.get('gsm_number', ''),  # Number field or gsm_field
-            'Amount': r['recharge_amount'],  # recharge_amount field
-            'Date': r['report_date'],  # report_date field
-            'Employee Name': r['employee']  # comes from st.name AS employee in query
-        } for r in rows])
+        # Build the frame from plain tuples, columns in the exact order requested
+        # (employee comes from st.name AS employee in the query)
+        df = _pd.DataFrame.from_records(
+            [(r['number'] or '', r['recharge_amount'], r['report_date'], r['employee']) for r in rows],
+            columns=['Mobile', 'Amount', 'Date', 'Employee Name'],
+        )
 
-        # Ensure columns are in the exact order requested
-        df = df[['Mobile', 'Amount', 'Date', 'Employee Name']]
-        
         output_dir = _Path("reports")
         output_dir.mkdir(exist_ok=True)
         path = output_dir / f"recharge_report_herat_{parsed_date}.xlsx"
-        df.to_excel(path, index=False)
+        await asyncio.to_thread(df.to_excel, path, index=False)
         with open(path, "rb") as f:
             await update.message.reply_document(document=_InputFile(f, filename=path.name))
-    except Exception as ex:
-        logger.exception("report generation failed: %s", ex)
+    except Exception:
+        logger.exception("report generation failed")
         await update.message.reply_text("Failed generating report. Try again later.")
 
 
@@ -1645,9 +1718,9 @@ async def send_file_to_all_cmd(update: Update, context: ContextTypes.DEFAULT_TYP
     from telegram import InputFile as _InputFile
     for cid in chat_ids:
         try:
-            await context.bot.send_document(chat_id=int(cid), document=_InputFile(bytes(b), filename=doc.file_name or 'file'))
+            async with _BROADCAST_LIMITER:
+                await context.bot.send_document(chat_id=int(cid), document=_InputFile(bytes(b), filename=doc.file_name or 'file'))
             sent += 1
-            await asyncio.sleep(0.05)
         except Exception:
             failed += 1
             logger.exception("Broadcast send failed for %s", cid)
@@ -1655,6 +1728,7 @@ async def send_file_to_all_cmd(update: Update, context: ContextTypes.DEFAULT_TYP
     await update.message.reply_text(f"Broadcast complete: sent={sent}, failed={failed}")
 
 
+@_require_admin
 async def all_sales_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     date_str = context.args[0] if context.args else None
@@ -1679,6 +1753,7 @@ async def all_sales_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await update.message.reply_text(header + "\n".join(chunk))
 
 
+@_require_admin
 async def total_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Generate a daily text report per employee and per shop.
     Usage: /total [date]
@@ -1721,33 +1796,33 @@ async def total_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     per_employee_recharge = {}
     for r in rows:
         username = r['username']
-        code = (r.get('item_code') or '').lower()
-        recharge_amt = float(r.get('recharge_amount') or 0)
+        code = (r['item_code'] or '').lower()
+        recharge_amt = float(r['recharge_amount'] or 0)
         per_employee_recharge[username] = per_employee_recharge.get(username, 0.0) + recharge_amt
         # Count sales, not sum GSM numbers
         if username not in per_employee:
             per_employee[username] = {'SIM': 0, 'SWAP': 0, 'Credit50': 0, 'Credit100': 0}
-        if code in ('sim', 'simcard', 'sim_card'):
+        if code in _SIM_CODES:
             per_employee[username]['SIM'] += 1
         elif code == 'swap':
             per_employee[username]['SWAP'] += 1
         elif code in ('credit50', 'credit_50', 'credit-50'):
-            per_employee[username]['Credit50'] += int(r.get('number') or 0)
+            per_employee[username]['Credit50'] += int(r['number'] or 0)
         elif code in ('credit100', 'credit_100', 'credit-100'):
-            per_employee[username]['Credit100'] += int(r.get('number') or 0)
+            per_employee[username]['Credit100'] += int(r['number'] or 0)
 
         shop = staff_map.get(username) or 0
         if shop not in per_shop:
             per_shop[shop] = {'SIM': 0, 'SWAP': 0, 'Credit50': 0, 'Credit100': 0}
             per_shop_recharge[shop] = 0.0
-        if code in ('sim', 'simcard', 'sim_card'):
+        if code in _SIM_CODES:
             per_shop[shop]['SIM'] += 1
         elif code == 'swap':
             per_shop[shop]['SWAP'] += 1
         elif code in ('credit50', 'credit_50', 'credit-50'):
-            per_shop[shop]['Credit50'] += int(r.get('number') or 0)
+            per_shop[shop]['Credit50'] += int(r['number'] or 0)
         elif code in ('credit100', 'credit_100', 'credit-100'):
-            per_shop[shop]['Credit100'] += int(r.get('number') or 0)
+            per_shop[shop]['Credit100'] += int(r['number'] or 0)
         # accumulate recharge at shop level
         per_shop_recharge[shop] = per_shop_recharge.get(shop, 0.0) + recharge_amt
 
@@ -1967,6 +2042,7 @@ async def total_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text("\n".join(lines))
 
 
+@_require_admin
 async def inventory_summary_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     s = await models.inventory_summary(db_path)
@@ -1979,6 +2055,7 @@ async def inventory_summary_cmd(update: Update, context: ContextTypes.DEFAULT_TY
     await update.message.reply_text(f"Inventory summary — SIM {s['sim']} ({sim_af} AF) | SWAP {s['swap']} ({swap_af} AF) | C50 {s['credit_50']} ({c50_af} AF) | C100 {s['credit_100']} ({c100_af} AF)\nGrand Total AF: {grand}")
 
 
+@_require_admin
 async def promote_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     db_path = os.getenv("DB_PATH", "teleshop.db")
     if len(context.args) < 1:
@@ -1993,6 +2070,19 @@ async def promote_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     await update.message.reply_text(f"User {staff_username} promoted to admin.")
 
 
+def _build_weekly_xlsx(records: list[list], cols: list[str]) -> bytes:
+    """Render the /weekly table to xlsx bytes (blocking; run in a worker thread)."""
+    import pandas as _pd
+    from io import BytesIO as _BytesIO
+
+    df = _pd.DataFrame(records, columns=cols)
+    buf = _BytesIO()
+    with _pd.ExcelWriter(buf, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Weekly')
+    return buf.getvalue()
+
+
+@_require_admin
 async def weekly_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Generate weekly (date-range) per-employee Excel report.
     Usage: /weekly YYYY-MM-DD YYYY-MM-DD
@@ -2021,8 +2111,8 @@ async def weekly_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
     try:
         rows = await models.get_sales_counts_by_staff_dates(db_path, start.isoformat(), end.isoformat())
-    except Exception as ex:
-        logger.exception("Failed to fetch weekly data: %s", ex)
+    except Exception:
+        logger.exception("Failed to fetch weekly data")
         await update.message.reply_text("Failed to generate weekly report due to internal error.")
         return
 
@@ -2043,14 +2133,6 @@ async def weekly_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         data_map[u][d]['SWAP'] = int(r.get('swap_count') or 0)
         data_map[u][d]['REG'] = int(r.get('reg_count') or 0)
 
-    # Build Excel with pandas: rows per employee with three subrows (SIM, REG, SWAP)
-    try:
-        import pandas as _pd
-        from io import BytesIO as _BytesIO
-    except Exception:
-        await update.message.reply_text("Server missing pandas dependency; cannot generate Excel.")
-        return
-
     # Compose a table: first column Employee, second column Metric (SIM/REG/SWAP), then one column per date
     cols = ['Employee', 'Metric'] + [d for d in dates]
     records = []
@@ -2063,22 +2145,22 @@ async def weekly_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         records.append(row_reg)
         records.append(row_swap)
 
-    df = _pd.DataFrame(records, columns=cols)
-    buf = _BytesIO()
     out_name = f"weekly_report_{start.isoformat()}_to_{end.isoformat()}.xlsx"
     try:
-        with _pd.ExcelWriter(buf, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Weekly')
-        buf.seek(0)
-    except Exception as ex:
-        logger.exception("Failed to write Excel: %s", ex)
+        # workbook serialisation is CPU-bound; keep it off the event loop
+        content = await asyncio.to_thread(_build_weekly_xlsx, records, cols)
+    except ImportError:
+        await update.message.reply_text("Server missing pandas dependency; cannot generate Excel.")
+        return
+    except Exception:
+        logger.exception("Failed to write Excel")
         await update.message.reply_text("Failed to generate Excel file.")
         return
 
     try:
-        await update.message.reply_document(document=buf.getvalue(), filename=out_name)
-    except Exception as ex:
-        logger.exception("Failed to send weekly Excel: %s", ex)
+        await update.message.reply_document(document=content, filename=out_name)
+    except Exception:
+        logger.exception("Failed to send weekly Excel")
         await update.message.reply_text("Failed to send weekly report. Ensure bot can send files.")
 
 
@@ -2107,20 +2189,22 @@ async def init_bot() -> Any:
     register_command(Command("list_inventory", "List all inventories", admin_only=True, category="Inventory"))
     register_command(Command("delete_sale", "Delete sales and revert inventory", usage="<id>|<user> <date>", admin_only=True))
 
-    # Add command handlers
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_cmd))
-    app.add_handler(CommandHandler("summary", summary))
-    app.add_handler(CommandHandler("my_stock", my_stock))
-    app.add_handler(CommandHandler("my_sales", my_sales))
-    app.add_handler(CommandHandler("missing_upload", missing_upload))
-    app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
-    # admin handlers (wrapped with admin check in decorator usage)
-    app.add_handler(CommandHandler("add_stock", _require_admin(add_stock_cmd)))
-    app.add_handler(CommandHandler("remove_stock", _require_admin(remove_stock_cmd)))
-    app.add_handler(CommandHandler("view_stock", _require_admin(view_stock_cmd)))
-    app.add_handler(CommandHandler("list_inventory", _require_admin(list_inventory_cmd)))
-    app.add_handler(CommandHandler("delete_sale", _require_admin(delete_sale_cmd)))
+    # Command handlers are collected into one table and installed in a single
+    # add_handlers() call once every command has been registered.
+    command_table = [
+        ("start", start),
+        ("help", help_cmd),
+        ("summary", summary),
+        ("my_stock", my_stock),
+        ("my_sales", my_sales),
+        ("missing_upload", missing_upload),
+        # admin handlers (admin check applied by the @_require_admin decorator)
+        ("add_stock", add_stock_cmd),
+        ("remove_stock", remove_stock_cmd),
+        ("view_stock", view_stock_cmd),
+        ("list_inventory", list_inventory_cmd),
+        ("delete_sale", delete_sale_cmd),
+    ]
     # Register more admin commands
     register_command(Command("report", "Download daily recharge report", usage="[date]", admin_only=True, category="Reports"))
     register_command(Command("all_sales", "List all sales and credits", usage="[date]", admin_only=True, category="Reports"))
@@ -2158,11 +2242,13 @@ async def init_bot() -> Any:
         register_command(Command("view_inventory", "View a user's inventory", usage="<username>", admin_only=True, category="Admin"))
         register_command(Command("upload_for", "Upload a sales file on behalf of a user", usage="<username>", admin_only=True, category="Admin"))
         # add handlers wrapped with _require_admin
-        app.add_handler(CommandHandler("update_inventory", _require_admin(admin_commands.update_inventory_cmd)))
-        app.add_handler(CommandHandler("update_reg", _require_admin(admin_commands.update_reg_cmd)))
-        app.add_handler(CommandHandler("reset_inventory", _require_admin(admin_commands.reset_inventory_cmd)))
-        app.add_handler(CommandHandler("view_inventory", _require_admin(admin_commands.view_inventory_cmd)))
-        app.add_handler(CommandHandler("upload_for", _require_admin(admin_commands.upload_for_cmd)))
+        command_table.extend([
+            ("update_inventory", _require_admin(admin_commands.update_inventory_cmd)),
+            ("update_reg", _require_admin(admin_commands.update_reg_cmd)),
+            ("reset_inventory", _require_admin(admin_commands.reset_inventory_cmd)),
+            ("view_inventory", _require_admin(admin_commands.view_inventory_cmd)),
+            ("upload_for", _require_admin(admin_commands.upload_for_cmd)),
+        ])
     except Exception:
         # if admin_commands missing, continue silently (no breakage)
         import logging as _logging
@@ -2174,29 +2260,35 @@ async def init_bot() -> Any:
     register_command(Command("sim_status", "Query SIM status/location", usage="<gsm|box|carton> <value>", admin_only=True, category="SIM"))
 
     # Add handlers for all registered commands
-    app.add_handler(CommandHandler("report", _require_admin(report_cmd)))
-    app.add_handler(CommandHandler("all_sales", _require_admin(all_sales_cmd)))
-    app.add_handler(CommandHandler("inventory_summary", _require_admin(inventory_summary_cmd)))
-    app.add_handler(CommandHandler("promote", _require_admin(promote_cmd)))
-    app.add_handler(CommandHandler("transfer_stock", transfer_stock_cmd))
-    app.add_handler(CommandHandler("total", _require_admin(total_cmd)))
-    app.add_handler(CommandHandler("register_me", register_me))
-    app.add_handler(CommandHandler("msg_user", _require_admin(msg_user_cmd)))
-    app.add_handler(CommandHandler("msg_all", _require_admin(msg_all_cmd)))
-    # file send handlers
-    app.add_handler(CommandHandler("send_file", _require_admin(send_file_cmd)))
-    app.add_handler(CommandHandler("sendfiletoall", _require_admin(send_file_to_all_cmd)))
-    app.add_handler(CommandHandler("borrow_add", _require_admin(borrow_add_cmd)))
-    app.add_handler(CommandHandler("borrow_list", _require_admin(borrow_list_cmd)))
-    app.add_handler(CommandHandler("borrow_summary", _require_admin(borrow_summary_cmd)))
-    app.add_handler(CommandHandler("weekly_regs", _require_admin(weekly_regs_cmd)))
-    app.add_handler(CommandHandler("weekly", _require_admin(weekly_cmd)))
-    app.add_handler(CommandHandler("backoffice_add", _require_admin(backoffice_add_cmd)))
-    app.add_handler(CommandHandler("backoffice_list", _require_admin(backoffice_list_cmd)))
-    app.add_handler(CommandHandler("transfer_backoffice", _require_admin(transfer_backoffice_cmd)))
-    app.add_handler(CommandHandler("import_pickup", _require_admin(handle_pickup)))
-    app.add_handler(CommandHandler("transfer_sims", _require_admin(transfer_sims_cmd)))
-    app.add_handler(CommandHandler("sim_status", _require_admin(sim_status_cmd)))
+    command_table.extend([
+        ("report", report_cmd),
+        ("all_sales", all_sales_cmd),
+        ("inventory_summary", inventory_summary_cmd),
+        ("promote", promote_cmd),
+        ("transfer_stock", transfer_stock_cmd),
+        ("total", total_cmd),
+        ("register_me", register_me),
+        ("msg_user", msg_user_cmd),
+        ("msg_all", msg_all_cmd),
+        # file send handlers
+        ("send_file", send_file_cmd),
+        ("sendfiletoall", send_file_to_all_cmd),
+        ("borrow_add", borrow_add_cmd),
+        ("borrow_list", borrow_list_cmd),
+        ("borrow_summary", borrow_summary_cmd),
+        ("weekly_regs", weekly_regs_cmd),
+        ("weekly", weekly_cmd),
+        ("backoffice_add", backoffice_add_cmd),
+        ("backoffice_list", backoffice_list_cmd),
+        ("transfer_backoffice", transfer_backoffice_cmd),
+        ("import_pickup", handle_pickup),
+        ("transfer_sims", transfer_sims_cmd),
+        ("sim_status", sim_status_cmd),
+    ])
+
+    handlers = [CommandHandler(name, fn) for name, fn in command_table]
+    handlers.append(MessageHandler(filters.Document.ALL, handle_document))
+    app.add_handlers({0: handlers})
 
     return app
 @_require_admin
@@ -2215,12 +2307,12 @@ async def transfer_stock_cmd(update, context):
         return
 
     # use the actual caller's username (fallback to id string)
-    from_username = update.effective_user.username or str(update.effective_user.id)
+    from_username = _caller_username(update, context)
 
     try:
         ok = await models.transfer_stock(db_path, from_username, to_username, item, qty)
-    except Exception as ex:
-        logger.exception("transfer_stock failed: %s", ex)
+    except Exception:
+        logger.exception("transfer_stock failed")
         await update.message.reply_text("Transfer failed due to internal error.")
         return
     if not ok:
@@ -2228,13 +2320,13 @@ async def transfer_stock_cmd(update, context):
         return
 
     logger.info("/transfer_stock by %s: %s -> %s %s", from_username, item, to_username, qty)
-    await update.message.reply_text(f"Transferred {qty} {item} from you to {to_username}.")
+    await update.message.reply_text(_TRANSFERRED.format(qty=qty, item=item, to=to_username))
 
     # Notify receiving employee if they have a stored chat_id
     try:
         staff = await models.get_staff_by_username(db_path, to_username)
         if staff and staff.get("chat_id"):
-            sent = await send_message_safe(context.bot, staff.get("chat_id"), f"📦 You have received {qty} {item} from admin {from_username}.")
+            sent = await send_message_safe(context.bot, staff.get("chat_id"), _RECEIVED.format(qty=qty, item=item, frm=from_username))
             if not sent:
                 logger.info("Could not deliver transfer notification to %s (chat_id=%s)", to_username, staff.get("chat_id"))
         else:
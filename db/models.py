@@ -1,14 +1,23 @@
 """SQLite models and helpers for Teleshop system.
 
 This module provides synchronous SQLite functions and wraps blocking calls
-with asyncio.to_thread from the bot so they don't block the event loop.
+with asyncio.to_thread from the bot so they don't block the event loop;
+write helpers share a single writer thread instead.
 """
 from __future__ import annotations
 
+import atexit
+import collections
+import concurrent.futures
+import contextlib
+import functools
 import sqlite3
 import os
+import re
+import threading
 import time
-from typing import Optional, List, Dict, Any
+import zlib
+from typing import Optional, List, Dict, Any, Tuple
 import datetime
 import asyncio
 import logging
@@ -111,43 +120,580 @@ CREATE TABLE IF NOT EXISTS sim_batches (
     date_sent TEXT,
     note TEXT
 );
+
+-- Hot lookups: per-staff/day sales (uploads, reports), duplicate SIM numbers,
+-- per-day sales listings, the journal history in sim_status, and box/carton
+-- status counts.
+CREATE INDEX IF NOT EXISTS idx_sales_staff_date ON sales(staff_id, report_date);
+CREATE INDEX IF NOT EXISTS idx_sales_number_itemcode ON sales(number, item_code);
+CREATE INDEX IF NOT EXISTS idx_sales_report_date ON sales(report_date);
+CREATE INDEX IF NOT EXISTS idx_journal_item_ts ON inventory_journal(item, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_sim_batches_box ON sim_batches(box_no);
+CREATE INDEX IF NOT EXISTS idx_sim_batches_carton ON sim_batches(carton_no);
 """
 
 
+# Each migration is (name, table, column, sql). `column` is the column the
+# statement adds; None means the statement creates `table`. init_db checks the
+# live schema first and only runs migrations whose target is missing.
 MIGRATIONS = [
     # add is_admin column to staff if missing
     (
         "alter_staff_add_is_admin",
+        "staff", "is_admin",
         "ALTER TABLE staff ADD COLUMN is_admin INTEGER DEFAULT 0",
     ),
     # add chat_id column to store Telegram chat id for notifications
     (
         "alter_staff_add_chat_id",
+        "staff", "chat_id",
         "ALTER TABLE staff ADD COLUMN chat_id TEXT",
     ),
     (
         "alter_inventory_journal_add_source_ref",
+        "inventory_journal", "source_ref",
         "ALTER TABLE inventory_journal ADD COLUMN source_ref INTEGER",
     ),
     (
         "add_sim_batches_table",
+        "sim_batches", None,
         "CREATE TABLE IF NOT EXISTS sim_batches (id INTEGER PRIMARY KEY AUTOINCREMENT, carton_no TEXT, box_no TEXT, gsm_number TEXT UNIQUE NOT NULL, iccid TEXT, type TEXT, current_location TEXT DEFAULT 'Backoffice', status TEXT DEFAULT 'in_stock', date_added TEXT DEFAULT CURRENT_TIMESTAMP, date_sent TEXT, note TEXT)",
     ),
     (
         "alter_sales_add_contact_number",
+        "sales", "contact_number",
         "ALTER TABLE sales ADD COLUMN contact_number TEXT",
     ),
     (
         "add_daily_totals_table",
+        "daily_totals", None,
         "CREATE TABLE IF NOT EXISTS daily_totals (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, shop_id INTEGER, total_amount REAL NOT NULL, created_at TEXT DEFAULT CURRENT_TIMESTAMP)",
     ),
 ]
 
+# Indexes added after the first release, as (index name, sql); applied after
+# MIGRATIONS whenever the index is missing, followed by ANALYZE so the planner
+# has statistics for them.
+#
+# The unique ones back the last-upload-wins upserts; each first drops older
+# duplicates (keeping the newest row per key), which databases written before the
+# index existed may hold. daily_totals needs two partial indexes because NULL
+# shop_ids never conflict in a plain UNIQUE index.
+INDEX_MIGRATIONS = [
+    (
+        "uq_daily_regs_staff_date",
+        "DELETE FROM daily_regs WHERE id NOT IN (SELECT MAX(id) FROM daily_regs GROUP BY staff_id, date);\n"
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_daily_regs_staff_date ON daily_regs(staff_id, date)",
+    ),
+    (
+        "uq_daily_totals_date_shop",
+        "DELETE FROM daily_totals WHERE shop_id IS NOT NULL AND id NOT IN "
+        "(SELECT MAX(id) FROM daily_totals WHERE shop_id IS NOT NULL GROUP BY date, shop_id);\n"
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_daily_totals_date_shop ON daily_totals(date, shop_id) WHERE shop_id IS NOT NULL",
+    ),
+    (
+        "uq_daily_totals_date_noshop",
+        "DELETE FROM daily_totals WHERE shop_id IS NULL AND id NOT IN "
+        "(SELECT MAX(id) FROM daily_totals WHERE shop_id IS NULL GROUP BY date);\n"
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_daily_totals_date_noshop ON daily_totals(date) WHERE shop_id IS NULL",
+    ),
+    # Covering indexes for the date-range regs report, the borrow summaries and
+    # the daily totals listing.
+    (
+        "idx_daily_regs_date_staff",
+        "CREATE INDEX IF NOT EXISTS idx_daily_regs_date_staff ON daily_regs(date, staff_id, reg_count)",
+    ),
+    (
+        "idx_borrow_admin_date_person",
+        "CREATE INDEX IF NOT EXISTS idx_borrow_admin_date_person ON borrow_list(admin_id, date, person_name, amount)",
+    ),
+    (
+        "idx_daily_totals_date_shop",
+        "CREATE INDEX IF NOT EXISTS idx_daily_totals_date_shop ON daily_totals(date, shop_id, total_amount, created_at)",
+    ),
+]
+
+
+# Hot lookups shared by several helpers. sqlite3 keys its statement cache on the
+# SQL text, so keeping one spelling of each guarantees they share a cache slot.
+_SQL_STAFF_ID_BY_USERNAME = "SELECT id FROM staff WHERE username = ?"
+_SQL_BACKOFFICE_QTY = "SELECT COALESCE((SELECT quantity FROM backoffice_stock WHERE item = ?), 0)"
+# Every daily_totals column, named so the listing can be served from
+# idx_daily_totals_date_shop alone (id is the rowid).
+_DAILY_TOTALS_COLS = "id, date, shop_id, total_amount, created_at"
+# The conflict target must repeat the partial index's WHERE clause to match it.
+_SQL_UPSERT_DAILY_TOTAL_SHOP = (
+    "INSERT INTO daily_totals (date, shop_id, total_amount) VALUES (?, ?, ?) "
+    "ON CONFLICT(date, shop_id) WHERE shop_id IS NOT NULL "
+    "DO UPDATE SET total_amount = excluded.total_amount, created_at = CURRENT_TIMESTAMP"
+)
+# Last upload wins; created_at is reset so it reflects the latest upload
+_SQL_UPSERT_DAILY_REGS = (
+    "INSERT INTO daily_regs (staff_id, date, reg_count) VALUES (?, ?, ?) "
+    "ON CONFLICT(staff_id, date) DO UPDATE SET reg_count = excluded.reg_count, created_at = CURRENT_TIMESTAMP"
+)
+_SQL_UPSERT_DAILY_TOTAL_NOSHOP = (
+    "INSERT INTO daily_totals (date, shop_id, total_amount) VALUES (?, ?, ?) "
+    "ON CONFLICT(date) WHERE shop_id IS NULL "
+    "DO UPDATE SET total_amount = excluded.total_amount, created_at = CURRENT_TIMESTAMP"
+)
+_SQL_INVENTORY_BY_STAFF = "SELECT sim, swap, credit_50, credit_100 FROM inventory WHERE staff_id = ?"
+_SQL_INVENTORY_ROW_BY_STAFF = "SELECT sim, swap, credit_50, credit_100, updated_at FROM inventory WHERE staff_id = ?"
+_SQL_BACKOFFICE_ROW = "SELECT id, quantity FROM backoffice_stock WHERE item = ?"
+_SQL_STAFF_IS_ADMIN = "SELECT is_admin FROM staff WHERE username = ?"
+_SQL_SALES_BY_DATE = (
+    "SELECT sa.id, st.username as username, st.name as employee, sa.report_date, sa.item_code, sa.number, "
+    "sa.contact_number, sa.recharge_amount, sa.notes FROM sales sa JOIN staff st ON sa.staff_id = st.id "
+    "WHERE sa.report_date = ?"
+)
+_SQL_SALES_BY_DATE_FOR_SHOP = _SQL_SALES_BY_DATE + " AND st.shop_id = ?"
+
+# Per-column inventory increment (pass a negative amount to deduct); also touches
+# updated_at. Columns are interpolated only from this fixed set, never from user input.
+_INVENTORY_COLUMNS = ("sim", "swap", "credit_50", "credit_100")
+_UPDATE_SQL_BY_COL = {
+    col: f"UPDATE inventory SET {col} = {col} + ?, updated_at = CURRENT_TIMESTAMP WHERE staff_id = ?"
+    for col in _INVENTORY_COLUMNS
+}
+
+# Accepted sales item codes (lower-cased) -> inventory column.
+_ITEM_CODE_COLUMN = {
+    "sim": "sim", "simcard": "sim", "sim_card": "sim",
+    "swap": "swap",
+    "credit50": "credit_50", "credit_50": "credit_50", "credit-50": "credit_50",
+    "credit100": "credit_100", "credit_100": "credit_100", "credit-100": "credit_100",
+}
+
+
+# A sales `Number` that is a GSM/mobile identifier rather than a quantity.
+_GSM_RE = re.compile(r"\d{6,}")
+
+
+def _scan_gsm_fields(e: dict) -> tuple:
+    """One pass over a sales row's values: (first GSM-looking value, value of the gsm/msisdn column)."""
+    gsm_like = None
+    gsm_field = str(e['gsm_number']).strip() if e.get('gsm_number') else None
+    for k, v in e.items():
+        if not v:
+            continue
+        if gsm_like is None:
+            v_str = str(v).strip()
+            if _GSM_RE.fullmatch(v_str):
+                gsm_like = v_str
+        if gsm_field is None:
+            lk = str(k).lower()
+            if 'gsm' in lk or lk in ('msisdn',):
+                gsm_field = str(v).strip()
+        if gsm_like is not None and gsm_field is not None:
+            break
+    return gsm_like, gsm_field
+
+
+# A sales row after validation and interpretation; see _parse_sale_entry.
+_SaleRow = collections.namedtuple(
+    "_SaleRow",
+    "item_code col store_number deduct recharge_amount notes contact_number credit_50 credit_100 gsm_field dup_key",
+)
+
+
+def _int_or_none(value: Any) -> Optional[int]:
+    """int(value or 0), or None if it cannot be converted. Ints (the usual case) pass straight through."""
+    if type(value) is int:
+        return value
+    if not value:
+        return 0
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
 
-def get_connection(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+def _parse_sale_entry(e: dict) -> Optional[_SaleRow]:
+    """Validate and interpret one parsed sales row without touching the database.
+
+    Returns None for a row that cannot be used (non-numeric credit counts).
+    ``col`` is the inventory column (None for unknown item codes), ``deduct`` the
+    units to take from it, and ``dup_key`` the GSM (as stored in sales.number) for
+    SIM rows that must be unique across uploads.
+    """
+    credit50 = _int_or_none(e.get('credit_50'))
+    credit100 = _int_or_none(e.get('credit_100'))
+    if credit50 is None or credit100 is None:
+        return None
+    item_code = str(e.get("item_code") or "").lower()
+    # robust Number parsing: accept Number/number/NUM, default to 1 if invalid/zero
+    raw_number = e.get("Number") or e.get("number") or e.get("NUM") or None
+    raw_number_str = str(raw_number).strip() if raw_number is not None else ''
+    if type(raw_number) is int:
+        number = raw_number
+    else:
+        try:
+            number = int(float(raw_number_str)) if raw_number_str else 1
+        except (ValueError, OverflowError):
+            number = 1
+    if number <= 0:
+        number = 1
+    try:
+        recharge_amount = float(e.get("recharge_amount") or 0)
+    except (TypeError, ValueError):
+        recharge_amount = 0.0
+    notes = e.get("Notes") or e.get("notes") or None
+    contact_number = e.get('contact_number') or e.get('Contact Number') or e.get('contact') or None
+    gsm_like, gsm_field = _scan_gsm_fields(e)
+
+    # Interpret parsed values:
+    # - The 'number' column may be either a quantity (e.g. 2) or a GSM/mobile identifier (long number).
+    #   If it looks like a GSM (all digits and length >= 6) we treat it as an identifier and deduct 1 unit.
+    #   Otherwise we treat it as a quantity and deduct that many units.
+    # - credit_50 and credit_100 are explicit integer counts per row and should be deducted accordingly.
+    is_gsm = _GSM_RE.fullmatch(raw_number_str) is not None
+    kind = _ITEM_CODE_COLUMN.get(item_code)
+    store_number = raw_number if raw_number is not None else number
+    dup_key = None
+    if kind in ("sim", "swap"):
+        # A GSM identifier is stored as-is and deducts 1; otherwise Number is a quantity.
+        if is_gsm:
+            deduct = 1
+            store_number = raw_number_str
+            # Duplicate check only for SIM items with GSM identifiers (allow SWAP duplicates)
+            if kind == "sim":
+                dup_key = int(raw_number_str)
+        else:
+            deduct = number
+            store_number = number
+            # Also try to detect GSM in other columns if present
+            if kind == "sim" and gsm_like is not None:
+                store_number = gsm_like
+    elif kind == "credit_50":
+        deduct = credit50
+    elif kind == "credit_100":
+        deduct = credit100
+    else:
+        # For other items (like recharge): treat deduct as numeric if present (rare)
+        deduct = number
+    return _SaleRow(
+        item_code, _map_item_to_column(item_code), store_number, deduct, recharge_amount, notes,
+        contact_number, credit50, credit100, gsm_field, dup_key,
+    )
+
+
+# Values per `IN (...)` query, kept under SQLite's default 999 bound-parameter limit.
+_SQL_IN_CHUNK = 900
+
+# Journal columns returned in sim_status history, in SELECT order.
+_HIST_KEYS = ("id", "staff_id", "item", "change_amount", "change_type", "source", "timestamp", "source_ref")
+_SQL_SIM_HISTORY = (
+    f"SELECT {', '.join(_HIST_KEYS)} FROM inventory_journal WHERE item = 'SIM' ORDER BY timestamp DESC LIMIT 50"
+)
+
+# transfer_stock: conditional debit of the sender, then credit of the recipient.
+_TRANSFER_DEBIT_SQL_BY_COL = {
+    col: f"UPDATE inventory SET {col} = {col} - ?, updated_at = CURRENT_TIMESTAMP "
+         f"WHERE staff_id = (SELECT id FROM staff WHERE username = ?) AND {col} >= ?"
+    for col in _INVENTORY_COLUMNS
+}
+_TRANSFER_CREDIT_SQL_BY_COL = {
+    col: f"UPDATE inventory SET {col} = {col} + ?, updated_at = CURRENT_TIMESTAMP "
+         f"WHERE staff_id = (SELECT id FROM staff WHERE username = ?)"
+    for col in _INVENTORY_COLUMNS
+}
+
+# Row returned by list_backoffice_stock.
+BackofficeRow = collections.namedtuple("BackofficeRow", "id item quantity")
+
+# Inventory to hand back when a staff/date upload is replaced: SIM/SWAP rows count
+# one unit each, credit rows carry their count in `number`.
+_SQL_REVERT_COUNTS = """
+    SELECT
+        COALESCE(SUM(CASE WHEN code IN ('sim', 'simcard', 'sim_card') THEN 1 END), 0) AS sim,
+        COALESCE(SUM(CASE WHEN code = 'swap' THEN 1 END), 0) AS swap,
+        COALESCE(SUM(CASE WHEN code IN ('credit50', 'credit_50', 'credit-50') THEN CAST(number AS INTEGER) END), 0) AS credit_50,
+        COALESCE(SUM(CASE WHEN code IN ('credit100', 'credit_100', 'credit-100') THEN CAST(number AS INTEGER) END), 0) AS credit_100
+    FROM (SELECT lower(trim(COALESCE(item_code, ''))) AS code, number FROM sales WHERE staff_id = ? AND report_date = ?)
+"""
+
+# Size of sqlite3's per-connection prepared-statement cache. The default (128)
+# is smaller than the number of distinct statements the bot issues, so hot
+# queries were being evicted and re-prepared.
+STATEMENT_CACHE_SIZE = 256
+
+
+# journal_mode=WAL is persistent in the file, so each pool sets it once, on its
+# first connection.
+JOURNAL_MODE_PRAGMA = "PRAGMA journal_mode = WAL"
+
+# synchronous level of every pooled connection. In WAL mode NORMAL only fsyncs at
+# checkpoints; the test suite turns it OFF since it never needs to survive a power cut.
+CONNECTION_SYNCHRONOUS = "NORMAL"
+
+# synchronous level for the sales-upload transaction. FULL fsyncs the WAL on every
+# upload commit; the test suite drops it to CONNECTION_SYNCHRONOUS.
+UPLOAD_SYNCHRONOUS = "FULL"
+
+# Applied to every pooled connection when it is opened (after CONNECTION_SYNCHRONOUS).
+CONNECTION_PRAGMAS = (
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -64000",
+    "PRAGMA mmap_size = 268435456",
+    # writers queue on SQLite's lock instead of failing with "database is locked"
+    "PRAGMA busy_timeout = 15000",
+)
+# ...sent to SQLite as a single script, once per connection lifetime.
+_CONNECTION_PRAGMA_SCRIPT = "".join(f"{pragma};\n" for pragma in CONNECTION_PRAGMAS)
+
+# Idle connections kept per database file; extra ones are closed on release.
+POOL_MAX_IDLE = 8
+
+
+class _PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool.
+
+    Helpers keep the usual ``conn = get_connection(...) ... conn.close()`` shape;
+    the connection (and its page/statement caches) survives for the next caller.
+    """
+
+    _pool: Optional["_ConnectionPool"] = None
+    _checked_out: bool = False
+
+    def close(self) -> None:
+        pool = self._pool
+        if pool is None:
+            super().close()
+        elif self._checked_out:
+            self._checked_out = False
+            pool.release(self)
+
+
+class _ConnectionPool:
+    """Idle connections for one database file.
+
+    Each file gets a read-write pool and a ``readonly`` one whose connections run
+    with ``PRAGMA query_only``; in WAL mode those readers never wait on the writer.
+    """
+
+    def __init__(self, db_path: str, readonly: bool = False) -> None:
+        self.db_path = db_path
+        self.readonly = readonly
+        self.file_id = _file_identity(db_path)
+        self._idle: List[_PooledConnection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._wal_set = False
+
+    def acquire(self) -> _PooledConnection:
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                uri=True,
+                check_same_thread=False,
+                cached_statements=STATEMENT_CACHE_SIZE,
+                factory=_PooledConnection,
+            )
+            if not self._wal_set and not self.readonly:
+                conn.execute(JOURNAL_MODE_PRAGMA)
+                self._wal_set = True
+            conn.executescript(f"PRAGMA synchronous = {CONNECTION_SYNCHRONOUS};\n" + _CONNECTION_PRAGMA_SCRIPT)
+            if self.readonly:
+                conn.execute("PRAGMA query_only = 1")
+            conn._pool = self
+            if self.file_id is None:
+                self.file_id = _file_identity(self.db_path)
+        conn.row_factory = sqlite3.Row
+        conn._checked_out = True
+        return conn
+
+    def release(self, conn: _PooledConnection) -> None:
+        try:
+            if conn.in_transaction:
+                # a helper bailed out without commit/rollback; don't leak its writes
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            if not self._closed and len(self._idle) < POOL_MAX_IDLE:
+                self._idle.append(conn)
+                return
+        self._discard(conn)
+
+    def close_all(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    @staticmethod
+    def _discard(conn: _PooledConnection) -> None:
+        conn._pool = None
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+# (pool key, readonly) -> pool
+_POOLS: Dict[tuple, _ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _file_identity(db_path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+def _is_shared_memory(db_path: str) -> bool:
+    """True for named in-memory databases, e.g. ``file:tests?mode=memory&cache=shared``.
+
+    They live as long as one connection to them is open, so the pool keeps them
+    alive until close_connections(); handy for tests that should not touch disk.
+    """
+    return db_path.startswith("file:") and "mode=memory" in db_path
+
+
+def _pool_key(db_path: str) -> str:
+    return db_path if _is_shared_memory(db_path) else os.path.abspath(db_path)
+
+
+def get_connection(db_path: str, readonly: bool = False) -> sqlite3.Connection:
+    """Check out a pooled connection for ``db_path``; ``close()`` returns it.
+
+    ``readonly`` connections come from a separate pool and reject writes.
+    """
+    if db_path == ":memory:":
+        # every :memory: connection is its own database; nothing to share
+        conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        return conn
+    key = _pool_key(db_path)
+    with _POOLS_LOCK:
+        pool = _POOLS.get((key, readonly))
+        if pool is not None and pool.file_id is not None:
+            file_id = _file_identity(db_path)
+            if pool.file_id != file_id:
+                # the file was deleted or replaced underneath us (tests, manual restore)
+                for mode in (False, True):
+                    stale = _POOLS.pop((key, mode), None)
+                    if stale is not None:
+                        stale.close_all()
+                _clear_lookup_caches()
+                pool = None
+                if file_id is None:
+                    # WAL sidecars of a deleted database must not be replayed into a new one
+                    for suffix in ("-wal", "-shm"):
+                        try:
+                            os.remove(db_path + suffix)
+                        except OSError:
+                            pass
+        if pool is None:
+            pool = _POOLS[(key, readonly)] = _ConnectionPool(db_path, readonly)
+    return pool.acquire()
+
+
+def close_connections(db_path: Optional[str] = None) -> None:
+    """Close pooled connections for ``db_path`` (or for every database)."""
+    with _POOLS_LOCK:
+        if db_path is None:
+            pools = list(_POOLS.values())
+            _POOLS.clear()
+        else:
+            key = _pool_key(db_path)
+            pools = [p for p in (_POOLS.pop((key, False), None), _POOLS.pop((key, True), None)) if p]
+    for pool in pools:
+        pool.close_all()
+    _clear_lookup_caches()
+
+
+atexit.register(close_connections)
+
+
+@contextlib.contextmanager
+def _borrow(db_path: str, readonly: bool = False):
+    """``with _borrow(db_path) as conn:`` - the connection goes back to the pool even on error."""
+    conn = get_connection(db_path, readonly)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextlib.contextmanager
+def _read_snapshot(db_path: str):
+    """Like _borrow, but every SELECT in the body reads one WAL snapshot (a deferred,
+    read-only transaction that never blocks or waits for the writer)."""
+    with _borrow(db_path, readonly=True) as conn:
+        conn.execute("BEGIN DEFERRED")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+
+# username -> staff id per database file. Staff rows are never deleted or renamed,
+# so a hit stays valid until the file itself is replaced or restored; misses are
+# not cached (ensure_staff may create the row later).
+_STAFF_ID_CACHE: Dict[tuple, int] = {}
+_STAFF_ID_CACHE_MAX = 2048
+
+# (db file, username) -> (monotonic time, is_admin). Checked on nearly every admin
+# command; set_admin drops the entry, the TTL bounds edits made outside this process.
+_ADMIN_CACHE: Dict[tuple, tuple] = {}
+ADMIN_CACHE_TTL = 60.0
+
+
+# db file -> {staff id: (username, name)}. Neither column is ever updated, so the
+# map stays valid until the file is replaced; an unknown id triggers a reload.
+_STAFF_NAMES_CACHE: Dict[str, Dict[int, tuple]] = {}
+
+
+def _clear_lookup_caches() -> None:
+    _STAFF_ID_CACHE.clear()
+    _ADMIN_CACHE.clear()
+    _STAFF_NAMES_CACHE.clear()
+
+
+def _staff_names(cur: sqlite3.Cursor, db_path: str, staff_ids) -> Dict[int, tuple]:
+    """{staff id: (username, name)} covering ``staff_ids``, reloaded through ``cur`` on a miss."""
+    key = None if db_path == ":memory:" else _pool_key(db_path)
+    names = _STAFF_NAMES_CACHE.get(key) if key else None
+    if names is None or any(sid not in names for sid in staff_ids):
+        cur.execute("SELECT id, username, name FROM staff")
+        names = {sid: (username, name) for sid, username, name in cur}
+        if key:
+            _STAFF_NAMES_CACHE[key] = names
+    return names
+
+
+# SQLite admits one writer at a time; running every write helper on the same
+# thread queues them in Python instead of having threads spin on the WAL lock.
+_WRITE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+
+async def _run_write(fn):
+    """Run a blocking write helper on the single writer thread."""
+    return await asyncio.get_running_loop().run_in_executor(_WRITE_EXECUTOR, fn)
+
+
+def _lookup_staff_id(cur: sqlite3.Cursor, db_path: str, username: str) -> Optional[int]:
+    """Staff id for ``username`` (None if unknown), querying through ``cur`` on a cache miss."""
+    key = None if db_path == ":memory:" else (_pool_key(db_path), username)
+    sid = _STAFF_ID_CACHE.get(key) if key else None
+    if sid is None:
+        cur.execute(_SQL_STAFF_ID_BY_USERNAME, (username,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        sid = row[0]
+        if key:
+            if len(_STAFF_ID_CACHE) >= _STAFF_ID_CACHE_MAX:
+                _STAFF_ID_CACHE.clear()
+            _STAFF_ID_CACHE[key] = sid
+    return sid
 
 
 def _ensure_admin_pending_table(conn: sqlite3.Connection) -> None:
@@ -251,6 +797,7 @@ def restore_db_from_snapshot(db_path: str, snapshot_path: str) -> bool:
     try:
         src.backup(dest)
         dest.commit()
+        _clear_lookup_caches()
         return True
     finally:
         try:
@@ -276,22 +823,51 @@ def get_table_columns(cur: sqlite3.Cursor, table_name: str) -> List[str]:
     cur.execute(f"PRAGMA table_info({table_name})")
     return [row["name"] for row in cur.fetchall()]
 
+_SCHEMA_TABLE_RE = re.compile(r"CREATE TABLE IF NOT EXISTS\s+(\w+)\s*\(([^;]+)\)", re.IGNORECASE)
+_SCHEMA_COLUMN_RE = re.compile(r"^\s*(\w+)\s+(?:INTEGER|TEXT|REAL|BLOB)", re.MULTILINE | re.IGNORECASE)
+
+def get_all_table_columns(cur: sqlite3.Cursor) -> Dict[str, set]:
+    """Map every table name to its column names in a single query."""
+    cur.execute(
+        "SELECT m.name, p.name FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p "
+        "WHERE m.type = 'table'"
+    )
+    columns: Dict[str, set] = {}
+    for table_name, col_name in cur.fetchall():
+        columns.setdefault(table_name, set()).add(col_name)
+    return columns
+
+@functools.lru_cache(maxsize=1)
 def get_required_tables_and_columns() -> Dict[str, List[str]]:
-    """Extract required table and column names from DB_SCHEMA."""
-    tables = {}
-    current_table = None
-    for line in DB_SCHEMA.split("\n"):
-        line = line.strip()
-        if line.startswith("CREATE TABLE IF NOT EXISTS"):
-            # Extract table name
-            current_table = line.split()[5].strip('(').strip('`')
-            tables[current_table] = []
-        elif line and current_table and "," in line and not line.startswith("--"):
-            # Extract column name
-            col_name = line.split()[0].strip(',').strip('`')
-            if col_name not in ("PRIMARY", "FOREIGN"):
-                tables[current_table].append(col_name)
-    return tables
+    """Extract required table and column names from DB_SCHEMA.
+
+    DB_SCHEMA is a constant, so the result is computed once; treat it as read-only.
+    """
+    return {m.group(1): _SCHEMA_COLUMN_RE.findall(m.group(2)) for m in _SCHEMA_TABLE_RE.finditer(DB_SCHEMA)}
+
+def _schema_stamp(cur: sqlite3.Cursor) -> str:
+    """Identify the verified state: file schema cookie + our schema/migration definitions."""
+    cur.execute("PRAGMA schema_version")
+    return f"{cur.fetchone()[0]}:{zlib.crc32(DB_SCHEMA.encode())}:{len(MIGRATIONS)}:{len(INDEX_MIGRATIONS)}"
+
+def _read_schema_stamp(stamp_path: Optional[str]) -> Optional[str]:
+    if stamp_path is None:
+        return None
+    try:
+        with open(stamp_path, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _write_schema_stamp(stamp_path: Optional[str], stamp: str) -> None:
+    if stamp_path is None:
+        return
+    try:
+        with open(stamp_path, "w", encoding="utf-8") as f:
+            f.write(stamp)
+    except OSError:
+        # the stamp is only an optimisation; verification simply runs next time
+        logger.debug("Could not write schema stamp %s", stamp_path)
 
 async def init_db(db_path: str) -> None:
     """Initialize database schema and verify table/column existence.
@@ -302,82 +878,164 @@ async def init_db(db_path: str) -> None:
     3. Verifies all required columns exist
     4. Applies any pending migrations
     
-    The process is safe and non-destructive - it will not drop or modify
-    existing tables/columns, only add missing ones.
+    It never drops tables or columns; missing ones are added. The one destructive
+    step: before the unique indexes on daily_regs (staff_id, date) and daily_totals
+    (date, shop_id) are first created, duplicate rows for a key are deleted, keeping
+    the most recently inserted one (highest id).
     """
     def _init():
         # Ensure parent directory exists
         os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
         
-        # Connect and enable foreign keys
         conn = get_connection(db_path)
         cur = conn.cursor()
-        cur.execute("PRAGMA foreign_keys = ON")
 
         # Get required table structure
         required_tables = get_required_tables_and_columns()
 
-        # First create any missing tables
-        cur.executescript(DB_SCHEMA)
-        conn.commit()
-
-        # Now verify each table and its columns exist
-        for table_name, required_cols in required_tables.items():
-            if not verify_table_exists(cur, table_name):
-                logger.error(f"Critical table {table_name} missing after schema init!")
+        # Work out which migrations are still needed. A table that DB_SCHEMA is about
+        # to create will already carry the columns listed there.
+        existing_tables = get_all_table_columns(cur)
+        pending = []
+        for name, table, column, sql in MIGRATIONS:
+            if table in existing_tables:
+                cols = existing_tables[table]
+            else:
+                cols = set(required_tables.get(table, ()))
+            if column is None:
+                if table in existing_tables:
+                    continue
+            elif column in cols:
                 continue
+            pending.append((name, sql))
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        existing_indexes = {row[0] for row in cur}
+        new_indexes = [(name, sql) for name, sql in INDEX_MIGRATIONS if name not in existing_indexes]
+        if new_indexes:
+            pending.extend(new_indexes)
+            pending.append(("analyze", "ANALYZE"))
+
+        # Create missing tables and apply the pending migrations in one transaction
+        # (a single commit instead of one per migration).
+        script = "BEGIN;\n" + DB_SCHEMA + "\n" + "".join(f"{sql};\n" for _, sql in pending) + "COMMIT;"
+        try:
+            cur.executescript(script)
+            for name, _ in pending:
+                logger.debug(f"Applied migration: {name}")
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.warning(f"Combined schema/migration script failed ({e}); applying step by step")
+            cur.executescript(DB_SCHEMA)
+            for name, sql in pending:
+                try:
+                    cur.executescript(sql)
+                    conn.commit()
+                    logger.debug(f"Applied migration: {name}")
+                except Exception as me:
+                    logger.warning(f"Migration {name} failed: {me}")
+
+        # Now verify each table and its columns exist. Skipped when the file's schema
+        # cookie and our schema definitions match the last verified start-up.
+        stamp_path = None if db_path == ":memory:" or _is_shared_memory(db_path) else db_path + ".schema_stamp"
+        clean = False
+        if _schema_stamp(cur) != _read_schema_stamp(stamp_path):
+            clean = True
+            existing_tables = get_all_table_columns(cur)
+            for table_name, required_cols in required_tables.items():
+                if table_name not in existing_tables:
+                    logger.error(f"Critical table {table_name} missing after schema init!")
+                    clean = False
+                    continue
 
-            # Get actual columns
-            actual_cols = set(get_table_columns(cur, table_name))
-            required_cols = set(required_cols)
-            
-            # Log any missing columns
-            missing = required_cols - actual_cols
-            if missing:
-                logger.warning(f"Table {table_name} missing columns: {missing}")
+                # Get actual columns
+                actual_cols = existing_tables[table_name]
+                required_cols = set(required_cols)
+
+                # Log any missing columns
+                missing = required_cols - actual_cols
+                if missing:
+                    logger.warning(f"Table {table_name} missing columns: {missing}")
+                    clean = False
 
-        # Run migrations for any missing columns
-        for name, sql in MIGRATIONS:
-            try:
-                cur.execute(sql)
-                conn.commit()
-                logger.debug(f"Applied migration: {name}")
-            except Exception as e:
-                # Ignore "duplicate column" errors
-                if "duplicate column name" not in str(e):
-                    logger.warning(f"Migration {name} failed: {e}")
-        
         conn.commit()
+        # only stamp a clean verification, so problems keep being reported
+        if clean:
+            _write_schema_stamp(stamp_path, _schema_stamp(cur))
+        # DB_SCHEMA switches foreign keys on; pooled connections keep SQLite's default (off)
+        cur.execute("PRAGMA foreign_keys = OFF")
         conn.close()
 
     await asyncio.to_thread(_init)
     logger.info("Database initialized and verified at %s", db_path)
 
 
+def _ensure_staff_id(conn: sqlite3.Connection, db_path: str, username: str, name: Optional[str]) -> int:
+    """Staff id for ``username``, creating the staff and an empty inventory row if missing.
+    Leaves any insert uncommitted."""
+    cur = conn.cursor()
+    sid = _lookup_staff_id(cur, db_path, username)
+    if sid is not None:
+        # common case: cached or a plain read, no write lock taken
+        return sid
+    # DO NOTHING + RETURNING yields no row if a concurrent call created the staff first
+    cur.execute(
+        "INSERT INTO staff (username, name) VALUES (?, ?) ON CONFLICT(username) DO NOTHING RETURNING id",
+        (username, name or username),
+    )
+    row = cur.fetchone()
+    if row:
+        sid = row[0]
+        # create initial inventory
+        cur.execute(
+            "INSERT INTO inventory (staff_id, sim, swap, credit_50, credit_100) VALUES (?, 0,0,0,0)",
+            (sid,)
+        )
+    else:
+        cur.execute(_SQL_STAFF_ID_BY_USERNAME, (username,))
+        sid = cur.fetchone()["id"]
+    return sid
+
+
 async def ensure_staff(db_path: str, username: str, name: Optional[str] = None) -> int:
     """Ensure a staff record exists; return staff_id."""
     def _fn():
         conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM staff WHERE username = ?", (username,))
-        row = cur.fetchone()
-        if row:
-            sid = row["id"]
-        else:
-            cur.execute(
-                "INSERT INTO staff (username, name) VALUES (?, ?)", (username, name or username)
-            )
-            sid = cur.lastrowid
-            # create initial inventory
-            cur.execute(
-                "INSERT INTO inventory (staff_id, sim, swap, credit_50, credit_100) VALUES (?, 0,0,0,0)",
-                (sid,)
-            )
-        conn.commit()
-        conn.close()
-        return sid
+        try:
+            sid = _ensure_staff_id(conn, db_path, username, name)
+            if conn.in_transaction:
+                conn.commit()
+            return sid
+        finally:
+            conn.close()
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
+
+
+async def prepare_staff(db_path: str, username: str, name: Optional[str] = None, stock: Optional[Dict[str, int]] = None) -> int:
+    """ensure_staff + add_stock for each ``stock`` item in one writer job and transaction; return staff_id."""
+    updates = []
+    for item, qty in (stock or {}).items():
+        col = _map_item_to_column(item)
+        if not col:
+            raise ValueError(f"Unknown stock item: {item}")
+        updates.append((col, qty))
+
+    def _fn():
+        conn = get_connection(db_path)
+        try:
+            sid = _ensure_staff_id(conn, db_path, username, name)
+            for col, qty in updates:
+                conn.execute(_UPDATE_SQL_BY_COL[col], (qty, sid))
+            if conn.in_transaction:
+                conn.commit()
+            return sid
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    return await _run_write(_fn)
 
 
 async def add_backoffice_stock(db_path: str, item: str, qty: int) -> bool:
@@ -385,7 +1043,7 @@ async def add_backoffice_stock(db_path: str, item: str, qty: int) -> bool:
     def _fn():
         conn = get_connection(db_path)
         cur = conn.cursor()
-        cur.execute("SELECT id, quantity FROM backoffice_stock WHERE item = ?", (item,))
+        cur.execute(_SQL_BACKOFFICE_ROW, (item,))
         row = cur.fetchone()
         if row:
             cur.execute("UPDATE backoffice_stock SET quantity = quantity + ? WHERE id = ?", (qty, row[0]))
@@ -401,15 +1059,23 @@ async def add_backoffice_stock(db_path: str, item: str, qty: int) -> bool:
         conn.close()
         return True
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
-async def insert_pickup_list(db_path: str, file_bytes: bytes, filename: str, uploaded_by_username: str) -> dict:
+async def insert_pickup_list(db_path: str, file_bytes: bytes, filename: str, uploaded_by_username: str, rows: Optional[List[Dict[str, Any]]] = None) -> dict:
     """Parse pickup-list Excel bytes and insert into sim_batches.
+    Pass ``rows`` (parse_pickup_excel output) when the caller already parsed the file.
     Returns dict: {inserted: int, duplicates: int, errors: list}
     """
     from utils.excel_utils import parse_pickup_excel
 
+    # parse before queueing so the writer thread only spends time on the INSERT
+    if rows is None:
+        try:
+            rows = await asyncio.to_thread(parse_pickup_excel, file_bytes)
+        except Exception as ex:
+            return {"inserted": 0, "duplicates": 0, "errors": [str(ex)]}
+
     def _fn():
         inserted = 0
         duplicates = 0
@@ -417,21 +1083,17 @@ async def insert_pickup_list(db_path: str, file_bytes: bytes, filename: str, upl
         conn = get_connection(db_path)
         cur = conn.cursor()
         try:
-            rows = parse_pickup_excel(file_bytes)
             # find uploader staff id if possible
-            cur.execute("SELECT id FROM staff WHERE username = ?", (uploaded_by_username,))
-            r = cur.fetchone()
-            staff_id = r[0] if r else None
-            for row in rows:
-                try:
-                    cur.execute("INSERT INTO sim_batches (carton_no, box_no, gsm_number, iccid, type, note) VALUES (?, ?, ?, ?, ?, ?)", (
-                        row.get('carton_no'), row.get('box_no'), row.get('gsm_number'), row.get('iccid'), row.get('type'), filename
-                    ))
-                    inserted += 1
-                except Exception:
-                    # likely duplicate gsm_number due to UNIQUE constraint
-                    duplicates += 1
-                    continue
+            staff_id = _lookup_staff_id(cur, db_path, uploaded_by_username)
+            # one statement for the whole file; OR IGNORE skips GSMs already on record
+            # (UNIQUE gsm_number), and total_changes tells us how many actually landed
+            before = conn.total_changes
+            cur.executemany(
+                "INSERT OR IGNORE INTO sim_batches (carton_no, box_no, gsm_number, iccid, type, note) VALUES (?, ?, ?, ?, ?, ?)",
+                ((row.get('carton_no'), row.get('box_no'), row.get('gsm_number'), row.get('iccid'), row.get('type'), filename) for row in rows),
+            )
+            inserted = conn.total_changes - before
+            duplicates = len(rows) - inserted
             # journal the import
             try:
                 note = f"{filename} uploaded_by:{uploaded_by_username} inserted:{inserted} duplicates:{duplicates}"
@@ -447,7 +1109,7 @@ async def insert_pickup_list(db_path: str, file_bytes: bytes, filename: str, upl
             conn.close()
         return {"inserted": inserted, "duplicates": duplicates, "errors": errors}
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
 async def transfer_sims_by_clause(db_path: str, where_clause: str, params: list, target_location: str, performed_by_username: str) -> dict:
@@ -458,18 +1120,19 @@ async def transfer_sims_by_clause(db_path: str, where_clause: str, params: list,
         conn = get_connection(db_path)
         cur = conn.cursor()
         try:
-            # Select matching sims currently in Backoffice
-            q = f"SELECT id, gsm_number FROM sim_batches WHERE {where_clause} AND current_location = 'Backoffice'"
-            cur.execute(q, params)
-            rows = cur.fetchall()
-            if not rows:
+            # Move every matching SIM still in Backoffice with one statement; RETURNING
+            # hands back the GSMs it touched so no separate SELECT is needed.
+            now = datetime.datetime.now().isoformat()
+            cur.execute(
+                "UPDATE sim_batches SET current_location = ?, status = 'sent', date_sent = ? "
+                f"WHERE ({where_clause}) AND current_location = 'Backoffice' RETURNING gsm_number",
+                [target_location, now, *params],
+            )
+            gsm_list = [r['gsm_number'] for r in cur.fetchall()]
+            if not gsm_list:
+                conn.rollback()
                 conn.close()
                 return {"moved": 0, "gsms": [], "error": "No matching SIMs found in Backoffice"}
-            gsm_list = [r['gsm_number'] for r in rows]
-            # perform updates in transaction
-            cur.execute("BEGIN")
-            now = datetime.datetime.now().isoformat()
-            cur.executemany("UPDATE sim_batches SET current_location = ?, status = ?, date_sent = ? WHERE gsm_number = ?", [ (target_location, 'sent', now, g) for g in gsm_list ])
             # journal: negative for backoffice, positive for target (staff_id if applicable)
             # backoffice negative
             cur.execute(
@@ -483,10 +1146,7 @@ async def transfer_sims_by_clause(db_path: str, where_clause: str, params: list,
             if target_location.startswith('Employee:') or target_location.startswith('Admin:'):
                 try:
                     tname = target_location.split(':',1)[1]
-                    cur.execute("SELECT id FROM staff WHERE username = ?", (tname,))
-                    tr = cur.fetchone()
-                    if tr:
-                        target_staff_id = tr['id']
+                    target_staff_id = _lookup_staff_id(cur, db_path, tname)
                 except Exception:
                     target_staff_id = None
             cur.execute(
@@ -502,62 +1162,86 @@ async def transfer_sims_by_clause(db_path: str, where_clause: str, params: list,
             conn.close()
             raise
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
 async def sim_status(db_path: str, query_type: str, query_value: str) -> dict:
     """Query sim_batches by gsm_number or box_no or carton_no. Returns details or aggregates."""
+    def _fn():
+        # Read-only: the gsm branch's two SELECTs share one snapshot. Closing the
+        # cursor resets its statement before the connection goes back to the pool.
+        with _read_snapshot(db_path) as conn:
+            with contextlib.closing(conn.cursor()) as cur:
+                if query_type == 'gsm':
+                    cur.execute("SELECT * FROM sim_batches WHERE gsm_number = ?", (query_value,))
+                    row = cur.fetchone()
+                    if not row:
+                        return {}
+                    # get recent journal history for SIMs (note column may not exist in older schemas)
+                    res = dict(row)
+                    cur.row_factory = None  # plain tuples, zipped with _HIST_KEYS
+                    cur.execute(_SQL_SIM_HISTORY)
+                    res['history'] = [dict(zip(_HIST_KEYS, h)) for h in cur.fetchall()]
+                    return res
+                elif query_type == 'box':
+                    cur.row_factory = None  # plain (cnt, status) tuples
+                    cur.execute("SELECT COUNT(*) as cnt, status FROM sim_batches WHERE box_no = ? GROUP BY status", (query_value,))
+                    return {status: cnt for cnt, status in cur.fetchall()}
+                elif query_type == 'carton':
+                    cur.row_factory = None  # plain (cnt, status) tuples
+                    cur.execute("SELECT COUNT(*) as cnt, status FROM sim_batches WHERE carton_no = ? GROUP BY status", (query_value,))
+                    return {status: cnt for cnt, status in cur.fetchall()}
+                else:
+                    return {}
+
+    return await asyncio.to_thread(_fn)
+
+
+async def list_backoffice_stock(db_path: str) -> List[BackofficeRow]:
     def _fn():
         conn = get_connection(db_path)
-        cur = conn.cursor()
         try:
-            if query_type == 'gsm':
-                cur.execute("SELECT * FROM sim_batches WHERE gsm_number = ?", (query_value,))
-                row = cur.fetchone()
-                if not row:
-                    return {}
-                # get recent journal history for SIMs (note column may not exist in older schemas)
-                cur.execute("SELECT id, staff_id, item, change_amount, change_type, source, timestamp, source_ref FROM inventory_journal WHERE item = 'SIM' ORDER BY timestamp DESC LIMIT 50")
-                hist = cur.fetchall()
-                res = dict(row)
-                res['history'] = [dict(h) for h in hist]
-                return res
-            elif query_type == 'box':
-                cur.execute("SELECT COUNT(*) as cnt, status FROM sim_batches WHERE box_no = ? GROUP BY status", (query_value,))
-                rows = cur.fetchall()
-                return {r['status']: r['cnt'] for r in rows}
-            elif query_type == 'carton':
-                cur.execute("SELECT COUNT(*) as cnt, status FROM sim_batches WHERE carton_no = ? GROUP BY status", (query_value,))
-                rows = cur.fetchall()
-                return {r['status']: r['cnt'] for r in rows}
-            else:
-                return {}
+            with contextlib.closing(conn.cursor()) as cur:
+                cur.row_factory = None
+                cur.execute("SELECT id, item, quantity FROM backoffice_stock ORDER BY item")
+                return [BackofficeRow(*r) for r in cur.fetchall()]
         finally:
             conn.close()
 
     return await asyncio.to_thread(_fn)
 
 
-async def list_backoffice_stock(db_path: str) -> List[Dict[str, Any]]:
+async def get_backoffice_quantity(db_path: str, item: str) -> int:
     def _fn():
         conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT id, item, quantity FROM backoffice_stock ORDER BY item")
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        try:
+            with contextlib.closing(conn.cursor()) as cur:
+                cur.execute(_SQL_BACKOFFICE_QTY, (item,))
+                return int(cur.fetchone()[0] or 0)
+        finally:
+            conn.close()
 
     return await asyncio.to_thread(_fn)
 
 
-async def get_backoffice_quantity(db_path: str, item: str) -> int:
+async def get_backoffice_quantities(db_path: str, items: List[str]) -> Dict[str, int]:
+    """Backoffice quantity for each of ``items`` in one query; missing items map to 0."""
     def _fn():
+        wanted = list(dict.fromkeys(items))
+        if not wanted:
+            return {}
         conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT quantity FROM backoffice_stock WHERE item = ?", (item,))
-        row = cur.fetchone()
-        conn.close()
-        return int(row[0]) if row else 0
+        try:
+            with contextlib.closing(conn.cursor()) as cur:
+                cur.row_factory = None
+                cur.execute(
+                    f"SELECT item, quantity FROM backoffice_stock WHERE item IN ({','.join('?' * len(wanted))})",
+                    wanted,
+                )
+                found = {item: int(qty or 0) for item, qty in cur.fetchall()}
+        finally:
+            conn.close()
+        return {item: found.get(item, 0) for item in wanted}
 
     return await asyncio.to_thread(_fn)
 
@@ -571,7 +1255,7 @@ async def transfer_backoffice(db_path: str, item: str, qty: int, to_username: st
         cur = conn.cursor()
         try:
             # check backoffice qty
-            cur.execute("SELECT id, quantity FROM backoffice_stock WHERE item = ?", (item,))
+            cur.execute(_SQL_BACKOFFICE_ROW, (item,))
             row = cur.fetchone()
             if not row or int(row[1] or 0) < qty:
                 conn.close()
@@ -584,13 +1268,11 @@ async def transfer_backoffice(db_path: str, item: str, qty: int, to_username: st
 
             # credit to staff inventory: find staff id
             if to_staff_id is None and to_username:
-                cur.execute("SELECT id FROM staff WHERE username = ?", (to_username,))
-                s = cur.fetchone()
-                if not s:
+                to_staff_id_local = _lookup_staff_id(cur, db_path, to_username)
+                if to_staff_id_local is None:
                     conn.rollback()
                     conn.close()
                     return False
-                to_staff_id_local = s[0]
             else:
                 to_staff_id_local = to_staff_id
 
@@ -600,13 +1282,10 @@ async def transfer_backoffice(db_path: str, item: str, qty: int, to_username: st
                 conn.rollback()
                 conn.close()
                 return False
-            cur.execute(f"UPDATE inventory SET {col} = {col} + ? WHERE staff_id = ?", (qty, to_staff_id_local))
+            cur.execute(_UPDATE_SQL_BY_COL[col], (qty, to_staff_id_local))
             # journal positive entry for the staff (reference source as backoffice)
             cur.execute("INSERT INTO inventory_journal (staff_id, item, change_amount, change_type, source) VALUES (?, ?, ?, ?, ?)", (to_staff_id_local, col, int(qty), 'backoffice_transfer', 'backoffice'))
 
-            # update inventory timestamp
-            cur.execute("UPDATE inventory SET updated_at = CURRENT_TIMESTAMP WHERE staff_id = ?", (to_staff_id_local,))
-
             conn.commit()
             conn.close()
             return True
@@ -616,7 +1295,7 @@ async def transfer_backoffice(db_path: str, item: str, qty: int, to_username: st
             logger.exception("transfer_backoffice failed: %s", ex)
             return False
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
 async def insert_sales_and_update_inventory(
@@ -631,76 +1310,22 @@ async def insert_sales_and_update_inventory(
     - Prevents negative stock (will skip sale if stock too low).
     - Saves the Excel 'Number' column properly (case-insensitive).
     """
-    def _fn():
+    def _upload(conn, cur):
         import traceback
-        # Lightweight per-staff-date file lock to prevent concurrent uploads
-        # from interfering with each other. We use atomic file creation (O_EXCL)
-        # to acquire the lock; this works across processes on Windows and Unix.
-        def _lock_path(db_path: str, staff_id: int, report_date: str) -> str:
-            base = os.path.dirname(db_path) or "."
-            lock_dir = os.path.join(base, "locks")
-            try:
-                os.makedirs(lock_dir, exist_ok=True)
-            except Exception:
-                pass
-            # sanitize report_date for filesystem
-            safe_date = report_date.replace('/', '_').replace(':', '_')
-            return os.path.join(lock_dir, f"upload_{staff_id}_{safe_date}.lock")
-
-        def _acquire_lock(lockfile: str, timeout: float = 10.0):
-            start = time.time()
-            while True:
-                try:
-                    # O_CREAT|O_EXCL ensures atomic creation; fails if exists
-                    fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_RDWR)
-                    # write pid/timestamp for debugging
-                    try:
-                        os.write(fd, f"{os.getpid()}:{time.time()}".encode())
-                    except Exception:
-                        pass
-                    return fd
-                except FileExistsError:
-                    if time.time() - start > timeout:
-                        raise TimeoutError(f"Timeout acquiring lock {lockfile}")
-                    time.sleep(0.05)
-
-        def _release_lock(fd: int, lockfile: str):
-            try:
-                if isinstance(fd, int):
-                    try:
-                        os.close(fd)
-                    except Exception:
-                        pass
-                if os.path.exists(lockfile):
-                    try:
-                        os.remove(lockfile)
-                    except Exception:
-                        pass
-            except Exception:
-                pass
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        # Try to acquire per-upload lock to serialize operations for this staff/date
-        lockfd = None
-        lockfile = None
-        try:
-            lockfile = _lock_path(db_path, staff_id, report_date)
-            lockfd = _acquire_lock(lockfile, timeout=15.0)
-        except Exception:
-            # If we can't acquire a lock, abort to avoid racing inventory updates
-            conn.close()
-            raise
-        
-        # CRITICAL: Set isolation level to SERIALIZABLE for maximum safety
-        # This ensures no other transaction can interfere with our last-upload-wins logic
-        cur.execute("PRAGMA read_uncommitted = 0")
-        cur.execute("PRAGMA synchronous = FULL")
+        # The only per-call PRAGMA: an upload is fsynced on commit (reset by _fn).
+        # Isolation needs no PRAGMA; BEGIN IMMEDIATE already serializes writers.
+        if UPLOAD_SYNCHRONOUS != CONNECTION_SYNCHRONOUS:
+            cur.execute(f"PRAGMA synchronous = {UPLOAD_SYNCHRONOUS}")
+        # Take the write lock up front: the whole revert + insert runs as one
+        # transaction, so it never has to upgrade from a read lock halfway through.
+        cur.execute("BEGIN IMMEDIATE")
         
         # --- CRITICAL: ENSURE LAST-UPLOAD-WINS LOGIC IS ATOMIC ---
         # Take a snapshot of starting inventory for verification
-        cur.execute("SELECT sim, swap, credit_50, credit_100 FROM inventory WHERE staff_id = ?", (staff_id,))
+        cur.execute(_SQL_INVENTORY_BY_STAFF, (staff_id,))
         starting_inv = cur.fetchone()
-        logger.info(f"[TRANSACTION START] staff_id={staff_id} starting inventory: {dict(starting_inv) if starting_inv else None}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[TRANSACTION START] staff_id=%s starting inventory: %s", staff_id, dict(starting_inv) if starting_inv else None)
         
         # First check if there are existing sales that need to be reverted
         try:
@@ -709,86 +1334,61 @@ async def insert_sales_and_update_inventory(
             existing_ids = [r['id'] for r in existing]
             
             if existing_ids:
-                logger.info(f"[insert_sales_and_update_inventory] Found {len(existing_ids)} existing sales to revert")
+                logger.info("[insert_sales_and_update_inventory] Found %d existing sales to revert", len(existing_ids))
 
                 # Robust revert: compute counts directly from existing sales rows instead
                 # of relying on inventory_journal which may be missing if journaling failed
                 # previously. This is deterministic and avoids double-adds or misses.
-                cur.execute("SELECT id, item_code, number FROM sales WHERE staff_id = ? AND report_date = ?", (staff_id, report_date))
-                existing_sales = cur.fetchall()
-                # Build counts per inventory column
-                revert_counts = {}
-                for sr in existing_sales:
-                    item_code_raw = sr['item_code'] or ''
-                    item_code = str(item_code_raw).strip().lower()
-                    # SIM/SWAP are counted per row (1 each)
-                    if item_code in ('sim', 'simcard', 'sim_card'):
-                        revert_counts['sim'] = revert_counts.get('sim', 0) + 1
-                    elif item_code == 'swap':
-                        revert_counts['swap'] = revert_counts.get('swap', 0) + 1
-                    elif item_code in ('credit50', 'credit_50', 'credit-50'):
-                        # number stores count for credit rows
-                        try:
-                            revert_counts['credit_50'] = revert_counts.get('credit_50', 0) + int(sr['number'] or 0)
-                        except Exception:
-                            pass
-                    elif item_code in ('credit100', 'credit_100', 'credit-100'):
-                        try:
-                            revert_counts['credit_100'] = revert_counts.get('credit_100', 0) + int(sr['number'] or 0)
-                        except Exception:
-                            pass
-                    else:
-                        # For any other item types that map to a known column, try to parse numeric 'number'
-                        col_guess = _map_item_to_column(item_code)
-                        if col_guess:
-                            try:
-                                revert_counts[col_guess] = revert_counts.get(col_guess, 0) + int(sr['number'] or 0)
-                            except Exception:
-                                # ignore non-numeric
-                                pass
+                # The aggregation runs in SQLite (one row back, whatever the sales count).
+                cur.execute(_SQL_REVERT_COUNTS, (staff_id, report_date))
+                rc = cur.fetchone()
+                revert_counts = {col: int(rc[col] or 0) for col in ('sim', 'swap', 'credit_50', 'credit_100')}
 
                 # CRITICAL: Revert inventory BEFORE deleting sales to maintain data integrity
-                for col, c in revert_counts.items():
-                    if c:
-                        cur.execute(f"UPDATE inventory SET {col} = {col} + ? WHERE staff_id = ?", (int(c), staff_id))
-                        # Record revert in journal referencing the sale ids for traceability
-                        try:
-                            cur.execute(
-                                "INSERT INTO inventory_journal (staff_id, item, change_amount, change_type, source) VALUES (?, ?, ?, ?, ?)",
-                                (staff_id, col, int(c), 'revert', f"delete_sales:{','.join(map(str, existing_ids))}")
-                            )
-                        except Exception:
-                            # journaling is best-effort
-                            pass
-                        logger.info(f"[insert_sales_and_update_inventory] Reverted {c} {col} for staff_id={staff_id}")
+                cur.execute(
+                    "UPDATE inventory SET sim = sim + ?, swap = swap + ?, credit_50 = credit_50 + ?, credit_100 = credit_100 + ? WHERE staff_id = ?",
+                    (revert_counts['sim'], revert_counts['swap'], revert_counts['credit_50'], revert_counts['credit_100'], staff_id),
+                )
+                # Record the revert in the journal referencing the sale ids for traceability
+                revert_source = f"delete_sales:{','.join(map(str, existing_ids))}"
+                revert_journal = [(staff_id, col, c, 'revert', revert_source) for col, c in revert_counts.items() if c]
+                try:
+                    cur.executemany(
+                        "INSERT INTO inventory_journal (staff_id, item, change_amount, change_type, source) VALUES (?, ?, ?, ?, ?)",
+                        revert_journal,
+                    )
+                except Exception:
+                    # journaling is best-effort
+                    pass
+                logger.info("[insert_sales_and_update_inventory] Reverted %s for staff_id=%s", revert_counts, staff_id)
 
                 # Now that inventory is reverted, we can safely delete the old sales
                 cur.execute("DELETE FROM sales WHERE staff_id = ? AND report_date = ?", (staff_id, report_date))
-                logger.info(f"[insert_sales_and_update_inventory] Deleted {len(existing_ids)} old sales")
+                logger.info("[insert_sales_and_update_inventory] Deleted %d old sales", len(existing_ids))
 
                 # Take a snapshot of inventory after revert for verification
-                cur.execute("SELECT sim, swap, credit_50, credit_100 FROM inventory WHERE staff_id = ?", (staff_id,))
+                cur.execute(_SQL_INVENTORY_BY_STAFF, (staff_id,))
                 inv_after_revert = cur.fetchone()
-                logger.info(f"[insert_sales_and_update_inventory] Inventory after revert: {dict(inv_after_revert)}")
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("[insert_sales_and_update_inventory] Inventory after revert: %s", dict(inv_after_revert))
                 
         except Exception as ex:
-            # If ANYTHING fails during the revert process, we must rollback and abort
-            conn.rollback()
-            logger.error(f"[CRITICAL] Failed to revert previous sales: {ex}")
-            conn.close()
+            # If ANYTHING fails during the revert process, abort (_fn rolls back)
+            logger.error("[CRITICAL] Failed to revert previous sales: %s", ex)
             raise Exception("Failed to safely revert previous sales")
         # Get current inventory for the staff
         try:
             cur.execute(
-                "SELECT sim, swap, credit_50, credit_100 FROM inventory WHERE staff_id = ?",
+                _SQL_INVENTORY_BY_STAFF,
                 (staff_id,),
             )
             inv = cur.fetchone()
-            logger.info(f"[insert_sales_and_update_inventory] staff_id={staff_id} inventory snapshot: {dict(inv) if inv else inv}")
-            logger.info(f"[insert_sales_and_update_inventory] entries: {entries}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[insert_sales_and_update_inventory] staff_id=%s inventory snapshot: %s", staff_id, dict(inv) if inv else inv)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[insert_sales_and_update_inventory] entries: %s", entries)
             if not inv:
-                logger.error(f"No inventory found for staff {staff_id}")
-                conn.close()
+                logger.error("No inventory found for staff %s", staff_id)
                 raise ValueError(f"No inventory found for staff {staff_id}")
 
             skipped = []  # to track skipped items/reasons
@@ -803,238 +1403,188 @@ async def insert_sales_and_update_inventory(
                 'credit_50': int(inv['credit_50'] or 0),
                 'credit_100': int(inv['credit_100'] or 0),
             }
-            logger.info(f"[insert_sales_and_update_inventory] initial inv_map: {inv_map}")
+            logger.info("[insert_sales_and_update_inventory] initial inv_map: %s", inv_map)
 
+            # Pass 1 decides every row in Python and collects the writes; pass 2 applies
+            # them with one executemany per table and a single inventory UPDATE.
+            # Sale ids are handed out up front (we hold the write lock via BEGIN IMMEDIATE,
+            # so nobody else can insert) which lets journal rows and credit sub-sales
+            # reference their sale before it is written.
+            cur.execute(
+                "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'sales'), 0), "
+                "COALESCE((SELECT MAX(id) FROM sales), 0))"
+            )
+            next_sale_id = int(cur.fetchone()[0]) + 1
+            sales_rows = []     # (id, staff_id, report_date, item_code, number, contact_number, recharge_amount, notes)
+            journal_rows = []   # (staff_id, item, change_amount, change_type, source, source_ref)
+            sim_marks = []      # (gsm, sale_id)
+            inv_deltas = {'sim': 0, 'swap': 0, 'credit_50': 0, 'credit_100': 0}
+            batch_gsms = set()  # dup_keys of SIM GSMs accepted earlier in this upload (not yet in the DB)
+
+            # Validate and interpret every entry up front; the planning loop below then
+            # only makes stock decisions and cannot fail halfway through a row.
+            parsed = []
             for idx, e in enumerate(entries):
-                try:
-                    item_code = (e.get("item_code") or "").lower()
-                    # robust Number parsing: accept Number/number/NUM, default to 1 if invalid/zero
-                    raw_number = e.get("Number") or e.get("number") or e.get("NUM") or None
-                    try:
-                        if raw_number is None or str(raw_number).strip() == '':
-                            number = 1
-                        else:
-                            number = int(float(str(raw_number).strip()))
-                    except Exception:
-                        number = 1
-                    if number <= 0:
-                        number = 1
-
-                    try:
-                        recharge_amount = float(e.get("recharge_amount") or 0)
-                    except Exception:
-                        recharge_amount = 0.0
-                    notes = e.get("Notes") or e.get("notes") or None
-
-                    # Interpret parsed values:
-                    # - The 'number' column may be either a quantity (e.g. 2) or a GSM/mobile identifier (long number).
-                    #   If it looks like a GSM (all digits and length >= 6) we treat it as an identifier and deduct 1 unit.
-                    #   Otherwise we treat it as a quantity and deduct that many units.
-                    # - credit_50 and credit_100 are explicit integer counts per row and should be deducted accordingly.
-                    raw_number_str = str(raw_number).strip() if raw_number is not None else ''
-                    is_gsm = raw_number_str.isdigit() and len(raw_number_str) >= 6
-                    # default deductions
-                    deduct = 0
-                    store_number = raw_number if raw_number is not None else number
-                    credit50_deduct = int(e.get('credit_50') or 0)
-                    credit100_deduct = int(e.get('credit_100') or 0)
-
-                    if item_code in ("sim", "simcard", "sim_card"):
-                        # If the provided Number looks like a GSM identifier, store it and deduct 1.
-                        # Otherwise treat Number as a quantity and deduct that many SIMs.
-                        if is_gsm:
-                            deduct = 1
-                            store_number = raw_number_str
-                        else:
-                            deduct = int(number)
-                            store_number = number
-                        # Also try to detect GSM in other columns if present
-                        if not is_gsm:
-                            for k, v in e.items():
-                                if not v:
-                                    continue
-                                if str(v).strip().isdigit() and len(str(v).strip()) > 5:
-                                    store_number = str(v).strip()
-                                    break
-                    elif item_code in ("swap",):
-                        if is_gsm:
-                            deduct = 1
-                            store_number = raw_number_str
-                        else:
-                            deduct = int(number)
-                            store_number = number
-                    elif item_code in ("credit50", "credit_50", "credit-50"):
-                        # Deduct credit_50 counts from inventory
-                        deduct = int(credit50_deduct or 0)
-                    elif item_code in ("credit100", "credit_100", "credit-100"):
-                        # Deduct credit_100 counts from inventory
-                        deduct = int(credit100_deduct or 0)
-                    else:
-                        # For other items (like recharge): treat deduct as numeric if present (rare)
-                        try:
-                            deduct = int(number) if int(number) > 0 else 0
-                        except Exception:
-                            deduct = 0
-                        
-                    logger.info(f"[insert_sales_and_update_inventory] Row {idx}: item_code={item_code}, raw_number={raw_number}, store_number={store_number}, deduct={deduct}")
+                row = _parse_sale_entry(e)
+                if row is None:
+                    logger.error("[ERROR] Failed to process row %d: %s", idx, e)
+                else:
+                    parsed.append((idx, row))
+
+            # SIM GSMs already sold by earlier uploads: one IN query per chunk (SQLite caps
+            # bound parameters at 999) instead of one SELECT per row. Numbers are compared
+            # as integers, the way the INTEGER `number` column stores them.
+            candidate_gsms = sorted({row.dup_key for _, row in parsed if row.dup_key is not None})
+            sold_gsms = set()
+            for i in range(0, len(candidate_gsms), _SQL_IN_CHUNK):
+                chunk = candidate_gsms[i:i + _SQL_IN_CHUNK]
+                cur.execute(
+                    f"SELECT number FROM sales WHERE item_code IN ('sim', 'simcard', 'sim_card') AND number IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                sold_gsms.update(int(r[0]) for r in cur.fetchall() if str(r[0]).isdigit())
+
+            for idx, row in parsed:
+                item_code, col, store_number, deduct = row.item_code, row.col, row.store_number, row.deduct
+                logger.debug("[insert_sales_and_update_inventory] Row %d: item_code=%s, store_number=%s, deduct=%s", idx, item_code, store_number, deduct)
+
+                if row.dup_key is not None and (row.dup_key in batch_gsms or row.dup_key in sold_gsms):
+                    skipped.append(f"dup_number:{store_number}")
+                    duplicates_skipped += 1
+                    logger.info("[SKIP] Duplicate sale number: %s (row %d)", store_number, idx)
+                    continue
+
+                if not col:
+                    skipped.append(f"{item_code}(invalid)")
+                    logger.warning("[SKIP] Invalid item_code: %s (row %d)", item_code, idx)
+                    continue
+                available = inv_map.get(col, 0)
+                if available < deduct:
+                    skipped.append(f"{item_code}(insufficient:{available}<{deduct})")
+                    insufficient_skipped += 1
+                    logger.warning("[SKIP] Insufficient stock for %s: %s<%s (row %d)", item_code, available, deduct, idx)
+                    continue
 
-                    logger.info(f"[insert_sales_and_update_inventory] Row {idx}: item_code={item_code}, number={number}, recharge_amount={recharge_amount}, notes={notes}, entry={e}, deduct={deduct}")
+                # Queue the sale row (store the parsed number)
+                sale_id = next_sale_id
+                next_sale_id += 1
+                sales_rows.append((sale_id, staff_id, report_date, item_code, store_number, row.contact_number, row.recharge_amount, row.notes))
+                if row.dup_key is not None:
+                    batch_gsms.add(row.dup_key)
 
-                    # Duplicate check only for SIM items with GSM identifiers (allow SWAP duplicates)
-                    if is_gsm and store_number is not None and str(store_number).strip() != '' and item_code in ("sim", "simcard", "sim_card"):
-                        try:
-                            cur.execute("SELECT 1 FROM sales WHERE number = ? AND item_code IN ('sim', 'simcard', 'sim_card')", (store_number,))
-                            if cur.fetchone():
-                                skipped.append(f"dup_number:{store_number}")
-                                duplicates_skipped += 1
-                                logger.info(f"[SKIP] Duplicate sale number: {store_number} (row {idx})")
-                                continue
-                        except Exception as de:
-                            logger.warning(f"Duplicate check failed for row {idx}: {de}")
-
-                    # Determine inventory column and available quantity
-                    col = _map_item_to_column(item_code)
-                    logger.info(f"[insert_sales_and_update_inventory] Row {idx}: mapped item_code '{item_code}' to column '{col}'")
-                    if not col:
-                        skipped.append(f"{item_code}(invalid)")
-                        logger.warning(f"[SKIP] Invalid item_code: {item_code} (row {idx})")
-                        continue
-                    available = inv_map.get(col, 0)
-                    logger.info(f"[insert_sales_and_update_inventory] Row {idx}: available={available}, deduct={deduct}")
+                # Deduct from the running totals and update in-memory map
+                inv_deltas[col] += deduct
+                inv_map[col] = max(0, available - deduct)
+
+                # record journal entry with source_ref linking to sale id
+                journal_rows.append((staff_id, col, -deduct, 'sale', 'excel', sale_id))
 
-                    if available < deduct:
-                        skipped.append(f"{item_code}(insufficient:{available}<{deduct})")
+                # If the entry includes a GSM, mark sim_batches sold (best-effort, applied in pass 2)
+                if row.gsm_field:
+                    sim_marks.append((row.gsm_field, sale_id))
+
+                # If the row also contains credit_50 / credit_100 counts, deduct them as
+                # separate sales and journal entries (sales row kept for traceability)
+                for credit_col, qty in (('credit_50', row.credit_50), ('credit_100', row.credit_100)):
+                    if qty <= 0:
+                        continue
+                    avail = inv_map.get(credit_col, 0)
+                    if avail < qty:
+                        skipped.append(f"{credit_col}(insufficient:{avail}<{qty})")
                         insufficient_skipped += 1
-                        logger.warning(f"[SKIP] Insufficient stock for {item_code}: {available}<{deduct} (row {idx})")
+                        logger.warning("[SKIP] Insufficient %s for row %d: %s<%s", credit_col, idx, avail, qty)
                         continue
+                    credit_sale_id = next_sale_id
+                    next_sale_id += 1
+                    sales_rows.append((credit_sale_id, staff_id, report_date, credit_col, qty, None, 0.0, f"from_row:{sale_id}"))
+                    inv_deltas[credit_col] += qty
+                    inv_map[credit_col] = max(0, avail - qty)
+                    journal_rows.append((staff_id, credit_col, -qty, 'sale', 'excel', credit_sale_id))
+
+                inserted_count += 1
+
+            # Pass 2: apply the collected writes
+            cur.executemany(
+                """
+                INSERT INTO sales (id, staff_id, report_date, item_code, number, contact_number, recharge_amount, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                sales_rows,
+            )
+            cur.execute(
+                "UPDATE inventory SET sim = sim - ?, swap = swap - ?, credit_50 = credit_50 - ?, credit_100 = credit_100 - ?, "
+                "updated_at = CURRENT_TIMESTAMP WHERE staff_id = ?",
+                (inv_deltas['sim'], inv_deltas['swap'], inv_deltas['credit_50'], inv_deltas['credit_100'], staff_id),
+            )
 
-                    # Insert sale row (store the parsed number)
-                    contact_number_val = e.get('contact_number') or e.get('Contact Number') or e.get('contact') or None
+            # Mark sold SIMs in sim_batches (best-effort): look the GSMs up in chunks, then
+            # one UPDATE for the ones tracked there; their sim_sale journal rows join the batch.
+            mark_gsms = sorted({gsm for gsm, _ in sim_marks})
+            try:
+                tracked = set()
+                for i in range(0, len(mark_gsms), _SQL_IN_CHUNK):
+                    chunk = mark_gsms[i:i + _SQL_IN_CHUNK]
                     cur.execute(
-                        """
-                        INSERT INTO sales (staff_id, report_date, item_code, number, contact_number, recharge_amount, notes)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (staff_id, report_date, item_code, store_number, contact_number_val, recharge_amount, notes),
+                        f"SELECT gsm_number FROM sim_batches WHERE gsm_number IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                    tracked.update(r[0] for r in cur.fetchall())
+                if tracked:
+                    cur.executemany(
+                        "UPDATE sim_batches SET status = 'sold', current_location = 'Sold' WHERE gsm_number = ?",
+                        [(gsm,) for gsm in sorted(tracked)],
+                    )
+                    journal_rows.extend(
+                        (staff_id, 'SIM', -1, 'sim_sale', 'sim_sale', sale_id) for gsm, sale_id in sim_marks if gsm in tracked
                     )
-                    sale_id = cur.lastrowid
-                    logger.info(f"[insert_sales_and_update_inventory] Row {idx}: Inserted sale_id={sale_id}")
+                    logger.debug("[insert_sales_and_update_inventory] Marked %d GSMs sold in sim_batches", len(tracked))
+            except Exception:
+                logger.exception("sim marking failed for GSMs %s", mark_gsms)
 
-                    # Deduct from DB and update in-memory map
-                    cur.execute(f"UPDATE inventory SET {col} = {col} - ? WHERE staff_id = ?", (deduct, staff_id))
-                    inv_map[col] = max(0, inv_map.get(col, 0) - deduct)
-                    logger.info(f"[insert_sales_and_update_inventory] Row {idx}: Updated inventory {col} to {inv_map[col]}")
+            # Every journal row of this upload (sales, credit sub-sales, sim_sale) in one go
+            cur.executemany(
+                "INSERT INTO inventory_journal (staff_id, item, change_amount, change_type, source, source_ref) VALUES (?, ?, ?, ?, ?, ?)",
+                journal_rows,
+            )
+            logger.info(
+                "[insert_sales_and_update_inventory] Wrote %d sales rows, %d journal rows, inventory deltas %s",
+                len(sales_rows), len(journal_rows), inv_deltas,
+            )
 
-                    # record journal entry with source_ref linking to sale id
-                    cur.execute(
-                        "INSERT INTO inventory_journal (staff_id, item, change_amount, change_type, source, source_ref) VALUES (?, ?, ?, ?, ?, ?)",
-                        (staff_id, col, -deduct, 'sale', 'excel', sale_id),
-                    )
-                    logger.info(f"[insert_sales_and_update_inventory] Row {idx}: Journaled inventory change for sale_id={sale_id}")
-
-                    # If the entry includes a GSM, mark sim_batches sold (best-effort)
-                    try:
-                        gsm = None
-                        if e.get('gsm_number'):
-                            gsm = str(e.get('gsm_number')).strip()
-                        else:
-                            for k, v in e.items():
-                                if not v:
-                                    continue
-                                lk = str(k).lower()
-                                if 'gsm' in lk or lk in ('msisdn',):
-                                    gsm = str(v).strip()
-                                    break
-                        if gsm:
-                            cur.execute("SELECT id FROM sim_batches WHERE gsm_number = ?", (gsm,))
-                            sb = cur.fetchone()
-                            if sb:
-                                cur.execute("UPDATE sim_batches SET status = 'sold', current_location = ? WHERE gsm_number = ?", ('Sold', gsm))
-                                try:
-                                    cur.execute("INSERT INTO inventory_journal (staff_id, item, change_amount, change_type, source, source_ref) VALUES (?, ?, ?, ?, ?, ?)", (staff_id, 'SIM', -1, 'sim_sale', 'sim_sale', sale_id))
-                                    logger.info(f"[insert_sales_and_update_inventory] Row {idx}: Journaled sim_sale for GSM {gsm}")
-                                except Exception as je:
-                                    logger.warning(f"Failed to journal sim_sale for GSM {gsm}: {je}")
-                    except Exception as gsm_ex:
-                        logger.exception(f"sim marking failed for entry (row {idx}): {e} - {gsm_ex}")
-
-                    # If the row also contains credit_50 / credit_100 counts, deduct them as separate sales and journal entries
-                    try:
-                        # Process credit 50
-                        if credit50_deduct and int(credit50_deduct) > 0:
-                            c50 = int(credit50_deduct)
-                            avail_c50 = inv_map.get('credit_50', 0)
-                            if avail_c50 < c50:
-                                skipped.append(f"credit_50(insufficient:{avail_c50}<{c50})")
-                                insufficient_skipped += 1
-                                logger.warning(f"[SKIP] Insufficient credit_50 for row {idx}: {avail_c50}<{c50}")
-                            else:
-                                # insert sales row for credit_50 for traceability
-                                cur.execute(
-                                    """
-                                    INSERT INTO sales (staff_id, report_date, item_code, number, contact_number, recharge_amount, notes)
-                                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                                    """,
-                                    (staff_id, report_date, 'credit_50', c50, None, 0.0, f"from_row:{sale_id}"),
-                                )
-                                sale_id_c50 = cur.lastrowid
-                                cur.execute("UPDATE inventory SET credit_50 = credit_50 - ? WHERE staff_id = ?", (c50, staff_id))
-                                inv_map['credit_50'] = max(0, inv_map.get('credit_50', 0) - c50)
-                                cur.execute("INSERT INTO inventory_journal (staff_id, item, change_amount, change_type, source, source_ref) VALUES (?, ?, ?, ?, ?, ?)", (staff_id, 'credit_50', -c50, 'sale', 'excel', sale_id_c50))
-                                logger.info(f"[insert_sales_and_update_inventory] Row {idx}: Deducted credit_50={c50}, new={inv_map['credit_50']}")
-
-                        # Process credit 100
-                        if credit100_deduct and int(credit100_deduct) > 0:
-                            c100 = int(credit100_deduct)
-                            avail_c100 = inv_map.get('credit_100', 0)
-                            if avail_c100 < c100:
-                                skipped.append(f"credit_100(insufficient:{avail_c100}<{c100})")
-                                insufficient_skipped += 1
-                                logger.warning(f"[SKIP] Insufficient credit_100 for row {idx}: {avail_c100}<{c100}")
-                            else:
-                                cur.execute(
-                                    """
-                                    INSERT INTO sales (staff_id, report_date, item_code, number, contact_number, recharge_amount, notes)
-                                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                                    """,
-                                    (staff_id, report_date, 'credit_100', c100, None, 0.0, f"from_row:{sale_id}"),
-                                )
-                                sale_id_c100 = cur.lastrowid
-                                cur.execute("UPDATE inventory SET credit_100 = credit_100 - ? WHERE staff_id = ?", (c100, staff_id))
-                                inv_map['credit_100'] = max(0, inv_map.get('credit_100', 0) - c100)
-                                cur.execute("INSERT INTO inventory_journal (staff_id, item, change_amount, change_type, source, source_ref) VALUES (?, ?, ?, ?, ?, ?)", (staff_id, 'credit_100', -c100, 'sale', 'excel', sale_id_c100))
-                                logger.info(f"[insert_sales_and_update_inventory] Row {idx}: Deducted credit_100={c100}, new={inv_map['credit_100']}")
-                    except Exception as credit_ex:
-                        logger.exception(f"Failed to process credits for row {idx}: {credit_ex}")
-
-                    inserted_count += 1
-                    logger.info(f"[INSERTED] Sale: staff_id={staff_id}, item={item_code}, number={deduct}, recharge={recharge_amount}, notes={notes}, gsm={e.get('gsm_number')}")
-                except Exception as row_ex:
-                    logger.error(f"[ERROR] Failed to process row {idx}: {e}\n{traceback.format_exc()}")
-
-            # Update timestamp
-            cur.execute("UPDATE inventory SET updated_at = CURRENT_TIMESTAMP WHERE staff_id = ?", (staff_id,))
             conn.commit()
-            logger.info(f"Committed {inserted_count} sales for staff {staff_id} (skipped: {skipped}, duplicates_skipped={duplicates_skipped}, insufficient_skipped={insufficient_skipped})")
+            logger.info(
+                "Committed %d sales for staff %s (skipped: %s, duplicates_skipped=%d, insufficient_skipped=%d)",
+                inserted_count, staff_id, skipped, duplicates_skipped, insufficient_skipped,
+            )
 
         except Exception as ex:
-            conn.rollback()
-            logger.error(f"[ROLLBACK] insert_sales_and_update_inventory failed: {ex}\n{traceback.format_exc()} | entries={entries}")
+            logger.error("[ROLLBACK] insert_sales_and_update_inventory failed: %s\n%s", ex, traceback.format_exc())
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[ROLLBACK] insert_sales_and_update_inventory entries: %s", entries)
             raise ex
-        finally:
-            # release lock then close connection
-            try:
-                _release_lock(lockfd, lockfile)
-            except Exception:
-                pass
-            conn.close()
 
         if skipped:
-            logger.warning(f"Skipped sales for staff {staff_id}: {skipped}")
+            logger.warning("Skipped sales for staff %s: %s", staff_id, skipped)
         # return summary for caller
         return {"skipped": skipped, "duplicates_skipped": duplicates_skipped, "insufficient_skipped": insufficient_skipped, "inserted": inserted_count}
 
-    return await asyncio.to_thread(_fn)
+    def _fn():
+        # Concurrent uploads are serialized by SQLite itself: BEGIN IMMEDIATE in _upload
+        # takes the database write lock and other writers wait on busy_timeout.
+        conn = get_connection(db_path)
+        cur = conn.cursor()
+        try:
+            return _upload(conn, cur)
+        finally:
+            # anything from the PRAGMA to the commit may raise (e.g. "database is locked")
+            if conn.in_transaction:
+                conn.rollback()
+            # UPLOAD_SYNCHRONOUS is only for this upload; don't leave it on the pooled connection
+            if UPLOAD_SYNCHRONOUS != CONNECTION_SYNCHRONOUS:
+                cur.execute(f"PRAGMA synchronous = {CONNECTION_SYNCHRONOUS}")
+            conn.close()
+
+    return await _run_write(_fn)
 
 
 
@@ -1042,12 +1592,10 @@ async def remove_stock(db_path: str, staff_username: str, item: str, qty: int) -
     def _fn():
         conn = get_connection(db_path)
         cur = conn.cursor()
-        cur.execute("SELECT id FROM staff WHERE username = ?", (staff_username,))
-        row = cur.fetchone()
-        if not row:
+        sid = _lookup_staff_id(cur, db_path, staff_username)
+        if sid is None:
             conn.close()
             return False
-        sid = row["id"]
         col = _map_item_to_column(item)
         if not col:
             conn.close()
@@ -1059,14 +1607,13 @@ async def remove_stock(db_path: str, staff_username: str, item: str, qty: int) -
         if available < qty:
             conn.close()
             return False
-        cur.execute(f"UPDATE inventory SET {col} = {col} - ? WHERE staff_id = ?", (qty, sid))
-        cur.execute("UPDATE inventory SET updated_at = CURRENT_TIMESTAMP WHERE staff_id = ?", (sid,))
+        cur.execute(_UPDATE_SQL_BY_COL[col], (-qty, sid))
         conn.commit()
         conn.close()
         logger.info("Removed stock: %s -%s from %s", item, qty, staff_username)
         return True
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
 async def add_stock(db_path: str, staff_username: str, item: str, qty: int) -> bool:
@@ -1074,53 +1621,39 @@ async def add_stock(db_path: str, staff_username: str, item: str, qty: int) -> b
     def _fn():
         conn = get_connection(db_path)
         cur = conn.cursor()
-        cur.execute("SELECT id FROM staff WHERE username = ?", (staff_username,))
-        row = cur.fetchone()
-        if not row:
+        sid = _lookup_staff_id(cur, db_path, staff_username)
+        if sid is None:
             conn.close()
             return False
-        sid = row[0]
         col = _map_item_to_column(item)
         if not col:
             conn.close()
             return False
-        cur.execute(f"UPDATE inventory SET {col} = {col} + ? WHERE staff_id = ?", (qty, sid))
-        cur.execute("UPDATE inventory SET updated_at = CURRENT_TIMESTAMP WHERE staff_id = ?", (sid,))
+        cur.execute(_UPDATE_SQL_BY_COL[col], (qty, sid))
         conn.commit()
         conn.close()
         return True
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
 def _map_item_to_column(item: str) -> Optional[str]:
     if not item:
         return None
-    code = item.strip().lower()
-    if code in ("sim", "simcard", "sim_card"):
-        return "sim"
-    if code in ("swap",):
-        return "swap"
-    if code in ("credit50", "credit_50", "credit-50"):
-        return "credit_50"
-    if code in ("credit100", "credit_100", "credit-100"):
-        return "credit_100"
-    return None
+    return _ITEM_CODE_COLUMN.get(item.strip().lower())
 
 
 async def view_stock_by_staff(db_path: str, staff_username: str) -> Optional[Dict[str, Any]]:
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM staff WHERE username = ?", (staff_username,))
-        s = cur.fetchone()
-        if not s:
-            conn.close()
-            return None
-        sid = s["id"]
-        cur.execute("SELECT sim, swap, credit_50, credit_100, updated_at FROM inventory WHERE staff_id = ?", (sid,))
-        inv = cur.fetchone()
-        conn.close()
+        with _read_snapshot(db_path) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id, name FROM staff WHERE username = ?", (staff_username,))
+            s = cur.fetchone()
+            if not s:
+                return None
+            sid = s["id"]
+            cur.execute(_SQL_INVENTORY_ROW_BY_STAFF, (sid,))
+            inv = cur.fetchone()
         if not inv:
             return None
         return {"username": staff_username, "name": s["name"], "sim": inv["sim"], "swap": inv["swap"], "credit_50": inv["credit_50"], "credit_100": inv["credit_100"], "updated_at": inv["updated_at"]}
@@ -1128,14 +1661,12 @@ async def view_stock_by_staff(db_path: str, staff_username: str) -> Optional[Dic
     return await asyncio.to_thread(_fn)
 
 
-async def list_inventory(db_path: str) -> List[Dict[str, Any]]:
+async def list_inventory(db_path: str) -> List[sqlite3.Row]:
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT st.username, st.name, inv.sim, inv.swap, inv.credit_50, inv.credit_100 FROM inventory inv JOIN staff st ON inv.staff_id = st.id")
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT st.username, st.name, inv.sim, inv.swap, inv.credit_50, inv.credit_100 FROM inventory inv JOIN staff st ON inv.staff_id = st.id")
+            return cur.fetchall()
 
     return await asyncio.to_thread(_fn)
 
@@ -1157,14 +1688,15 @@ async def delete_sale(db_path: str, sale_id: int) -> bool:
         # revert inventory by adding back
         col = _map_item_to_column(code)
         if col and num:
-            cur.execute(f"UPDATE inventory SET {col} = {col} + ? WHERE staff_id = ?", (num, staff_id))
-        cur.execute("UPDATE inventory SET updated_at = CURRENT_TIMESTAMP WHERE staff_id = ?", (staff_id,))
+            cur.execute(_UPDATE_SQL_BY_COL[col], (num, staff_id))
+        else:
+            cur.execute("UPDATE inventory SET updated_at = CURRENT_TIMESTAMP WHERE staff_id = ?", (staff_id,))
         conn.commit()
         conn.close()
         logger.info("Deleted sale %s and reverted %s x %s to staff %s", sale_id, num, code, staff_id)
         return True
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
 async def set_admin(db_path: str, staff_username: str, is_admin: bool = True) -> bool:
@@ -1172,40 +1704,49 @@ async def set_admin(db_path: str, staff_username: str, is_admin: bool = True) ->
     def _fn():
         conn = get_connection(db_path)
         cur = conn.cursor()
-        cur.execute("SELECT id FROM staff WHERE username = ?", (staff_username,))
-        row = cur.fetchone()
-        if not row:
+        if _lookup_staff_id(cur, db_path, staff_username) is None:
             conn.close()
             return False
         cur.execute("UPDATE staff SET is_admin = ? WHERE username = ?", (1 if is_admin else 0, staff_username))
         conn.commit()
         conn.close()
+        _ADMIN_CACHE.pop((_pool_key(db_path), staff_username), None)
         logger.info("Set admin=%s for %s", is_admin, staff_username)
         return True
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
 async def get_sales_by_staff_date(db_path: str, staff_username: str, date: Optional[str] = None) -> List[Dict[str, Any]]:
     def _fn():
         d = date or datetime.date.today().isoformat()
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT st.username, sa.id, sa.report_date, sa.item_code, sa.number, sa.recharge_amount, sa.notes FROM sales sa JOIN staff st ON sa.staff_id = st.id WHERE st.username = ? AND sa.report_date = ?", (staff_username, d))
-        rows = cur.fetchall()
-        conn.close()
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT st.username, sa.id, sa.report_date, sa.item_code, sa.number, sa.recharge_amount, sa.notes FROM sales sa JOIN staff st ON sa.staff_id = st.id WHERE st.username = ? AND sa.report_date = ?", (staff_username, d))
+            rows = cur.fetchall()
         return [dict(r) for r in rows]
 
     return await asyncio.to_thread(_fn)
 
 
+async def count_sales_by_staff_date(db_path: str, staff_username: str, date: Optional[str] = None) -> int:
+    """How many sales rows get_sales_by_staff_date would return, counted in SQLite."""
+    def _fn():
+        d = date or datetime.date.today().isoformat()
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM sales sa JOIN staff st ON sa.staff_id = st.id WHERE st.username = ? AND sa.report_date = ?", (staff_username, d))
+            return cur.fetchone()[0]
+
+    return await asyncio.to_thread(_fn)
+
+
 async def get_sale_by_id(db_path: str, sale_id: int) -> Optional[Dict[str, Any]]:
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT sa.id, sa.staff_id, sa.report_date, sa.item_code, sa.number, sa.recharge_amount, st.username FROM sales sa JOIN staff st ON sa.staff_id = st.id WHERE sa.id = ?", (sale_id,))
-        row = cur.fetchone()
-        conn.close()
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT sa.id, sa.staff_id, sa.report_date, sa.item_code, sa.number, sa.recharge_amount, st.username FROM sales sa JOIN staff st ON sa.staff_id = st.id WHERE sa.id = ?", (sale_id,))
+            row = cur.fetchone()
         return dict(row) if row else None
 
     return await asyncio.to_thread(_fn)
@@ -1272,89 +1813,89 @@ async def find_sales_for_number(db_path: str, number: str) -> List[Dict[str, Any
     return await asyncio.to_thread(_fn)
 
 
-async def get_all_sales_by_date_for_shop(db_path: str, date: Optional[str] = None, shop_id: int = None) -> List[Dict[str, Any]]:
+async def get_all_sales_by_date_for_shop(db_path: str, date: Optional[str] = None, shop_id: int = None) -> List[sqlite3.Row]:
     def _fn():
         d = date or datetime.date.today().isoformat()
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        if shop_id is None:
-            cur.execute("SELECT sa.id, st.username as username, st.name as employee, sa.report_date, sa.item_code, sa.number, sa.contact_number, sa.recharge_amount, sa.notes FROM sales sa JOIN staff st ON sa.staff_id = st.id WHERE sa.report_date = ?", (d,))
-        else:
-            cur.execute("SELECT sa.id, st.username as username, st.name as employee, sa.report_date, sa.item_code, sa.number, sa.contact_number, sa.recharge_amount, sa.notes FROM sales sa JOIN staff st ON sa.staff_id = st.id WHERE sa.report_date = ? AND st.shop_id = ?", (d, shop_id))
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            if shop_id is None:
+                cur.execute(_SQL_SALES_BY_DATE, (d,))
+            else:
+                cur.execute(_SQL_SALES_BY_DATE_FOR_SHOP, (d, shop_id))
+            return cur.fetchall()
 
     return await asyncio.to_thread(_fn)
 
 
-async def get_all_sales_by_date(db_path: str, date: Optional[str] = None) -> List[Dict[str, Any]]:
+async def get_all_sales_by_date(db_path: str, date: Optional[str] = None) -> List[sqlite3.Row]:
     def _fn():
         d = date or datetime.date.today().isoformat()
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT sa.id, st.username as username, st.name as employee, sa.report_date, sa.item_code, sa.number, sa.contact_number, sa.recharge_amount, sa.notes FROM sales sa JOIN staff st ON sa.staff_id = st.id WHERE sa.report_date = ?", (d,))
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(_SQL_SALES_BY_DATE, (d,))
+            return cur.fetchall()
 
     return await asyncio.to_thread(_fn)
 
 
 async def inventory_summary(db_path: str) -> Dict[str, int]:
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT SUM(sim) as sim, SUM(swap) as swap, SUM(credit_50) as credit_50, SUM(credit_100) as credit_100 FROM inventory")
-        row = cur.fetchone()
-        conn.close()
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT SUM(sim) as sim, SUM(swap) as swap, SUM(credit_50) as credit_50, SUM(credit_100) as credit_100 FROM inventory")
+            row = cur.fetchone()
         return {"sim": int(row["sim"] or 0), "swap": int(row["swap"] or 0), "credit_50": int(row["credit_50"] or 0), "credit_100": int(row["credit_100"] or 0)}
 
     return await asyncio.to_thread(_fn)
 
 async def transfer_stock(db_path: str, from_username: str, to_username: str, item: str, qty: int) -> bool:
     """Transfer stock from one user to another."""
-    # Get inventories
-    from_inv = await view_stock_by_staff(db_path, from_username)
-    to_inv = await view_stock_by_staff(db_path, to_username)
-
-    if not from_inv or not to_inv:
-        return False  # one of the users not found
-
-    # Check if enough stock in from_inv
     # Normalize item to column name
     col = _map_item_to_column(item)
     if not col:
         logger.warning("transfer_stock: unknown item '%s'", item)
         return False
-
-    # Check availability
-    if int(from_inv.get(col, 0)) < qty:
+    if qty <= 0:
+        # a negative amount would pass the sender check and move stock the other way
+        logger.warning("transfer_stock: non-positive qty %s", qty)
         return False
 
-    # Apply transfer in-memory
-    from_inv[col] = int(from_inv.get(col, 0)) - qty
-    to_inv[col] = int(to_inv.get(col, 0)) + qty
+    def _fn():
+        conn = get_connection(db_path)
+        cur = conn.cursor()
+        try:
+            # Debit only if the sender holds enough stock; rowcount tells us whether it applied,
+            # so there is no read-then-write window for a concurrent transfer to slip into.
+            cur.execute(_TRANSFER_DEBIT_SQL_BY_COL[col], (qty, from_username, qty))
+            if cur.rowcount != 1:
+                conn.rollback()
+                return False
+            cur.execute(_TRANSFER_CREDIT_SQL_BY_COL[col], (qty, to_username))
+            if cur.rowcount != 1:
+                # recipient unknown or has no inventory row
+                conn.rollback()
+                return False
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            logger.exception("Failed to update inventory during transfer")
+            return False
+        finally:
+            conn.close()
+
+    return await _run_write(_fn)
+
 
-    # Update DB (best-effort)
-    try:
-        await update_inventory(db_path, from_username, from_inv)
-        await update_inventory(db_path, to_username, to_inv)
-    except Exception as ex:
-        logger.exception("Failed to update inventory during transfer: %s", ex)
-        return False
-    return True
 async def update_inventory(db_path: str, username: str, new_inv: dict) -> bool:
     """Update the inventory row for a given username."""
     def _fn():
         conn = get_connection(db_path)
         cur = conn.cursor()
-        cur.execute("SELECT id FROM staff WHERE username = ?", (username,))
-        row = cur.fetchone()
-        if not row:
+        sid = _lookup_staff_id(cur, db_path, username)
+        if sid is None:
             conn.close()
             return False
-        sid = row["id"]
         cur.execute(
             "UPDATE inventory SET sim = ?, swap = ?, credit_50 = ?, credit_100 = ?, updated_at = CURRENT_TIMESTAMP WHERE staff_id = ?",
             (int(new_inv.get('sim', 0)), int(new_inv.get('swap', 0)), int(new_inv.get('credit_50', 0)), int(new_inv.get('credit_100', 0)), sid),
@@ -1363,7 +1904,7 @@ async def update_inventory(db_path: str, username: str, new_inv: dict) -> bool:
         conn.close()
         return True
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
 async def get_sales_counts_by_staff_dates(db_path: str, start_date: str, end_date: str) -> list:
@@ -1371,28 +1912,23 @@ async def get_sales_counts_by_staff_dates(db_path: str, start_date: str, end_dat
     Each row: staff_id, username, report_date, sim_count, swap_count, reg_count
     """
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        # build list of dates
-        cur.execute(
-            "SELECT sa.report_date as report_date, st.username as username, "
-            "SUM(CASE WHEN lower(sa.item_code) IN ('sim','simcard','sim_card') THEN 1 ELSE 0 END) as sim_count, "
-            "SUM(CASE WHEN lower(sa.item_code) = 'swap' THEN 1 ELSE 0 END) as swap_count "
-            "FROM sales sa JOIN staff st ON sa.staff_id = st.id "
-            "WHERE sa.report_date BETWEEN ? AND ? "
-            "GROUP BY st.username, sa.report_date "
-            , (start_date, end_date)
-        )
-        rows = cur.fetchall()
-        # also fetch registrations
-        cur.execute("SELECT dr.date as report_date, st.username as username, dr.reg_count FROM daily_regs dr JOIN staff st ON dr.staff_id = st.id WHERE dr.date BETWEEN ? AND ?", (start_date, end_date))
-        reg_rows = cur.fetchall()
-        conn.close()
-        res = [dict(r) for r in rows]
-        regs_map = {(r['username'], r['report_date']): int(r['reg_count'] or 0) for r in reg_rows}
-        for r in res:
-            r['reg_count'] = regs_map.get((r['username'], r['report_date']), 0)
-        return res
+        # Sales are aggregated per staff/date first; the registration count is then
+        # looked up for each of those rows (latest entry wins if a day was saved twice).
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT s.report_date as report_date, st.username as username, s.sim_count, s.swap_count, "
+                "COALESCE((SELECT dr.reg_count FROM daily_regs dr WHERE dr.staff_id = s.staff_id AND dr.date = s.report_date "
+                "ORDER BY dr.id DESC LIMIT 1), 0) as reg_count "
+                "FROM (SELECT staff_id, report_date, "
+                "SUM(CASE WHEN lower(item_code) IN ('sim','simcard','sim_card') THEN 1 ELSE 0 END) as sim_count, "
+                "SUM(CASE WHEN lower(item_code) = 'swap' THEN 1 ELSE 0 END) as swap_count "
+                "FROM sales WHERE report_date BETWEEN ? AND ? GROUP BY staff_id, report_date) s "
+                "JOIN staff st ON s.staff_id = st.id"
+                , (start_date, end_date)
+            )
+            rows = cur.fetchall()
+        return [dict(r) for r in rows]
 
     return await asyncio.to_thread(_fn)
 
@@ -1400,11 +1936,10 @@ async def get_sales_counts_by_staff_dates(db_path: str, start_date: str, end_dat
 async def get_staff_by_username(db_path: str, username: str) -> Optional[Dict[str, Any]]:
     """Return staff row as dict or None."""
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT id, username, name, is_admin, chat_id FROM staff WHERE username = ?", (username,))
-        row = cur.fetchone()
-        conn.close()
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id, username, name, is_admin, chat_id FROM staff WHERE username = ?", (username,))
+            row = cur.fetchone()
         if not row:
             return None
         return dict(row)
@@ -1417,8 +1952,7 @@ async def set_staff_chat_id(db_path: str, username: str, chat_id: str) -> bool:
     def _fn():
         conn = get_connection(db_path)
         cur = conn.cursor()
-        cur.execute("SELECT id FROM staff WHERE username = ?", (username,))
-        if not cur.fetchone():
+        if _lookup_staff_id(cur, db_path, username) is None:
             conn.close()
             return False
         cur.execute("UPDATE staff SET chat_id = ? WHERE username = ?", (str(chat_id), username))
@@ -1426,18 +1960,16 @@ async def set_staff_chat_id(db_path: str, username: str, chat_id: str) -> bool:
         conn.close()
         return True
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
 async def get_all_admin_chat_ids(db_path: str) -> List[str]:
     """Return list of chat_ids for all admin users (non-empty chat_id)."""
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT chat_id FROM staff WHERE is_admin = 1 AND chat_id IS NOT NULL AND chat_id != ''")
-        rows = cur.fetchall()
-        conn.close()
-        return [r[0] for r in rows if r[0]]
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT chat_id FROM staff WHERE is_admin = 1 AND chat_id IS NOT NULL AND chat_id != ''")
+            return [r[0] for r in cur if r[0]]
 
     return await asyncio.to_thread(_fn)
 
@@ -1447,45 +1979,55 @@ async def delete_sales_for_staff_date(db_path: str, staff_id: int, report_date:
     def _fn():
         conn = get_connection(db_path)
         cur = conn.cursor()
-        # precise revert: find sales ids for the staff/date and sum journal entries linked to those sale ids
-        cur.execute("SELECT id, item_code FROM sales WHERE staff_id = ? AND report_date = ?", (staff_id, report_date))
-        sale_rows = cur.fetchall()
-        sale_ids = [r['id'] for r in sale_rows]
+        cur.row_factory = None
+        # precise revert: sum the journal entries linked to the staff/date's sale ids
+        cur.execute("SELECT id FROM sales WHERE staff_id = ? AND report_date = ?", (staff_id, report_date))
+        sale_ids = [r[0] for r in cur.fetchall()]
+        counts = dict.fromkeys(_INVENTORY_COLUMNS, 0)
+        total = 0
         if sale_ids:
-            # sum journal entries grouped by item where source_ref in sale_ids
-            q = f"SELECT item, SUM(change_amount) as s FROM inventory_journal WHERE source_ref IN ({','.join('?' for _ in sale_ids)}) GROUP BY item"
-            cur.execute(q, sale_ids)
-            rows = cur.fetchall()
-            counts = {r['item']: int(-r['s']) for r in rows}  # journal change_amount are negative for sales
-        else:
-            counts = {}
+            cur.execute(
+                "SELECT item, SUM(change_amount) FROM inventory_journal "
+                "WHERE source_ref IN (SELECT id FROM sales WHERE staff_id = ? AND report_date = ?) GROUP BY item",
+                (staff_id, report_date),
+            )
+            for item, s in cur.fetchall():
+                c = int(-(s or 0))  # journal change_amount are negative for sales
+                total += c
+                col = _map_item_to_column(item or "")
+                if col:
+                    counts[col] += c
 
         # delete sales
         cur.execute("DELETE FROM sales WHERE staff_id = ? AND report_date = ?", (staff_id, report_date))
 
-        # revert inventory counts and write revert journal entries linked to the original sale ids
-        for code, c in counts.items():
-            col = _map_item_to_column(code or "")
-            if col and c:
-                cur.execute(f"UPDATE inventory SET {col} = {col} + ? WHERE staff_id = ?", (c, staff_id))
-                # record a revert journal entry; source_ref left NULL but change_type='revert' and source lists sale ids
-                cur.execute("INSERT INTO inventory_journal (staff_id, item, change_amount, change_type, source) VALUES (?, ?, ?, ?, ?)", (staff_id, col, int(c), 'revert', f"delete_sales:{','.join(map(str, sale_ids))}"))
+        # revert inventory counts in one UPDATE and write revert journal entries listing the sale ids
+        if any(counts.values()):
+            cur.execute(
+                "UPDATE inventory SET sim = sim + ?, swap = swap + ?, credit_50 = credit_50 + ?, credit_100 = credit_100 + ?, "
+                "updated_at = CURRENT_TIMESTAMP WHERE staff_id = ?",
+                (counts['sim'], counts['swap'], counts['credit_50'], counts['credit_100'], staff_id),
+            )
+            # source_ref left NULL but change_type='revert' and source lists sale ids
+            revert_source = f"delete_sales:{','.join(map(str, sale_ids))}"
+            cur.executemany(
+                "INSERT INTO inventory_journal (staff_id, item, change_amount, change_type, source) VALUES (?, ?, ?, ?, ?)",
+                [(staff_id, col, c, 'revert', revert_source) for col, c in counts.items() if c],
+            )
         conn.commit()
         conn.close()
-        return sum(counts.values())
+        return total
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
 async def get_all_staff_chat_ids(db_path: str) -> List[str]:
     """Return list of chat_ids for all staff who have chat_id set."""
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT chat_id FROM staff WHERE chat_id IS NOT NULL AND chat_id != ''")
-        rows = cur.fetchall()
-        conn.close()
-        return [r[0] for r in rows if r[0]]
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT chat_id FROM staff WHERE chat_id IS NOT NULL AND chat_id != ''")
+            return [r[0] for r in cur if r[0]]
 
     return await asyncio.to_thread(_fn)
 
@@ -1493,162 +2035,199 @@ async def get_all_staff_chat_ids(db_path: str) -> List[str]:
 async def insert_daily_regs(db_path: str, staff_id: int, date: str, reg_count: int) -> bool:
     """Insert or update daily_regs for a staff/date (keep only one row per staff/date)."""
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        # Enforce last-upload-wins: remove any existing rows for this staff/date
-        cur.execute("DELETE FROM daily_regs WHERE staff_id = ? AND date = ?", (staff_id, date))
-        # Insert a fresh row so created_at reflects the latest upload
-        cur.execute("INSERT INTO daily_regs (staff_id, date, reg_count) VALUES (?, ?, ?)", (staff_id, date, reg_count))
-        conn.commit()
-        conn.close()
-        return True
+        with _borrow(db_path) as conn:
+            conn.execute(_SQL_UPSERT_DAILY_REGS, (staff_id, date, reg_count))
+            conn.commit()
+            return True
+
+    return await _run_write(_fn)
 
-    return await asyncio.to_thread(_fn)
+
+async def insert_daily_regs_bulk(db_path: str, rows: List[Tuple[int, str, int]]) -> int:
+    """Upsert many (staff_id, date, reg_count) rows in one transaction; returns the row count."""
+    rows = list(rows)
+
+    def _fn():
+        with _borrow(db_path) as conn:
+            conn.executemany(_SQL_UPSERT_DAILY_REGS, rows)
+            conn.commit()
+            return len(rows)
+
+    return await _run_write(_fn)
 
 
 async def get_regs_between(db_path: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
     """Return aggregated registrations per staff between two dates (inclusive)."""
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT dr.staff_id, st.username, st.name, SUM(dr.reg_count) as total_regs FROM daily_regs dr JOIN staff st ON dr.staff_id = st.id WHERE dr.date BETWEEN ? AND ? GROUP BY dr.staff_id", (start_date, end_date))
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            # covering-index scan of daily_regs only; names come from _staff_names
+            cur.execute("SELECT staff_id, SUM(reg_count) FROM daily_regs WHERE date BETWEEN ? AND ? GROUP BY staff_id", (start_date, end_date))
+            totals = cur.fetchall()
+            names = _staff_names(cur, db_path, [sid for sid, _ in totals])
+        return [
+            {"staff_id": sid, "username": names[sid][0], "name": names[sid][1], "total_regs": total}
+            for sid, total in totals
+            if sid in names
+        ]
 
     return await asyncio.to_thread(_fn)
 
 
 async def borrow_add(db_path: str, admin_id: str, person_name: str, amount: float, date: str = None, note: str = None) -> bool:
+    # No str()/float() here: the TEXT and REAL column affinities convert ints and
+    # numeric strings on insert and in the admin_id comparisons below.
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        d = date or datetime.date.today().isoformat()
-        cur.execute("INSERT INTO borrow_list (admin_id, person_name, amount, date, note) VALUES (?, ?, ?, ?, ?)", (str(admin_id), person_name, float(amount), d, note))
-        conn.commit()
-        conn.close()
-        return True
+        with _borrow(db_path) as conn:
+            cur = conn.cursor()
+            d = date or datetime.date.today().isoformat()
+            cur.execute("INSERT INTO borrow_list (admin_id, person_name, amount, date, note) VALUES (?, ?, ?, ?, ?)", (admin_id, person_name, amount, d, note))
+            conn.commit()
+            return True
 
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
-async def borrow_list_for_admin(db_path: str, admin_id: str) -> List[Dict[str, Any]]:
+async def borrow_list_for_admin(db_path: str, admin_id: str) -> List[sqlite3.Row]:
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT id, person_name, amount, date, note FROM borrow_list WHERE admin_id = ? ORDER BY date DESC", (str(admin_id),))
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id, person_name, amount, date, note FROM borrow_list WHERE admin_id = ? ORDER BY date DESC", (admin_id,))
+            return cur.fetchall()
 
     return await asyncio.to_thread(_fn)
 
 
-async def borrow_summary(db_path: str, admin_id: str, start_date: str = None, end_date: str = None) -> List[Dict[str, Any]]:
+async def borrow_summary(db_path: str, admin_id: str, start_date: str = None, end_date: str = None) -> List[sqlite3.Row]:
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        if start_date and end_date:
-            cur.execute("SELECT person_name, SUM(amount) as total FROM borrow_list WHERE admin_id = ? AND date BETWEEN ? AND ? GROUP BY person_name", (str(admin_id), start_date, end_date))
-        else:
-            cur.execute("SELECT person_name, SUM(amount) as total FROM borrow_list WHERE admin_id = ? GROUP BY person_name", (str(admin_id),))
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            if start_date and end_date:
+                cur.execute("SELECT person_name, SUM(amount) as total FROM borrow_list WHERE admin_id = ? AND date BETWEEN ? AND ? GROUP BY person_name", (admin_id, start_date, end_date))
+            else:
+                cur.execute("SELECT person_name, SUM(amount) as total FROM borrow_list WHERE admin_id = ? GROUP BY person_name", (admin_id,))
+            return cur.fetchall()
 
     return await asyncio.to_thread(_fn)
 async def insert_daily_total(db_path: str, date: str, shop_id: Optional[int], total_amount: float) -> bool:
     """Insert a daily total row for a given shop/date. shop_id may be None for grand totals.
-    Uses "last upload wins" - deletes any existing rows for same date/shop_id first.
+    Uses "last upload wins" - replaces any existing row for the same date/shop_id.
     """
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        try:
-            # First delete any existing rows for same date/shop_id
-            if shop_id is not None:
-                cur.execute("DELETE FROM daily_totals WHERE date = ? AND shop_id = ?", (date, shop_id))
-            else:
-                cur.execute("DELETE FROM daily_totals WHERE date = ? AND shop_id IS NULL", (date,))
-
-            # Insert new total row
-            cur.execute(
-                "INSERT INTO daily_totals (date, shop_id, total_amount) VALUES (?, ?, ?)",
-                (date, shop_id, float(total_amount)),
+        # on error the connection is rolled back as it goes back to the pool
+        with _borrow(db_path) as conn:
+            # Replace any existing total for the same date/shop_id
+            conn.execute(
+                _SQL_UPSERT_DAILY_TOTAL_NOSHOP if shop_id is None else _SQL_UPSERT_DAILY_TOTAL_SHOP,
+                (date, shop_id, total_amount),
             )
             conn.commit()
-            conn.close()
             return True
-        except Exception:
-            conn.rollback()
-            conn.close()
-            raise
-    return await asyncio.to_thread(_fn)
+    return await _run_write(_fn)
 
 
-async def get_daily_totals(db_path: str, date: Optional[str] = None, shop_id: Optional[int] = None) -> List[Dict[str, Any]]:
+async def get_daily_totals(db_path: str, date: Optional[str] = None, shop_id: Optional[int] = None) -> List[sqlite3.Row]:
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        if date and shop_id is not None:
-            cur.execute("SELECT * FROM daily_totals WHERE date = ? AND shop_id = ?", (date, shop_id))
-        elif date:
-            cur.execute("SELECT * FROM daily_totals WHERE date = ?", (date,))
-        elif shop_id is not None:
-            cur.execute("SELECT * FROM daily_totals WHERE shop_id = ?", (shop_id,))
-        else:
-            cur.execute("SELECT * FROM daily_totals")
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            if date and shop_id is not None:
+                cur.execute(f"SELECT {_DAILY_TOTALS_COLS} FROM daily_totals WHERE date = ? AND shop_id = ?", (date, shop_id))
+            elif date:
+                cur.execute(f"SELECT {_DAILY_TOTALS_COLS} FROM daily_totals WHERE date = ?", (date,))
+            elif shop_id is not None:
+                cur.execute(f"SELECT {_DAILY_TOTALS_COLS} FROM daily_totals WHERE shop_id = ?", (shop_id,))
+            else:
+                cur.execute(f"SELECT {_DAILY_TOTALS_COLS} FROM daily_totals")
+            return cur.fetchall()
     return await asyncio.to_thread(_fn)
 async def is_admin_by_username(db_path: str, username: str) -> bool:
-    """Check if a staff member has admin privileges."""
+    """Check if a staff member has admin privileges (cached for ADMIN_CACHE_TTL seconds)."""
+    key = None if db_path == ":memory:" else (_pool_key(db_path), username)
+    hit = _ADMIN_CACHE.get(key) if key else None
+    if hit is not None and time.monotonic() - hit[0] < ADMIN_CACHE_TTL:
+        return hit[1]
+
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT is_admin FROM staff WHERE username = ?", (username,))
-        row = cur.fetchone()
-        conn.close()
-        return bool(row and row["is_admin"])
-    
-    return await asyncio.to_thread(_fn)
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(_SQL_STAFF_IS_ADMIN, (username,))
+            row = cur.fetchone()
+            return bool(row and row["is_admin"])
+
+    result = await asyncio.to_thread(_fn)
+    if key:
+        if len(_ADMIN_CACHE) >= _STAFF_ID_CACHE_MAX:
+            _ADMIN_CACHE.clear()
+        _ADMIN_CACHE[key] = (time.monotonic(), result)
+    return result
 async def get_inventory(db_path: str, staff_id: int) -> dict:
     """Get inventory by staff_id."""
     def _fn():
-        conn = get_connection(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT sim, swap, credit_50, credit_100, updated_at FROM inventory WHERE staff_id = ?", (staff_id,))
-        row = cur.fetchone()
-        conn.close()
-        if not row:
-            return {"sim": 0, "swap": 0, "credit_50": 0, "credit_100": 0, "updated_at": None}
-        return dict(row)
+        with _borrow(db_path, readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(_SQL_INVENTORY_ROW_BY_STAFF, (staff_id,))
+            row = cur.fetchone()
+            if not row:
+                return {"sim": 0, "swap": 0, "credit_50": 0, "credit_100": 0, "updated_at": None}
+            return dict(row)
     return await asyncio.to_thread(_fn)
-import pandas as pd
 
-async def daily_recharge_report(db_path: str, date: str = None) -> str:
-    """Generate an Excel file for all sales on a given date."""
+
+_SQL_RECHARGE_ROWS = """
+    SELECT st.username, st.name, sa.item_code, sa.number, sa.recharge_amount, sa.notes
+    FROM sales sa
+    JOIN staff st ON sa.staff_id = st.id
+    WHERE sa.report_date = ?
+"""
+_SQL_RECHARGE_SUMMARY = """
+    SELECT st.username, st.name, sa.item_code, COUNT(*) AS qty, SUM(sa.recharge_amount) AS total
+    FROM sales sa
+    JOIN staff st ON sa.staff_id = st.id
+    WHERE sa.report_date = ?
+    GROUP BY sa.staff_id, sa.item_code
+    ORDER BY st.username, sa.item_code
+"""
+
+
+async def daily_recharge_report(db_path: str, date: str = None, aggregate: bool = False) -> str:
+    """Generate an Excel file for all sales on a given date.
+
+    With ``aggregate`` the file holds one row per staff/item_code (quantity and
+    recharge total, summed by SQLite) instead of every sale.
+    """
     from pathlib import Path
+    import openpyxl
 
     date = date or datetime.date.today().isoformat()
-    conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT st.username, st.name, sa.item_code, sa.number, sa.recharge_amount, sa.notes
-        FROM sales sa
-        JOIN staff st ON sa.staff_id = st.id
-        WHERE sa.report_date = ?
-    """, (date,))
-    rows = cur.fetchall()
-    conn.close()
-
-    if not rows:
-        raise ValueError(f"No sales found for {date}")
-
-    df = pd.DataFrame([dict(r) for r in rows])
-    output_dir = Path("reports")
-    output_dir.mkdir(exist_ok=True)
-    path = output_dir / f"recharge_report_{date}.xlsx"
-    df.to_excel(path, index=False)
-    return str(path)
+
+    def _fn():
+        with _read_snapshot(db_path) as conn:
+            cur = conn.cursor()
+            # plain tuples of native ints/floats/strs: what ws.append takes as-is
+            cur.row_factory = None
+            cur.arraysize = 1000
+            cur.execute(_SQL_RECHARGE_SUMMARY if aggregate else _SQL_RECHARGE_ROWS, (date,))
+            rows = cur.fetchmany()
+            if not rows:
+                raise ValueError(f"No sales found for {date}")
+
+            # Stream batches straight into a write-only sheet; no DataFrame in between.
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet("Sheet1")
+            append = ws.append
+            append([d[0] for d in cur.description])
+            while rows:
+                for r in rows:
+                    append(r)
+                rows = cur.fetchmany()
+
+        output_dir = Path("reports")
+        output_dir.mkdir(exist_ok=True)
+        path = output_dir / f"{'recharge_summary' if aggregate else 'recharge_report'}_{date}.xlsx"
+        # reports for the same date may overlap in the thread pool; publish atomically
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        wb.save(tmp_path)
+        os.replace(tmp_path, path)
+        return str(path)
+
+    return await asyncio.to_thread(_fn)
@@ -15,6 +15,9 @@ def setup_logging() -> None:
         level=logging.INFO,
         format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
     )
+    # The format above never uses thread/process fields; skip collecting them.
+    logging.logThreads = False
+    logging.logProcesses = False
 
 
 def main(start_bot: bool = True) -> None:
@@ -25,35 +28,47 @@ def main(start_bot: bool = True) -> None:
     setup_logging()
     logger = logging.getLogger(__name__)
 
-    # Initialize database (run the synchronous initializer which calls async DB init)
+    # No nest_asyncio: the bot owns its loop, so refuse to start inside another one
+    # (e.g. a notebook or IDE console) instead of patching that loop.
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError("main() must be called outside a running event loop; run `python main.py`.")
+
+    # One event loop for DB init, bot construction and polling; run_polling() picks
+    # up the current loop and closes it on shutdown.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
     db_path = os.getenv("DB_PATH", "teleshop.db")
     logger.info("Initializing database: %s", db_path)
-    asyncio.run(init_db(db_path))
+    try:
+        loop.run_until_complete(init_db(db_path))
+    except BaseException:
+        loop.close()
+        raise
 
     # If user requested no bot start (dry-run), exit after DB init
     if not start_bot:
         logger.info("Dry-run complete: DB initialized, exiting without starting bot.")
+        loop.close()
         return
 
-    # Initialize bot (init_bot is async so run it via asyncio.run)
     token = os.getenv("TELEGRAM_TOKEN")
     if not token:
         logger.warning("TELEGRAM_TOKEN not set. Bot will not start. Set TELEGRAM_TOKEN in .env or environment.")
+        loop.close()
         return
 
-    # Build the Application instance using its async initializer but run the polling in the
-    # synchronous context so Application.run_polling() can manage the loop lifecycle itself.
-    app = asyncio.run(init_bot())
-    logger.info("Bot starting polling. Press Ctrl+C to stop.")
-    # Ensure there is an event loop set in this thread; some Python versions
-    # raise if no loop is present when libraries call asyncio.get_event_loop().
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    except Exception:
-        # If we can't set a new loop, continue and let the library handle it.
-        pass
-    # run_polling is a blocking call that handles loop setup/teardown internally.
+        app = loop.run_until_complete(init_bot())
+    except BaseException:
+        loop.close()
+        raise
+    logger.info("Bot starting polling. Press Ctrl+C to stop.")
+    # run_polling is a blocking call that handles initialization/shutdown internally.
     app.run_polling()
 
 
@@ -1,6 +1,117 @@
 import sys
 import os
+import io
+import asyncio
+import sqlite3
+import itertools
+import functools
+
+import openpyxl
+import pandas as pd
+import pytest
+
 # Ensure project root is on sys.path so tests can import package modules like `db` and `utils`
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+_memory_db_ids = itertools.count()
+
+
+@pytest.fixture
+def memory_db():
+    """Path of a fresh shared in-memory database, dropped after the test."""
+    from db import models
+
+    db_path = f"file:pytest_mem_{next(_memory_db_ids)}?mode=memory&cache=shared"
+    yield db_path
+    models.close_connections(db_path)
+
+
+@functools.lru_cache(maxsize=64)
+def _xlsx_for(header: tuple, rows: tuple) -> bytes:
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(header)
+    for row in rows:
+        ws.append([v for v, _ in row])
+    bio = io.BytesIO()
+    wb.save(bio)
+    return bio.getvalue()
+
+
+def _df_to_xlsx_bytes(df: pd.DataFrame) -> bytes:
+    """xlsx bytes for ``df`` (header row + values, no index), like ``df.to_excel``
+    but through a write-only workbook: no styles or dimension tracking.
+    Identical frames (NaN read as None) reuse the bytes built the first time."""
+    header = tuple(str(c) for c in df.columns)
+    # cells carry their type so 1, 1.0 and True (equal as dict keys) stay distinct
+    rows = tuple(
+        tuple((None, None) if pd.isna(v) else (v, type(v)) for v in row)
+        for row in df.itertuples(index=False, name=None)
+    )
+    return _xlsx_for(header, rows)
+
+
+@pytest.fixture
+def xlsx_bytes():
+    """Callable turning a DataFrame into uploaded-Excel bytes."""
+    return _df_to_xlsx_bytes
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _fast_commits():
+    """Test databases are throwaway: no fsync on commits, uploads included."""
+    from db import models
+
+    saved = models.CONNECTION_SYNCHRONOUS, models.UPLOAD_SYNCHRONOUS
+    models.CONNECTION_SYNCHRONOUS = models.UPLOAD_SYNCHRONOUS = "OFF"
+    yield
+    models.CONNECTION_SYNCHRONOUS, models.UPLOAD_SYNCHRONOUS = saved
+
+
+@pytest.fixture(scope="session")
+def _session_db(tmp_path_factory):
+    from db import models
+
+    path = str(tmp_path_factory.mktemp("db") / "shared.db")
+    asyncio.run(models.init_db(path))
+    yield path
+    models.close_connections(path)
+
+
+@pytest.fixture
+def db_path(_session_db):
+    """The session's database (init_db runs once), emptied before each test."""
+    from db import models
+
+    conn = sqlite3.connect(_session_db)
+    try:
+        tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        # foreign_keys is off on this plain connection, so table order doesn't matter
+        conn.executescript("PRAGMA synchronous = OFF;\n" + "".join(f"DELETE FROM {t};\n" for t in tables) + "DELETE FROM sqlite_sequence;")
+    finally:
+        conn.close()
+    # drop pooled connections and the id/name caches that still describe the old rows
+    models.close_connections(_session_db)
+    return _session_db
+
+
+@pytest.fixture
+def db_conn(db_path):
+    """Pooled read-write connection to ``db_path`` for seeding and inspecting rows
+    (commit before handing control back to the models writers)."""
+    from db import models
+
+    conn = models.get_connection(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def ro_conn(db_path):
+    """Read-only connection to ``db_path`` for asserting on stored rows."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
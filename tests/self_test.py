@@ -44,11 +44,12 @@ async def run_test():
     inv = await models.get_inventory(db_path, staff_id)
     print("Inventory after upload:", inv)
 
-    # cleanup
-    try:
-        os.remove(db_path)
-    except Exception:
-        pass
+    # cleanup (the database and init_db's schema stamp)
+    for p in (db_path, db_path + ".schema_stamp"):
+        try:
+            os.remove(p)
+        except Exception:
+            pass
 
 
 if __name__ == "__main__":
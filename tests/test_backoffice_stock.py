@@ -1,19 +1,17 @@
-import os
 import asyncio
 from db import models
 
-DB_PATH = "test_db_backoffice.db"
+# Shared in-memory database: lives until close_connections() in teardown
+DB_PATH = "file:test_db_backoffice?mode=memory&cache=shared"
 
 
 def setup_module(module):
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    models.close_connections(DB_PATH)
     asyncio.run(models.init_db(DB_PATH))
 
 
 def teardown_module(module):
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    models.close_connections(DB_PATH)
 
 
 def test_backoffice_add_and_transfer():
@@ -34,6 +32,9 @@ def test_backoffice_add_and_transfer():
     # backoffice reduced
     qty2 = asyncio.run(models.get_backoffice_quantity(db, "sim"))
     assert qty2 == qty - 5
+    assert asyncio.run(models.get_backoffice_quantities(db, ["sim", "swap"])) == {"sim": qty2, "swap": 0}
+    listed = asyncio.run(models.list_backoffice_stock(db))
+    assert [(r.item, r.quantity) for r in listed] == [("sim", qty2)]
     # journal entries exist
     conn = models.get_connection(db)
     cur = conn.cursor()
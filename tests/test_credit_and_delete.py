@@ -1,22 +1,20 @@
-import os
 import asyncio
 import pandas as pd
 import io
 
 from db import models
 
-DB_PATH = "test_db_credit.db"
+# Shared in-memory database: lives until close_connections() in teardown
+DB_PATH = "file:test_db_credit?mode=memory&cache=shared"
 
 
 def setup_module(module):
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    models.close_connections(DB_PATH)
     asyncio.run(models.init_db(DB_PATH))
 
 
 def teardown_module(module):
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    models.close_connections(DB_PATH)
 
 
 async def _prepare_staff_and_inventory():
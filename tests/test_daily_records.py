@@ -10,9 +10,9 @@ from datetime import datetime, timedelta
 from db import models
 
 
-def test_daily_totals_last_upload_wins(tmp_path):
+def test_daily_totals_last_upload_wins(memory_db):
     async def _run():
-        db_path = str(tmp_path / "test.db")
+        db_path = memory_db
         await models.init_db(db_path)
 
         date = "2025-10-25"
@@ -48,9 +48,9 @@ def test_daily_totals_last_upload_wins(tmp_path):
     asyncio.run(_run())
 
 
-def test_daily_regs_last_upload_wins(tmp_path):
+def test_daily_regs_last_upload_wins(memory_db):
     async def _run():
-        db_path = str(tmp_path / "test.db")
+        db_path = memory_db
         await models.init_db(db_path)
 
         staff_id = await models.ensure_staff(db_path, "testuser", "Test User")
@@ -93,3 +93,62 @@ def test_daily_regs_last_upload_wins(tmp_path):
 
     asyncio.run(_run())
 
+
+
+def test_init_db_keeps_newest_duplicate_before_adding_unique_indexes(memory_db):
+    async def _run():
+        db_path = memory_db
+        await models.init_db(db_path)
+        staff_id = await models.ensure_staff(db_path, "legacy", "Legacy")
+
+        # Simulate a database written before the unique indexes existed
+        conn = models.get_connection(db_path)
+        for name, _ in models.INDEX_MIGRATIONS:
+            conn.execute(f"DROP INDEX {name}")
+        conn.executemany(
+            "INSERT INTO daily_regs (staff_id, date, reg_count) VALUES (?, ?, ?)",
+            [(staff_id, "2025-10-25", 1), (staff_id, "2025-10-25", 2)],
+        )
+        conn.executemany(
+            "INSERT INTO daily_totals (date, shop_id, total_amount) VALUES (?, ?, ?)",
+            [("2025-10-25", None, 10.0), ("2025-10-25", None, 20.0), ("2025-10-25", 1, 5.0), ("2025-10-25", 1, 7.0)],
+        )
+        conn.commit()
+        conn.close()
+
+        await models.init_db(db_path)
+        regs = await models.get_regs_between(db_path, "2025-10-25", "2025-10-25")
+        assert [r["total_regs"] for r in regs] == [2]
+        totals = {t["shop_id"]: t["total_amount"] for t in await models.get_daily_totals(db_path, "2025-10-25")}
+        assert totals == {None: 20.0, 1: 7.0}
+        assert len(await models.get_daily_totals(db_path, "2025-10-25")) == 2
+
+        # and the upserts work against the rebuilt indexes
+        await models.insert_daily_total(db_path, "2025-10-25", None, 30.0)
+        await models.insert_daily_regs(db_path, staff_id, "2025-10-25", 3)
+        totals = {t["shop_id"]: t["total_amount"] for t in await models.get_daily_totals(db_path, "2025-10-25")}
+        assert totals == {None: 30.0, 1: 7.0}
+        regs = await models.get_regs_between(db_path, "2025-10-25", "2025-10-25")
+        assert [r["total_regs"] for r in regs] == [3]
+
+    asyncio.run(_run())
+
+
+def test_regs_borrow_and_totals_reports_use_covering_indexes(memory_db):
+    db_path = memory_db
+    asyncio.run(models.init_db(db_path))
+    conn = models.get_connection(db_path)
+    try:
+        plans = [
+            " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+            for sql, params in (
+                ("SELECT staff_id, SUM(reg_count) FROM daily_regs WHERE date BETWEEN ? AND ? GROUP BY staff_id", ("a", "b")),
+                ("SELECT person_name, SUM(amount) FROM borrow_list WHERE admin_id = ? AND date BETWEEN ? AND ? GROUP BY person_name", ("1", "a", "b")),
+                (f"SELECT {models._DAILY_TOTALS_COLS} FROM daily_totals WHERE date = ?", ("a",)),
+            )
+        ]
+    finally:
+        conn.close()
+    assert "COVERING INDEX idx_daily_regs_date_staff" in plans[0]
+    assert "COVERING INDEX idx_borrow_admin_date_person" in plans[1]
+    assert "COVERING INDEX idx_daily_totals_date_shop" in plans[2]
@@ -1,23 +1,32 @@
 import os
 import asyncio
 import pathlib
+import sqlite3
 import pandas as pd
+import pytest
 
 from db import models
 
 
-DB_PATH = "test_db_unit.db"
+# one file per pytest-xdist worker so parallel runs don't share a database
+DB_PATH = f"test_db_unit_{os.environ.get('PYTEST_XDIST_WORKER', 'main')}.db"
+
+
+def _remove_db(path):
+    # the database plus the schema stamp init_db writes next to it
+    models.close_connections(path)
+    for p in (path, path + ".schema_stamp"):
+        if os.path.exists(p):
+            os.remove(p)
 
 
 def setup_module(module):
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    _remove_db(DB_PATH)
     asyncio.run(models.init_db(DB_PATH))
 
 
 def teardown_module(module):
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    _remove_db(DB_PATH)
 
 
 def test_add_and_remove_stock_and_inventory_summary():
@@ -70,6 +79,171 @@ async def _test_sales_flow():
 
 def test_set_admin():
     asyncio.run(models.ensure_staff(DB_PATH, "carol", "Carol"))
+    assert not asyncio.run(models.is_admin_by_username(DB_PATH, "carol"))
     ok = asyncio.run(models.set_admin(DB_PATH, "carol", True))
     assert ok
+    # set_admin must invalidate the cached answer
     assert asyncio.run(models.is_admin_by_username(DB_PATH, "carol"))
+    assert asyncio.run(models.set_admin(DB_PATH, "carol", False))
+    assert not asyncio.run(models.is_admin_by_username(DB_PATH, "carol"))
+
+
+def test_transfer_stock_requires_sufficient_stock():
+    asyncio.run(_test_transfer_flow())
+
+
+async def _test_transfer_flow():
+    await models.ensure_staff(DB_PATH, "dave", "Dave")
+    await models.ensure_staff(DB_PATH, "erin", "Erin")
+    await models.add_stock(DB_PATH, "dave", "swap", 4)
+    assert await models.transfer_stock(DB_PATH, "dave", "erin", "swap", 3)
+    # only 1 left: the conditional debit must refuse and leave both sides untouched
+    assert not await models.transfer_stock(DB_PATH, "dave", "erin", "swap", 2)
+    assert not await models.transfer_stock(DB_PATH, "dave", "nobody", "swap", 1)
+    assert not await models.transfer_stock(DB_PATH, "dave", "erin", "swap", -1)
+    dave = await models.view_stock_by_staff(DB_PATH, "dave")
+    erin = await models.view_stock_by_staff(DB_PATH, "erin")
+    assert dave["swap"] == 1
+    assert erin["swap"] == 3
+
+
+def test_staff_id_lookup_follows_a_replaced_database():
+    other = f"test_db_unit_replaced_{os.environ.get('PYTEST_XDIST_WORKER', 'main')}.db"
+
+    async def _fresh(usernames):
+        _remove_db(other)
+        await models.init_db(other)
+        return [await models.ensure_staff(other, u) for u in usernames]
+
+    try:
+        assert asyncio.run(_fresh(["x", "y"])) == [1, 2]
+        # same usernames, new file: ids must come from the new database
+        assert asyncio.run(_fresh(["y", "x"])) == [1, 2]
+        assert asyncio.run(models.add_stock(other, "y", "sim", 3))
+        assert asyncio.run(models.view_stock_by_staff(other, "y"))["sim"] == 3
+    finally:
+        _remove_db(other)
+
+
+def test_schema_stamp_only_written_after_clean_verification(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "stamp.db")
+    stamp = tmp_path / "stamp.db.schema_stamp"
+    required = models.get_required_tables_and_columns()
+    monkeypatch.setattr(models, "get_required_tables_and_columns", lambda: {**required, "staff": [*required["staff"], "no_such_col"]})
+    try:
+        asyncio.run(models.init_db(db_path))
+        # a missing column must be reported again on the next start
+        assert not stamp.exists()
+        monkeypatch.undo()
+        asyncio.run(models.init_db(db_path))
+        assert stamp.exists()
+    finally:
+        models.close_connections(db_path)
+
+
+def test_concurrent_writes_are_all_applied():
+    async def _run():
+        await models.ensure_staff(DB_PATH, "frank", "Frank")
+        results = await asyncio.gather(*(models.add_stock(DB_PATH, "frank", "sim", 1) for _ in range(20)))
+        assert all(results)
+        return await models.view_stock_by_staff(DB_PATH, "frank")
+
+    assert asyncio.run(_run())["sim"] == 20
+
+
+def test_prepare_staff_creates_and_tops_up_stock():
+    async def _run():
+        sid = await models.prepare_staff(DB_PATH, "hank", "Hank", {"sim": 3, "credit_50": 2})
+        # existing staff: same id, stock is added on top
+        assert await models.prepare_staff(DB_PATH, "hank", stock={"SIM": 1}) == sid
+        with pytest.raises(ValueError):
+            await models.prepare_staff(DB_PATH, "hank", stock={"bogus": 1})
+        return await models.view_stock_by_staff(DB_PATH, "hank")
+
+    info = asyncio.run(_run())
+    assert (info["sim"], info["credit_50"], info["swap"]) == (4, 2, 0)
+
+
+def test_daily_recharge_report_writes_the_days_sales(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_path = str(tmp_path / "report.db")
+
+    async def _run():
+        await models.init_db(db_path)
+        sid = await models.ensure_staff(db_path, "gina", "Gina")
+        await models.add_stock(db_path, "gina", "sim", 2)
+        await models.insert_sales_and_update_inventory(
+            db_path, sid, "2025-11-01", [{"item_code": "sim", "number": 1, "recharge_amount": 50}]
+        )
+        paths = await asyncio.gather(*(models.daily_recharge_report(db_path, "2025-11-01") for _ in range(3)))
+        summary = await models.daily_recharge_report(db_path, "2025-11-01", aggregate=True)
+        df = pd.read_excel(summary)
+        assert df.to_dict("records") == [{"username": "gina", "name": "Gina", "item_code": "sim", "qty": 1, "total": 50}]
+        # no sales that day
+        with pytest.raises(ValueError):
+            await models.daily_recharge_report(db_path, "2025-11-02")
+        return paths
+
+    try:
+        paths = asyncio.run(_run())
+    finally:
+        models.close_connections(db_path)
+    assert len(set(paths)) == 1
+    df = pd.read_excel(paths[0])
+    assert list(df.columns) == ["username", "name", "item_code", "number", "recharge_amount", "notes"]
+    assert df["username"].tolist() == ["gina"]
+    assert sorted(p.name for p in (tmp_path / "reports").iterdir()) == [
+        "recharge_report_2025-11-01.xlsx", "recharge_summary_2025-11-01.xlsx",
+    ]
+
+
+def test_readonly_connections_reject_writes():
+    # own row, so the test doesn't depend on which tests ran first on this worker
+    asyncio.run(models.ensure_staff(DB_PATH, "ro_probe"))
+    conn = models.get_connection(DB_PATH, readonly=True)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM staff").fetchone()[0] >= 1
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM staff")
+    finally:
+        conn.close()
+
+
+def test_pooled_connections_share_foreign_key_setting(tmp_path):
+    db_path = str(tmp_path / "fk.db")
+    asyncio.run(models.init_db(db_path))
+    conns = [models.get_connection(db_path) for _ in range(2)]
+    try:
+        # init_db's connection goes back to the pool; it must not keep FKs on
+        assert [c.execute("PRAGMA foreign_keys").fetchone()[0] for c in conns] == [0, 0]
+    finally:
+        for c in conns:
+            c.close()
+        models.close_connections(db_path)
+
+
+def test_failed_upload_setup_releases_the_write_lock(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "upload.db")
+
+    async def _run():
+        await models.init_db(db_path)
+        sid = await models.prepare_staff(db_path, "ivy", "Ivy", {"sim": 1})
+        # fails right after BEGIN IMMEDIATE, before the revert/insert try blocks
+        monkeypatch.setattr(models, "_SQL_INVENTORY_BY_STAFF", "SELECT no_such_col FROM inventory")
+        with pytest.raises(sqlite3.OperationalError):
+            await models.insert_sales_and_update_inventory(db_path, sid, "2025-11-01", [])
+        monkeypatch.undo()
+        # the transaction was rolled back, so another write gets the lock straight away
+        conn = models.get_connection(db_path)
+        try:
+            assert not conn.in_transaction
+            conn.execute("BEGIN IMMEDIATE")
+            conn.rollback()
+        finally:
+            conn.close()
+        return await models.add_stock(db_path, "ivy", "sim", 1)
+
+    try:
+        assert asyncio.run(_run())
+    finally:
+        models.close_connections(db_path)
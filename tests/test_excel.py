@@ -1,22 +1,39 @@
-import io
+import pytest
 import pandas as pd
 from utils.excel_utils import parse_sales_excel
 
 
-def make_excel_bytes(df: pd.DataFrame) -> bytes:
-    bio = io.BytesIO()
-    df.to_excel(bio, index=False)
-    bio.seek(0)
-    return bio.read()
-
-
-def test_parse_sales_excel_happy_path():
+def test_parse_sales_excel_happy_path(xlsx_bytes):
     # Number column now contains GSM strings (9 digits). Quantity is inferred from rows.
     df = pd.DataFrame({"Number": ["750000001", "750000002"], "Recharge": [100.0, 50.0], "item_code": ["SIM", "SWAP"], "Notes": ["a","b"]})
-    b = make_excel_bytes(df)
+    b = xlsx_bytes(df)
     entries, errors, daily_regs = parse_sales_excel(b, "2025-10-12", "Tester")
     assert not errors
     assert len(entries) == 2
     assert entries[0]["number"] == "750000001"
     assert entries[1]["recharge_amount"] == 50.0
 
+
+
+def test_parse_sales_excel_same_with_either_engine(xlsx_bytes, monkeypatch):
+    # calamine is optional; with or without it the parsed entries must match
+    pytest.importorskip("python_calamine")
+    from utils import excel_utils
+
+    df = pd.DataFrame({
+        "Number": [750000001, "750-000-002", None, 3],
+        "Recharge": [100, "50", None, 25.5],
+        "item_code": ["SIM", "swap", "SIM", "card"],
+        "credit50": [None, 2, None, "1"],
+        "Notes": ["reg: 4", None, "x", 7],
+    })
+    b = xlsx_bytes(df)
+    results = []
+    for engine in ("calamine", None):
+        monkeypatch.setattr(excel_utils, "EXCEL_ENGINE", engine)
+        results.append(parse_sales_excel(b, "2025-10-12", "Tester"))
+    assert results[0] == results[1]
+    entries, errors, daily_regs = results[0]
+    assert daily_regs == 4
+    assert errors == ["Row 4 skipped: Missing or invalid GSM number"]
+    assert [e["number"] for e in entries] == ["750000001", "750000002", 3]
@@ -1,31 +1,39 @@
-import os
-import asyncio
 import pytest
 from db import models
 
-DB_PATH = "test_last_upload_wins.db"
 
+# 9-digit GSMs reused across uploads; each upload sells a prefix of one of these
+_GSMS = tuple(f"{750000000 + i:09d}" for i in range(5))
+_STRESS_GSMS = tuple(f"{760000000 + i:09d}" for i in range(5))
 
-async def setup_db():
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
-    await models.init_db(DB_PATH)
 
+def _sim_journal(conn, staff_id):
+    """(change_amount, change_type) of every SIM journal row for the staff, oldest first."""
+    rows = conn.execute(
+        "SELECT change_amount, change_type FROM inventory_journal WHERE staff_id = ? AND item = 'sim' ORDER BY id",
+        (staff_id,),
+    ).fetchall()
+    return [tuple(r) for r in rows]
 
-@pytest.fixture(scope="module")
-def event_loop():
-    loop = asyncio.new_event_loop()
-    yield loop
-    loop.close()
+
+def _expected_sim_journal(counts):
+    """Journal a sequence of same-day SIM uploads should leave: each upload first
+    reverts the previous one's sales, then books one -1 per SIM it sold."""
+    expected = []
+    prev = 0
+    for cnt in counts:
+        if prev:
+            expected.append((prev, "revert"))
+        expected.extend([(-1, "sale")] * cnt)
+        prev = cnt
+    return expected
 
 
 @pytest.mark.asyncio
-async def test_repeated_simple_sim_uploads():
-    await setup_db()
+async def test_repeated_simple_sim_uploads(db_path, db_conn):
     # create staff and seed inventory
-    sid = await models.ensure_staff(DB_PATH, "u1", "User One")
-    # seed 10 SIMs
-    await models.add_stock(DB_PATH, "u1", "sim", 10)
+    # create staff seeded with 10 SIMs
+    sid = await models.prepare_staff(db_path, "u1", "User One", {"sim": 10})
 
     # sequence of uploads: 2, 3, 1, 4 sims
     seq = [2, 3, 1, 4]
@@ -33,33 +41,26 @@ async def test_repeated_simple_sim_uploads():
     initial = 10
     for expected_count in seq:
         # build entries for this upload
-        entries = []
-        for i in range(expected_count):
-            gsm = str(750000000 + i)
-            entries.append({
-                "item_code": "SIM",
-                "number": gsm,
-                "recharge_amount": 100.0,
-                "notes": "",
-                "gsm_number": gsm,
-            })
-        res = await models.insert_sales_and_update_inventory(DB_PATH, sid, date, entries)
+        entries = [
+            {"item_code": "SIM", "number": gsm, "recharge_amount": 100.0, "notes": "", "gsm_number": gsm}
+            for gsm in _GSMS[:expected_count]
+        ]
+        res = await models.insert_sales_and_update_inventory(db_path, sid, date, entries)
         # verify insertion summary roughly matches
         assert isinstance(res, dict)
-        # verify inventory final equals initial - expected_count
-        info = await models.view_stock_by_staff(DB_PATH, "u1")
-        assert info["sim"] == initial - expected_count
+
+    # every upload reverted the previous one before booking its own sales
+    assert _sim_journal(db_conn, sid) == _expected_sim_journal(seq)
+    info = await models.view_stock_by_staff(db_path, "u1")
+    assert info["sim"] == initial - seq[-1]
 
     # finally, ensure the DB has only the last upload's sales for that date
-    rows = await models.get_sales_by_staff_date(DB_PATH, "u1", date)
-    assert len(rows) == seq[-1]
+    assert await models.count_sales_by_staff_date(db_path, "u1", date) == seq[-1]
 
 
 @pytest.mark.asyncio
-async def test_duplicate_gsm_and_multiple_uploads_do_not_double_count():
-    await setup_db()
-    sid = await models.ensure_staff(DB_PATH, "u2", "User Two")
-    await models.add_stock(DB_PATH, "u2", "sim", 5)
+async def test_duplicate_gsm_and_multiple_uploads_do_not_double_count(db_path, db_conn):
+    sid = await models.prepare_staff(db_path, "u2", "User Two", {"sim": 5})
     date = "2025-10-31"
 
     # First upload: 2 GSMs
@@ -67,9 +68,7 @@ async def test_duplicate_gsm_and_multiple_uploads_do_not_double_count():
         {"item_code": "SIM", "number": "750100001", "gsm_number": "750100001"},
         {"item_code": "SIM", "number": "750100002", "gsm_number": "750100002"},
     ]
-    await models.insert_sales_and_update_inventory(DB_PATH, sid, date, entries1)
-    info1 = await models.view_stock_by_staff(DB_PATH, "u2")
-    assert info1["sim"] == 3
+    await models.insert_sales_and_update_inventory(db_path, sid, date, entries1)
 
     # Second upload: same two GSMs + one new GSM
     entries2 = [
@@ -77,42 +76,108 @@ async def test_duplicate_gsm_and_multiple_uploads_do_not_double_count():
         {"item_code": "SIM", "number": "750100002", "gsm_number": "750100002"},
         {"item_code": "SIM", "number": "750100003", "gsm_number": "750100003"},
     ]
-    await models.insert_sales_and_update_inventory(DB_PATH, sid, date, entries2)
-    info2 = await models.view_stock_by_staff(DB_PATH, "u2")
-    # should be initial 5 - 3 = 2
-    assert info2["sim"] == 2
+    await models.insert_sales_and_update_inventory(db_path, sid, date, entries2)
 
     # Third upload: empty upload (no entries) should result in no sales and inventory = initial
     # Simulate empty upload by passing empty entries list -> function should skip if entries empty
-    await models.insert_sales_and_update_inventory(DB_PATH, sid, date, [])
-    info3 = await models.view_stock_by_staff(DB_PATH, "u2")
+    await models.insert_sales_and_update_inventory(db_path, sid, date, [])
+    # 5 -> 3 -> 2 (the repeated GSMs are reverted, not double counted) -> back to 5
+    assert _sim_journal(db_conn, sid) == _expected_sim_journal([2, 3, 0])
     # Since we passed empty entries, last-upload-wins semantics mean previous sales are deleted
     # and inventory should be restored to initial (5)
-    assert info3["sim"] == 5
+    info = await models.view_stock_by_staff(db_path, "u2")
+    assert info["sim"] == 5
+
+
+@pytest.mark.asyncio
+async def test_duplicate_gsm_within_one_upload_counts_once(db_path):
+    sid = await models.prepare_staff(db_path, "u4", "User Four", {"sim": 5})
+    date = "2025-11-01"
+
+    entries = [
+        {"item_code": "SIM", "number": "750200001", "gsm_number": "750200001"},
+        {"item_code": "SIM", "number": "750200001", "gsm_number": "750200001"},
+        {"item_code": "SIM", "number": "750200002", "gsm_number": "750200002"},
+    ]
+    res = await models.insert_sales_and_update_inventory(db_path, sid, date, entries)
+    assert res["inserted"] == 2
+    assert res["skipped"] == ["dup_number:750200001"]
+    info = await models.view_stock_by_staff(db_path, "u4")
+    assert info["sim"] == 3
 
 
 @pytest.mark.asyncio
-async def test_many_reuploads_stress():
-    await setup_db()
-    sid = await models.ensure_staff(DB_PATH, "u3", "User Three")
-    await models.add_stock(DB_PATH, "u3", "sim", 20)
+async def test_gsm_sold_by_another_staff_is_skipped(db_path):
+    sid_a = await models.prepare_staff(db_path, "u5", "User Five", {"sim": 5})
+    sid_b = await models.prepare_staff(db_path, "u6", "User Six", {"sim": 5})
+    date = "2025-11-02"
+
+    await models.insert_sales_and_update_inventory(
+        db_path, sid_a, date, [{"item_code": "SIM", "number": "750300001"}]
+    )
+    res = await models.insert_sales_and_update_inventory(
+        db_path, sid_b, date,
+        [{"item_code": "SIM", "number": "750300001"}, {"item_code": "SIM", "number": "750300002"}],
+    )
+    assert res["inserted"] == 1
+    assert res["skipped"] == ["dup_number:750300001"]
+
+
+@pytest.mark.asyncio
+async def test_duplicate_lookup_spans_parameter_chunks(db_path):
+    sid_a = await models.prepare_staff(db_path, "u8", "User Eight", {"sim": 10})
+    sid_b = await models.prepare_staff(db_path, "u9", "User Nine", {"sim": 2000})
+    date = "2025-11-04"
+
+    # sold earlier by someone else; one early and one late in the next upload
+    sold = ["750500000", "750501499"]
+    await models.insert_sales_and_update_inventory(
+        db_path, sid_a, date, [{"item_code": "SIM", "number": g} for g in sold]
+    )
+    entries = [{"item_code": "SIM", "number": str(750500000 + i)} for i in range(1500)]
+    res = await models.insert_sales_and_update_inventory(db_path, sid_b, date, entries)
+    assert res["inserted"] == 1498
+    assert sorted(res["skipped"]) == [f"dup_number:{g}" for g in sold]
+
+
+@pytest.mark.asyncio
+async def test_sale_journal_rows_reference_their_sales(db_path, db_conn):
+    sid = await models.prepare_staff(db_path, "u7", "User Seven", {"sim": 5, "credit_50": 5})
+    date = "2025-11-03"
+    entries = [
+        {"item_code": "SIM", "number": "750400001", "credit_50": 2},
+        {"item_code": "SIM", "number": "750400002"},
+    ]
+    # upload twice so the second run reserves ids after a deleted batch
+    await models.insert_sales_and_update_inventory(db_path, sid, date, entries)
+    await models.insert_sales_and_update_inventory(db_path, sid, date, entries)
+
+    cur = db_conn.execute(
+        "SELECT j.item, j.change_amount, s.item_code, s.number FROM inventory_journal j "
+        "LEFT JOIN sales s ON s.id = j.source_ref WHERE j.staff_id = ? AND j.change_type = 'sale' "
+        "AND j.source_ref IN (SELECT id FROM sales WHERE staff_id = ? AND report_date = ?)",
+        (sid, sid, date),
+    )
+    rows = sorted(tuple(r) for r in cur.fetchall())
+    assert rows == [
+        ("credit_50", -2, "credit_50", 2),
+        ("sim", -1, "sim", 750400001),
+        ("sim", -1, "sim", 750400002),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_many_reuploads_stress(db_path, db_conn):
+    sid = await models.prepare_staff(db_path, "u3", "User Three", {"sim": 20})
     date = "2025-10-31"
 
-    import random
-    random.seed(0)
-
-    last_count = 0
-    for _ in range(10):
-        cnt = random.randint(0, 5)
-        last_count = cnt
-        entries = []
-        for i in range(cnt):
-            gsm = str(760000000 + i)
-            entries.append({"item_code": "SIM", "number": gsm, "gsm_number": gsm})
-        await models.insert_sales_and_update_inventory(DB_PATH, sid, date, entries)
-        info = await models.view_stock_by_staff(DB_PATH, "u3")
-        assert info["sim"] == 20 - cnt
-
-    # final check: matches last_count
-    info_final = await models.view_stock_by_staff(DB_PATH, "u3")
-    assert info_final["sim"] == 20 - last_count
+    # upload sizes as drawn by random.Random(0).randint(0, 5), fixed here
+    counts = [3, 3, 0, 2, 4, 3, 3, 2, 3, 2]
+    batches = [[{"item_code": "SIM", "number": gsm, "gsm_number": gsm} for gsm in _STRESS_GSMS[:cnt]] for cnt in counts]
+
+    for entries in batches:
+        await models.insert_sales_and_update_inventory(db_path, sid, date, entries)
+
+    assert _sim_journal(db_conn, sid) == _expected_sim_journal(counts)
+    info = await models.view_stock_by_staff(db_path, "u3")
+    assert info["sim"] == 20 - counts[-1]
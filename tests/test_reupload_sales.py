@@ -5,18 +5,12 @@ import pytest
 from db import models
 
 
-def test_reupload_sales_inventory_idempotent(tmp_path):
+def test_reupload_sales_inventory_idempotent(db_path):
     async def _run():
-        db_file = tmp_path / "test.db"
-        db_path = str(db_file)
-        await models.init_db(db_path)
-
-        # create staff and set initial inventory
+        # create staff with known initial inventory
         username = "reupload_user"
         name = "Reupload User"
-        staff_id = await models.ensure_staff(db_path, username, name)
-        # set inventory to known values
-        await models.update_inventory(db_path, username, {'sim': 10, 'swap': 5, 'credit_50': 20, 'credit_100': 10})
+        staff_id = await models.prepare_staff(db_path, username, name, {'sim': 10, 'swap': 5, 'credit_50': 20, 'credit_100': 10})
 
         report_date = "2025-10-26"
         # entries: one sim (gsm), one credit_50 of 2, one recharge amount
@@ -37,10 +31,8 @@ def test_reupload_sales_inventory_idempotent(tmp_path):
         inv_after_second = await models.get_inventory(db_path, staff_id)
 
         # Inventory after second upload should equal inventory after first upload (idempotent)
-        assert inv_after_first['sim'] == inv_after_second['sim']
-        assert inv_after_first['credit_50'] == inv_after_second['credit_50']
-        assert inv_after_first['credit_100'] == inv_after_second['credit_100']
-        assert inv_after_first['swap'] == inv_after_second['swap']
+        keys = ('sim', 'credit_50', 'credit_100', 'swap')
+        assert {k: inv_after_first[k] for k in keys} == {k: inv_after_second[k] for k in keys}
 
         # Also ensure sales table only contains the expected rows for the date
         rows = await models.get_sales_by_staff_date(db_path, username, report_date)
@@ -1,14 +1,110 @@
 """Utilities to parse uploaded Excel files into normalized entries."""
 from __future__ import annotations
 
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
+import importlib.util
+import itertools
 import re
+import openpyxl
 import pandas as pd
 import io
 import logging
 
 logger = logging.getLogger(__name__)
 
+# python-calamine (optional) parses xlsx far faster than openpyxl; pandas falls back
+# to its default engine when it isn't installed.
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else None
+
+
+# Compiled once; the GSM cleanup falls back to the regex for non-ASCII cells.
+_NON_DIGIT_RE = re.compile(r"\D")
+_ASCII_NON_DIGITS = str.maketrans("", "", "".join(chr(c) for c in range(128) if not chr(c).isdigit()))
+_REG_PATTERNS = tuple(re.compile(p) for p in (
+    r"reg\s*:?\s*(\d+)",  # reg: 10, reg:10, reg 10
+    r"daily\s*:?\s*(\d+)",  # daily: 10, daily:10
+    r"registration\s*:?\s*(\d+)",  # registration: 10
+    r"(\d+)\s*reg",  # 10 reg
+))
+_FIRST_NUMBER_RE = re.compile(r"(\d+)")
+
+# item_code spellings (lowercased) of rows that must carry a valid GSM
+_SIM_CODES = frozenset(("sim", "simcard", "sim_card"))
+_SWAP_CODES = frozenset(("swap",))
+_GSM_ITEM_CODES = _SIM_CODES | _SWAP_CODES
+
+# Skipped-row reasons; the payload (if any) is formatted into the message.
+_SKIP_REASONS = {
+    "missing_gsm": "Missing or invalid GSM number",
+    "bad_gsm_len": "GSM value '{}' must be exactly 9 digits",
+}
+
+
+# Header aliases of the columns each parser reads, in lookup order. Kept lowercase:
+# headers are matched after strip().lower().
+_PICKUP_ALIASES = {
+    "carton": ("carton #", "carton", "carton_no", "carton no"),
+    "box": ("box #", "box", "box_no", "box no"),
+    "gsm": ("gsm number", "gsm_number", "gsm", "number"),
+    "iccid": ("iccid", "iccid number", "iccid_no"),
+    "type": ("type", "sim type", "sim_type"),
+}
+_SALES_ALIASES = {
+    # The Excel 'Number' column is used for GSM numbers (MSISDN) in our workflow.
+    # We do not treat it as a quantity field. Quantity is implied by rows/item_code.
+    "number": ("number", "qty", "quantity"),
+    "recharge": ("recharge", "amount", "recharge_amount"),
+    "item": ("item_code", "item code", "item", "code"),
+    "gsm": ("gsm number", "gsm_number", "gsm", "msisdn", "phone"),
+    "credit50": ("credit50", "credit_50", "credit-50"),
+    "credit100": ("credit100", "credit_100", "credit-100"),
+    "notes": ("notes", "remark", "remarks"),
+    # optional contact number column aliases
+    "contact": ("contact_number", "contact number", "contact", "phone number", "phone"),
+}
+
+
+def _header_set(aliases: Dict[str, Tuple[str, ...]]) -> frozenset:
+    return frozenset(n for names in aliases.values() for n in names)
+
+
+_PICKUP_HEADERS = _header_set(_PICKUP_ALIASES)
+_SALES_HEADERS = _header_set(_SALES_ALIASES)
+
+
+def _resolve_columns(df: pd.DataFrame, aliases: Dict[str, Tuple[str, ...]]) -> Dict[str, Optional[str]]:
+    """Map each alias key to the first matching DataFrame column (None if absent)."""
+    cols = {str(c).strip().lower(): c for c in df.columns}
+    found = {}
+    for key, names in aliases.items():
+        found[key] = next((cols[n] for n in names if n in cols), None)
+    return found
+
+
+def _read_excel(file_bytes: bytes, headers: Optional[frozenset] = None, nrows: Optional[int] = None) -> pd.DataFrame:
+    """First sheet as a DataFrame; with ``headers``, only the columns whose
+    stripped, lower-cased header is in it (the rest are never type-inferred)."""
+    usecols = (lambda c: str(c).strip().lower() in headers) if headers else None
+    return pd.read_excel(io.BytesIO(file_bytes), engine=EXCEL_ENGINE, usecols=usecols, nrows=nrows)
+
+
+def _header_and_first_row(file_bytes: bytes) -> Tuple[tuple, tuple]:
+    """Header and first data row of the first sheet, without loading the rest."""
+    try:
+        wb = openpyxl.load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+    except Exception:
+        # not an OOXML workbook (e.g. legacy .xls); let pandas pick the engine
+        df = _read_excel(file_bytes, nrows=1)
+        first = tuple(df.iloc[0]) if len(df) else ()
+        return tuple(df.columns), first
+    try:
+        # the first sheet, like read_excel's default (wb.active is whichever tab was last selected)
+        rows = wb.worksheets[0].iter_rows(max_row=2, values_only=True)
+        header = next(rows, ())
+        return header, next(rows, ())
+    finally:
+        wb.close()
+
 
 class DailyRegs:
     """Small wrapper that is iterable (count, has_notes_col) and compares equal to an int.
@@ -49,39 +145,41 @@ def extract_daily_regs(file_bytes: bytes, notes_aliases: List[str] = None) -> Tu
     - has_notes_col: True if the file has a Notes column, False otherwise
     """
     try:
-        df = pd.read_excel(io.BytesIO(file_bytes))
+        header, first_row = _header_and_first_row(file_bytes)
     except Exception:
         return DailyRegs(0, False)
+    return _daily_regs_from(header, first_row, notes_aliases)
 
-    cols = {c.strip().lower(): c for c in df.columns}
-    notes_candidates = notes_aliases or ["notes", "remark", "remarks"]
-    notes_col = None
+
+def _daily_regs_from(header, first_row, notes_aliases: List[str] = None) -> DailyRegs:
+    """extract_daily_regs on an already-read header and first data row."""
+    cols = {str(c).strip().lower(): i for i, c in enumerate(header) if c is not None}
+    notes_candidates = [n.lower() for n in notes_aliases] if notes_aliases else _SALES_ALIASES["notes"]
+    notes_idx = None
     for n in notes_candidates:
-        if n.lower() in cols:
-            notes_col = cols[n.lower()]
+        if n in cols:
+            notes_idx = cols[n]
             break
     
     # If no notes column found, return early with has_notes_col=False
-    if not notes_col:
+    if notes_idx is None:
         return DailyRegs(0, False)
         
     try:
-        first_note = df[notes_col].iloc[0]
-        if pd.isna(first_note):
+        first_note = first_row[notes_idx] if notes_idx < len(first_row) else None
+        if first_note is None or (isinstance(first_note, float) and pd.isna(first_note)) or str(first_note).strip() == "":
             # Has notes column but first cell is empty
-            return 0, True
+            return DailyRegs(0, True)
             
         first_note = str(first_note).strip()
+        # a bare count ("10") is the usual Notes cell and none of the patterns
+        # can match it; isdecimal() is the same digit class as \d
+        if first_note.isdecimal():
+            return DailyRegs(int(first_note), True)
         # Look for registration indicators followed by numbers
-        reg_patterns = [
-            r"reg\s*:?\s*(\d+)",  # reg: 10, reg:10, reg 10
-            r"daily\s*:?\s*(\d+)",  # daily: 10, daily:10
-            r"registration\s*:?\s*(\d+)",  # registration: 10
-            r"(\d+)\s*reg",  # 10 reg
-        ]
-        
-        for pattern in reg_patterns:
-            m = re.search(pattern, first_note.lower())
+        lowered = first_note.lower()
+        for pattern in _REG_PATTERNS:
+            m = pattern.search(lowered)
             if m:
                     try:
                         return DailyRegs(int(m.group(1)), True)
@@ -89,7 +187,7 @@ def extract_daily_regs(file_bytes: bytes, notes_aliases: List[str] = None) -> Tu
                         continue
                     
         # If no reg pattern found but we have notes, look for any number
-        m = re.search(r"(\d+)", first_note)
+        m = _FIRST_NUMBER_RE.search(first_note)
         if m:
             try:
                 return DailyRegs(int(m.group(1)), True)
@@ -103,74 +201,116 @@ def extract_daily_regs(file_bytes: bytes, notes_aliases: List[str] = None) -> Tu
     return DailyRegs(0, True)
 
 
+def format_skipped(skipped) -> List[str]:
+    """Render (row_num, reason_code, payload) skip records as user-facing notices."""
+    return [f"Row {row} skipped: " + _SKIP_REASONS[code].format(payload) for row, code, payload in skipped]
+
+
+def _cell_to_str(val):
+    """Normalize a pandas cell to a clean string or None.
+
+    - Returns None for NaN/None.
+    - If value is int or a float that is integer-valued, returns the integer string without .0.
+    - Otherwise returns stripped string of the value.
+    """
+    if val is None:
+        return None
+    # exact type checks first; the isinstance fallback keeps numpy floats
+    t = type(val)
+    if t is int:
+        return str(val)
+    if t is float or isinstance(val, float):
+        if val != val:  # NaN
+            return None
+        return str(int(val)) if val.is_integer() else str(val)
+    s = str(val).strip()
+    if not s:
+        return None
+    if s.endswith('.0') and s[:-2].isdigit():
+        return s[:-2]
+    return s
+
+
+def _raw_column(df: pd.DataFrame, col) -> pd.Series:
+    """_cell_to_str of every cell (None where empty / no such column)."""
+    if not col:
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    return pd.Series([_cell_to_str(v) for v in df[col].tolist()], index=df.index, dtype=object)
+
+
+def _text_column(df: pd.DataFrame, col) -> pd.Series:
+    """str(cell).strip(), "" where empty / no such column."""
+    if not col:
+        return pd.Series([""] * len(df), index=df.index, dtype=object)
+    return df[col].map(str, na_action="ignore").astype(object).str.strip().fillna("")
+
+
+def _gsm_digits(s: Optional[str]) -> Optional[str]:
+    if s is None:
+        return None
+    if s.endswith(".0"):
+        s = s[:-2]
+    # GSM cells are nearly always ASCII: a C-level deletion table beats the regex there
+    digits = s.translate(_ASCII_NON_DIGITS) if s.isascii() else _NON_DIGIT_RE.sub("", s)
+    return digits or None
+
+
+def _clean_gsm(raw: pd.Series, fallback: pd.Series) -> pd.Series:
+    """Digits-only GSM candidates (trailing .0 dropped), taken from fallback where raw has no digits."""
+    # `or` only cleans the fallback cell when it is actually needed
+    return pd.Series(
+        [_gsm_digits(s) or _gsm_digits(f) for s, f in zip(raw.tolist(), fallback.tolist())],
+        index=raw.index, dtype=object,
+    )
+
+
+# int()/float() run per cell (via Series.map) because they accept non-ASCII digits
+# that pd.to_numeric rejects.
+def _as_count(s) -> int:
+    try:
+        return int(s) if s and s.isdigit() else 0
+    except ValueError:
+        return 0
+
+
+def _as_amount(s) -> float:
+    try:
+        return float(s) if s is not None else 0.0
+    except ValueError:
+        return 0.0
+
+
 def parse_pickup_excel(file_bytes: bytes) -> List[Dict[str, str]]:
     """Parse pickup-list Excel and return list of rows with keys: carton_no, box_no, gsm_number, iccid, type."""
     rows: List[Dict[str, str]] = []
     try:
-        df = pd.read_excel(io.BytesIO(file_bytes))
+        df = _read_excel(file_bytes, _PICKUP_HEADERS)
     except Exception:
         return rows
 
-    cols = {c.strip().lower(): c for c in df.columns}
-    def _c(names):
-        for n in names:
-            if n.lower() in cols:
-                return cols[n.lower()]
-        return None
+    found = _resolve_columns(df, _PICKUP_ALIASES)
+    carton_col = found["carton"]
+    box_col = found["box"]
+    gsm_col = found["gsm"]
+    iccid_col = found["iccid"]
+    type_col = found["type"]
 
-    carton_col = _c(["carton #", "carton", "carton_no", "carton no"])
-    box_col = _c(["box #", "box", "box_no", "box no"])
-    gsm_col = _c(["gsm number", "gsm_number", "gsm", "number"])
-    iccid_col = _c(["iccid", "iccid number", "iccid_no"])
-    type_col = _c(["type", "sim type", "sim_type"])
-
-    def _cell_to_str(val):
-        """Normalize a pandas cell to a clean string or None.
-
-        - Returns None for NaN/None.
-        - If value is int or a float that is integer-valued, returns the integer string without .0.
-        - Otherwise returns stripped string of the value.
-        """
-        try:
-            if val is None or (isinstance(val, float) and pd.isna(val)):
-                return None
-        except Exception:
-            pass
-        try:
-            if isinstance(val, int):
-                return str(val)
-            if isinstance(val, float):
-                if val.is_integer():
-                    return str(int(val))
-                return str(val).strip()
-            s = str(val).strip()
-            if s.endswith('.0') and s[:-2].isdigit():
-                return s[:-2]
-            return s if s != '' else None
-        except Exception:
-            try:
-                s = str(val).strip()
-                return s if s != '' else None
-            except Exception:
-                return None
-
-    for _, r in df.iterrows():
-        gsm = None
-        try:
-            gsm = _cell_to_str(r[gsm_col]) if gsm_col else None
-        except Exception:
-            gsm = None
-        if not gsm:
-            continue
-        row = {
-            "carton_no": str(r[carton_col]).strip() if carton_col and not pd.isna(r[carton_col]) else None,
-            "box_no": str(r[box_col]).strip() if box_col and not pd.isna(r[box_col]) else None,
-            "gsm_number": gsm,
-            "iccid": str(r[iccid_col]).strip() if iccid_col and not pd.isna(r[iccid_col]) else None,
-            "type": str(r[type_col]).strip() if type_col and not pd.isna(r[type_col]) else None,
-        }
-        rows.append(row)
-    return rows
+    if not gsm_col:
+        return rows
+
+    def _text(col):
+        if not col:
+            return itertools.repeat(None)
+        return (None if pd.isna(v) else str(v).strip() for v in df[col].tolist())
+
+    # column-wise instead of iterrows: no per-row Series construction
+    return [
+        {"carton_no": carton, "box_no": box, "gsm_number": gsm, "iccid": iccid, "type": sim_type}
+        for gsm, carton, box, iccid, sim_type in zip(
+            map(_cell_to_str, df[gsm_col].tolist()), _text(carton_col), _text(box_col), _text(iccid_col), _text(type_col)
+        )
+        if gsm
+    ]
 
 
 def parse_sales_excel(file_bytes: bytes, report_date: str, employee_name: str) -> Tuple[List[Dict[str, Any]], List[str], int]:
@@ -187,69 +327,40 @@ def parse_sales_excel(file_bytes: bytes, report_date: str, employee_name: str) -
     returns a 3-tuple. Callers that need the "remind" hint should call
     `extract_daily_regs` directly.
     """
-    # extract daily registrations (first Notes cell) if present
-    daily_regs, has_notes_col = extract_daily_regs(file_bytes)
-    # Track invalid rows for feedback (but don't include empty rows)
-    skipped_rows = []
-    # Track if we should remind about registrations
-    should_remind_regs = has_notes_col and daily_regs == 0
-    
+    # Track invalid rows for feedback (but don't include empty rows) as
+    # (row_num, reason_code, payload); rendered by format_skipped at the end
+    skipped_rows: List[Tuple[int, str, Optional[str]]] = []
+
     try:
-        df = pd.read_excel(io.BytesIO(file_bytes))
-        logger.info(f"[parse_sales_excel] DataFrame columns: {list(df.columns)}")
-        logger.info(f"[parse_sales_excel] DataFrame head: {df.head().to_dict()}")
+        df = _read_excel(file_bytes, _SALES_HEADERS)
+        logger.info("[parse_sales_excel] DataFrame columns: %s", list(df.columns))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[parse_sales_excel] DataFrame head: %s", df.head().to_dict())
     except Exception as e:
         logger.error("Failed to read excel: %s", e)
-        return [], [f"Failed to read Excel file: {e}"], daily_regs
-
-    # Local normalizer used by the sales parser (same behavior as pickup normalizer)
-    def _cell_to_str(val):
-        try:
-            if val is None or (isinstance(val, float) and pd.isna(val)):
-                return None
-        except Exception:
-            pass
-        try:
-            if isinstance(val, int):
-                return str(val)
-            if isinstance(val, float):
-                if val.is_integer():
-                    return str(int(val))
-                return str(val).strip()
-            s = str(val).strip()
-            if s.endswith('.0') and s[:-2].isdigit():
-                return s[:-2]
-            return s if s != '' else None
-        except Exception:
-            try:
-                s = str(val).strip()
-                return s if s != '' else None
-            except Exception:
-                return None
+        return [], [f"Failed to read Excel file: {e}"], 0
 
-    # normalize column names
-    cols = {c.strip().lower(): c for c in df.columns}
+    # extract daily registrations (first Notes cell) if present; the workbook is
+    # only read once, so take it from the frame rather than via extract_daily_regs
+    daily_regs, has_notes_col = _daily_regs_from(df.columns, tuple(df.iloc[0]) if len(df) else ())
+    # Track if we should remind about registrations
+    should_remind_regs = has_notes_col and daily_regs == 0
 
-    def _find_column(possible_names):
-        for n in possible_names:
-            if n.lower() in cols:
-                return cols[n.lower()]
-        return None
-
-    # The Excel 'Number' column is used for GSM numbers (MSISDN) in our workflow.
-    # We do not treat it as a quantity field. Quantity is implied by rows/item_code.
-    number_col = _find_column(["Number", "number", "qty", "quantity"])
-    recharge_col = _find_column(["Recharge", "recharge", "amount", "recharge_amount"])
-    item_col = _find_column(["item_code", "item code", "item", "code"])
-    gsm_col = _find_column(["gsm number", "gsm_number", "gsm", "msisdn", "phone"])
-    credit50_col = _find_column(["credit50", "credit_50", "credit-50", "Credit_50", "Credit50"])
-    credit100_col = _find_column(["credit100", "credit_100", "credit-100", "Credit_100", "Credit100"])
-    notes_col = _find_column(["Notes", "notes", "remark", "remarks"])
-    # optional contact number column aliases
-    contact_col = _find_column(["contact_number", "contact number", "contact", "phone number", "phone"])
+    found = _resolve_columns(df, _SALES_ALIASES)
+    number_col = found["number"]
+    recharge_col = found["recharge"]
+    item_col = found["item"]
+    gsm_col = found["gsm"]
+    credit50_col = found["credit50"]
+    credit100_col = found["credit100"]
+    notes_col = found["notes"]
+    contact_col = found["contact"]
 
     errors: List[str] = []
-    logger.info(f"[parse_sales_excel] Detected columns: number_col={number_col}, recharge_col={recharge_col}, item_col={item_col}, gsm_col={gsm_col}, notes_col={notes_col}")
+    logger.info(
+        "[parse_sales_excel] Detected columns: number_col=%s, recharge_col=%s, item_col=%s, gsm_col=%s, notes_col=%s",
+        number_col, recharge_col, item_col, gsm_col, notes_col,
+    )
     # Require number_col because it contains the GSM for each row in our system.
     if number_col is None:
         errors.append("Missing Number column (used for GSM mobile numbers).")
@@ -258,142 +369,68 @@ def parse_sales_excel(file_bytes: bytes, report_date: str, employee_name: str) -
         logger.error(f"[parse_sales_excel] Errors: {errors}")
         return [], errors, daily_regs, should_remind_regs
 
-    entries: List[Dict[str, Any]] = []
-    for idx, row in df.iterrows():
-        row_num = idx + 2  # Excel row number (1-based header)
-
-        # Normalize potential GSM values from GSM column or Number column
-        try:
-            raw_gsm_from_gsmcol = _cell_to_str(row[gsm_col]) if gsm_col else None
-        except Exception:
-            raw_gsm_from_gsmcol = None
-        try:
-            raw_gsm_from_numbercol = _cell_to_str(row[number_col]) if number_col else None
-        except Exception:
-            raw_gsm_from_numbercol = None
-
-        def _clean_gsm(s: Any) -> str | None:
-            """Return a digits-only GSM string or None.
-
-            - Converts numeric floats/ints to strings, strips spaces.
-            - Removes any non-digit characters and trailing .0 artifacts.
-            - Returns the digits-only string, or None if empty.
-            """
-            if s is None:
-                return None
-            try:
-                st = str(s).strip()
-            except Exception:
-                return None
-            # strip trailing .0 if present and looks like float artifact
-            if st.endswith('.0'):
-                st = st[:-2]
-            # remove spaces and non-digit characters
-            digits = re.sub(r"\D", "", st)
-            return digits if digits != "" else None
-
-        gsm_candidate = _clean_gsm(raw_gsm_from_gsmcol) or _clean_gsm(raw_gsm_from_numbercol)
-
-        # capture item code text early
-        item_code_str = str(row[item_col]).strip() if item_col and not pd.isna(row[item_col]) else ""
-
-        # Detect SIM/SWAP rows
-        is_sim_like = item_code_str.lower() in ("sim", "simcard", "sim_card")
-        is_swap_like = item_code_str.lower() in ("swap",)
-
-        # For SIM/SWAP rows: require a valid GSM (digits-only, exactly 9 digits)
-        gsm_number = None
-        if is_sim_like or is_swap_like:
-            if not gsm_candidate:
-                skipped_rows.append(f"Row {row_num} skipped: Missing or invalid GSM number")
-                continue
-            if not (gsm_candidate.isdigit() and len(gsm_candidate) == 9):
-                skipped_rows.append(f"Row {row_num} skipped: GSM value '{gsm_candidate}' must be exactly 9 digits")
-                continue
-            # valid GSM
-            gsm_number = gsm_candidate
-            # store GSM in 'number' as historical contract (DB expects it)
-            number = gsm_candidate
-        else:
-            # Non SIM/SWAP rows: parse Number as numeric quantity if present
-            number = 0
-            try:
-                num_raw = raw_gsm_from_numbercol
-                if num_raw and str(num_raw).strip().isdigit():
-                    number = int(float(str(num_raw).strip()))
-                else:
-                    number = 0
-            except Exception:
-                number = 0
-
-        # parse recharge (clean and parse float)
-        try:
-            rec_str = _cell_to_str(row[recharge_col]) if recharge_col else None
-            if rec_str is not None:
-                # remove spaces and trailing .0 handled by _cell_to_str
-                try:
-                    recharge_amount = float(str(rec_str).strip())
-                except Exception:
-                    recharge_amount = 0.0
-            else:
-                recharge_amount = 0.0
-        except Exception:
-            try:
-                recharge_amount = float(row[recharge_col]) if recharge_col and not pd.isna(row[recharge_col]) else 0.0
-            except Exception:
-                recharge_amount = 0.0
-
-        # parse credit columns if present (only count if row remains valid)
-        try:
-            c50s = _cell_to_str(row[credit50_col]) if credit50_col else None
-            credit_50 = int(c50s) if (c50s and str(c50s).strip().isdigit()) else 0
-        except Exception:
-            credit_50 = 0
-        try:
-            c100s = _cell_to_str(row[credit100_col]) if credit100_col else None
-            credit_100 = int(c100s) if (c100s and str(c100s).strip().isdigit()) else 0
-        except Exception:
-            credit_100 = 0
-
-        item_code = item_code_str
-        notes = str(row[notes_col]).strip() if notes_col and not pd.isna(row[notes_col]) else ""
-        # Validation: For SIM/SWAP, we've already required GSM. For other items, skip rows with
-        # no meaningful data (no item_code, no recharge, no credits, and no numeric number).
-        if not (is_sim_like or is_swap_like):
-            if not ((item_col and item_code_str) or recharge_amount > 0 or credit_50 > 0 or credit_100 > 0 or (isinstance(number, int) and number > 0)):
-                logger.info(f"[parse_sales_excel] Skipping row {idx}: empty/irrelevant row (no item/recharge/credits)")
-                continue
-
-        # NEW: parse contact number if present, keep None if missing/empty
-        try:
-            contact_number = None
-            if contact_col and not pd.isna(row[contact_col]):
-                cn = str(row[contact_col]).strip()
-                contact_number = cn if cn != "" else None
-        except Exception:
-            contact_number = None
-
-        entry = {
+    # Everything below works a column at a time; iterrows would build a Series per row.
+    # GSM candidate: GSM column, falling back to Number; digits only, then the 9-digit check
+    raw_numbers = _raw_column(df, number_col)
+    gsm_candidates = _clean_gsm(_raw_column(df, gsm_col), raw_numbers)
+    # candidates are digits only, so the 9-digit check is just a length check
+    gsm_valid = gsm_candidates.str.len().eq(9)
+    has_gsm = gsm_candidates.notna()
+
+    item_codes = _text_column(df, item_col)
+    # SIM/SWAP rows require a valid GSM (digits-only, exactly 9 digits)
+    sim_mask = item_codes.str.lower().isin(_GSM_ITEM_CODES)
+    missing_gsm = sim_mask & ~has_gsm
+    invalid_gsm = sim_mask & has_gsm & ~gsm_valid
+    rejected = missing_gsm | invalid_gsm
+    # Excel row number = index + 2 (1-based, after the header)
+    skipped_rows.extend(
+        (idx + 2, "missing_gsm", None) if missing else (idx + 2, "bad_gsm_len", gsm)
+        for idx, missing, gsm in zip(df.index[rejected], missing_gsm[rejected], gsm_candidates[rejected])
+    )
+
+    # Non SIM/SWAP rows: Number is a numeric quantity if present
+    numbers = raw_numbers.map(_as_count)
+    recharge_amounts = _raw_column(df, recharge_col).map(_as_amount)
+    credits_50 = _raw_column(df, credit50_col).map(_as_count)
+    credits_100 = _raw_column(df, credit100_col).map(_as_count)
+    # Other items need some meaningful data (item_code, recharge, credits or a numeric number)
+    has_data = (item_codes != "") | (recharge_amounts > 0) | (credits_50 > 0) | (credits_100 > 0) | (numbers > 0)
+    keep = (sim_mask & gsm_valid) | (~sim_mask & has_data)
+    contacts = _text_column(df, contact_col)
+
+    entries: List[Dict[str, Any]] = [
+        {
             "Employee": employee_name,
             "Date": report_date,
             "item_code": item_code,
-            # Keep original 'number' value as the GSM string (DB will treat it as identifier and deduct 1 for SIMs)
-            "number": number,
+            # SIM/SWAP rows keep the GSM string in 'number' as historical contract (DB expects it)
+            "number": gsm if is_sim else number,
             "recharge_amount": recharge_amount,
             "credit_50": credit_50,
             "credit_100": credit_100,
             "notes": notes,
-            "gsm_number": gsm_number if gsm_number else "",  # Use validated GSM number or empty
-            "contact_number": contact_number,
+            "gsm_number": gsm if is_sim else "",
+            "contact_number": contact or None,
         }
-        logger.info(f"[parse_sales_excel] Parsed entry row {idx}: {entry}")
-        entries.append(entry)
-    logger.info(f"[parse_sales_excel] Total parsed entries: {len(entries)}, Skipped rows: {len(skipped_rows)}")
+        for kept, is_sim, item_code, gsm, number, recharge_amount, credit_50, credit_100, notes, contact in zip(
+            keep.tolist(),
+            sim_mask.tolist(),
+            item_codes.tolist(),
+            gsm_candidates.tolist(),
+            numbers.tolist(),
+            recharge_amounts.tolist(),
+            credits_50.tolist(),
+            credits_100.tolist(),
+            _text_column(df, notes_col).tolist(),
+            contacts.tolist(),
+        )
+        if kept
+    ]
+    logger.info("[parse_sales_excel] Total parsed entries: %d, Skipped rows: %d", len(entries), len(skipped_rows))
     
     # If we have skipped rows, add them to errors list
-    errors = []
-    if skipped_rows:
-        errors.extend(skipped_rows)
+    errors = format_skipped(skipped_rows)
 
     # Return a 3-tuple (backwards-compatible). Callers that require the
     # 'should_remind_regs' hint may call `extract_daily_regs` directly.